@@ -9,7 +9,8 @@ from bs4 import BeautifulSoup
 
 def scrape_author_page(author_url):
     """
-    Scrape the author page and create author instance
+    Scrape the author page and create author instance, keeping the ids of
+    related authors found in their urls
     Return the author and related authors' urls
     """
     soup = get_soup(author_url)
@@ -20,11 +21,14 @@ def scrape_author_page(author_url):
     rating, rating_count, review_count = find_author_meta(soup)
     image_url = find_image_url(soup)
     related_authors, related_authors_urls = find_related_authors_and_urls(soup)
+    related_author_ids = [find_author_id(url) for url in related_authors_urls]
     author_books = find_author_books(soup)
     j_dic = {'name': name, 'author_url': author_url, 'author_id': author_id,
              'rating': rating, 'rating_count': rating_count,
              'review_count': review_count, 'image_url': image_url,
-             'related_authors': related_authors, 'author_books': author_books}
+             'related_authors': related_authors,
+             'related_author_ids': [related_id for related_id in related_author_ids if related_id],
+             'author_books': author_books}
     return j_dic, related_authors_urls
 
 
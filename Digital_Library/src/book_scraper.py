@@ -6,10 +6,13 @@ import logging
 
 from bs4 import BeautifulSoup
 
+from src.author_scraper import find_author_id
+
 
 def scrape_book_page(book_url):
     """
-    Scrape the book page and create book instance
+    Scrape the book page and create book instance, keeping the ids of its author and
+    similar books found in their urls
     Return the book and similar books' urls
     """
     soup = get_soup(book_url)
@@ -22,11 +25,14 @@ def scrape_book_page(book_url):
     rating, rating_count, review_count = find_book_meta(soup)
     image_url = find_image_url(soup)
     similar_books_names, similar_books_urls = find_similar_books_and_urls(soup)
+    similar_book_ids = [find_book_id(url) for url in similar_books_urls]
     j_dic = {'book_url': book_url, 'title': title, 'book_id': book_id,
              'ISBN': isbn, 'author_url': author_url, 'author': author,
+             'author_id': find_author_id(author_url),
              'rating': rating, 'rating_count': rating_count,
              'review_count': review_count, 'image_url': image_url,
-             'similar_books': similar_books_names}
+             'similar_books': similar_books_names,
+             'similar_book_ids': [similar_id for similar_id in similar_book_ids if similar_id]}
     return j_dic, similar_books_urls
 
 
@@ -2,31 +2,196 @@
 This module is used to connect database and update or insert
 books/authors into the database.
 """
+import atexit
+import itertools
 import json
 import os
 import logging
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-from bson.json_util import dumps
+import bson
+from bson.json_util import default
 import pymongo
+from pymongo import ASCENDING, DESCENDING, TEXT
+from pymongo.errors import BulkWriteError, PyMongoError
 from dotenv import load_dotenv
 
-BOOK_ATTRIBUTES = {'book_url', 'title', 'book_id', 'ISBN', 'author_url', 'author', 'rating',
-                   'rating_count', 'review_count', 'image_url', 'similar_books'}
-AUTHOR_ATTRIBUTES = {'name', 'author_url', 'author_id', 'rating', 'rating_count',
-                     'review_count', 'image_url', 'related_authors', 'author_books'}
+from src.memory_backend import MemoryDatabase, UpdateOne, ReplaceOne
+from src.schema import NUMERIC_FIELDS, BOOK_SCHEMA, AUTHOR_SCHEMA, to_number
+from src.author_scraper import find_author_id
+from src.json_stream import iter_library_records, iter_ndjson_records, iter_bson_records, \
+    is_ndjson_file, is_bson_file, open_library_file, NDJSON_TYPE_KEY, DECOMPRESSION_ERRORS
 
+DATABASE_NAME = 'Digital_Library'
+MONGO_BACKEND = 'mongo'
+MEMORY_BACKEND = 'memory'
+SQLITE_BACKEND = 'sqlite'
+DEFAULT_SQLITE_PATH = 'src/library.db'
+DEFAULT_CHUNK_SIZE = 1000
+DEFAULT_EXPORT_FILE = 'src/library.json'
+EXPORT_BATCH_SIZE = 1000
+EXPORT_BUFFER_SIZE = 1 << 20
+CHECKPOINT_EXTENSION = '.checkpoint'
+REPORT_COUNTS = ('inserted', 'updated', 'deleted', 'skipped')
+WRITE_BEHIND_MAX_SIZE = 100
+WRITE_BEHIND_MAX_DELAY = 5.0
+BOOKS_TABLE = 'books_table'
+AUTHORS_TABLE = 'authors_table'
+TOMBSTONES_TABLE = 'tombstones_table'
+LINKS_TABLE = 'links_table'
+# hidden field stamped with the modification marker on every write
+MODIFIED_FIELD = '_modified'
+# markers are microseconds, a write is visible to readers at most this many markers after
+# its marker was made, covering the time of the write and clock skew between processes
+MARKER_LAG = 5 * 1000 * 1000
+OUTPUT_PROJECTION = {'_id': 0, MODIFIED_FIELD: 0}
+WATERMARK_KEY = 'watermark'
+UNIQUE_INDEXES = {BOOKS_TABLE: 'book_id', AUTHORS_TABLE: 'author_id'}
+DEFAULT_SECONDARY_INDEXES = {BOOKS_TABLE: ['rating', 'rating_count', 'title'],
+                             AUTHORS_TABLE: ['rating', 'rating_count', 'name']}
+TEXT_INDEX_NAME = 'text_index'
+# fields of the full-text index of each table with their weights in the text score
+TEXT_INDEXES = {BOOKS_TABLE: {'title': 10, 'similar_books': 1},
+                AUTHORS_TABLE: {'name': 10, 'related_authors': 1}}
+TEXT_SCORE = {'$meta': 'textScore'}
+# fields of the top rated books/authors shown by the visualization pages
+TOP_RATED_FIELDS = {BOOKS_TABLE: ['book_id', 'title', 'rating'],
+                    AUTHORS_TABLE: ['author_id', 'name', 'rating']}
+# section in JSON file: (table name, id key, schema, object name)
+SECTIONS = {'books': (BOOKS_TABLE, 'book_id', BOOK_SCHEMA, 'Book'),
+            'authors': (AUTHORS_TABLE, 'author_id', AUTHOR_SCHEMA, 'Author')}
+# relation in links table: (source table, field with destination ids, destination table)
+LINK_RELATIONS = {'similar_book': (BOOKS_TABLE, 'similar_book_ids', BOOKS_TABLE),
+                  'book_author': (BOOKS_TABLE, 'author_id', AUTHORS_TABLE),
+                  'related_author': (AUTHORS_TABLE, 'related_author_ids', AUTHORS_TABLE)}
+# section of deleted ids in JSON file: section of the deleted books/authors
+DELETED_SECTIONS = {'deleted_books': 'books', 'deleted_authors': 'authors'}
+TABLE_NAMES = [BOOKS_TABLE, AUTHORS_TABLE]
 
-def remove_empty_string(my_dict):
+
+def connect_backend(backend_name=None):
+    """
+    Return the database object which stores the tables.
+    Backend is read from environment variable DB_BACKEND if not given:
+    'mongo' (default) connects to mongoDB at HOST/PORT,
+    'memory' keeps the tables in process memory,
+    'sqlite' keeps the tables in memory persisted to the SQLite file SQLITE_PATH.
+
+    Parameters:
+    backend_name (str): 'mongo', 'memory' or 'sqlite'
+    """
+    load_dotenv()
+    if backend_name is None:
+        backend_name = os.getenv('DB_BACKEND', MONGO_BACKEND)
+    if backend_name == MEMORY_BACKEND:
+        return MemoryDatabase(name=DATABASE_NAME)
+    if backend_name == SQLITE_BACKEND:
+        return MemoryDatabase(os.getenv('SQLITE_PATH', DEFAULT_SQLITE_PATH), DATABASE_NAME)
+    if backend_name != MONGO_BACKEND:
+        raise ValueError(f'Database backend {backend_name} does not exist')
+    client = pymongo.MongoClient(os.getenv('HOST'), os.getenv('PORT'))
+    return client[DATABASE_NAME]
+
+
+def normalize_document(schema, dic):
+    """
+    Validate and normalize the dict of book/author with the schema and print its errors.
+    Return the normalized dict, None if dict is malformed or has no id.
+    """
+    report = schema.validate(dic)
+    schema.print_report(report)
+    return report['document']
+
+
+def write_json_documents(file, cursor):
+    """
+    Write documents of cursor as elements of a JSON array and return the count
+    """
+    count = 0
+    for doc in cursor:
+        file.write(',\n' if count else '\n')
+        file.write(json.dumps(doc, default=default))
+        count += 1
+    return count
+
+
+def write_ndjson_documents(file, cursor, section):
     """
-    Remove keys with empty string in dict
+    Write documents of cursor as lines of newline-delimited JSON tagged with
+    the type of section, and return the count
     """
-    list_keys = []
-    for key in my_dict.keys():
-        if isinstance(my_dict[key], str) and my_dict[key] == '':
-            list_keys.append(key)
-    for key in list_keys:
-        my_dict.pop(key)
-    return my_dict
+    record_type = section[:-1]
+    count = 0
+    for doc in cursor:
+        doc[NDJSON_TYPE_KEY] = record_type
+        file.write(json.dumps(doc, default=default))
+        file.write('\n')
+        count += 1
+    return count
+
+
+def write_bson_documents(file, cursor, section):
+    """
+    Write documents of cursor as BSON documents tagged with the type of section,
+    and return the count
+    """
+    record_type = section[:-1]
+    count = 0
+    for doc in cursor:
+        doc[NDJSON_TYPE_KEY] = record_type
+        file.write(bson.encode(doc))
+        count += 1
+    return count
+
+
+def iter_file_records(file, json_file):
+    """
+    Return the iterator of (section, dict) records in the opened json/BSON file,
+    parsed according to the name of the file
+    """
+    if is_bson_file(json_file):
+        return iter_bson_records(file)
+    if is_ndjson_file(json_file):
+        return iter_ndjson_records(file)
+    return iter_library_records(file)
+
+
+def file_identity(file_name):
+    """
+    Return the identity of the file: absolute path, size and modification time
+    """
+    stat = os.stat(file_name)
+    return {'file': os.path.abspath(file_name), 'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+
+
+def read_checkpoint(checkpoint_file):
+    """
+    Return the checkpoint saved in the file, None if there is none or it is unreadable
+    """
+    try:
+        with open(checkpoint_file, 'r') as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
+    except ValueError:
+        logging.error(f'Invalid checkpoint file {checkpoint_file} is ignored')
+        return None
+
+
+def write_checkpoint(checkpoint_file, checkpoint):
+    """
+    Write the checkpoint durably. It is synced to disk in a temporary file which then
+    replaces the checkpoint file, so a crash never leaves a half written checkpoint.
+    """
+    temp_file = checkpoint_file + '.tmp'
+    with open(temp_file, 'w') as file:
+        json.dump(checkpoint, file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_file, checkpoint_file)
 
 
 class Database:
@@ -34,15 +199,351 @@ class Database:
     Database class that stores the database and tables using mongoDB
     """
 
-    def __init__(self):
+    def __init__(self, secondary_indexes=None, backend=None):
         """
-        Connect to database and initialize books/authors tables
+        Connect to database and initialize books/authors tables.
+        Indexes are not built here, since connecting to mongoDB is lazy and importing
+        modules which create the database must not wait for the server:
+        call ensure_indexes() at startup.
+
+        Parameters:
+        secondary_indexes (dict): table name to list of fields with a non-unique index,
+                                  DEFAULT_SECONDARY_INDEXES if not given
+        backend (object): database object whose tables follow the pymongo collection API,
+                          chosen by connect_backend() if not given
         """
         load_dotenv()
-        self.client = pymongo.MongoClient(os.getenv('HOST'), os.getenv('PORT'))
-        self.digital_library_db = self.client['Digital_Library']
-        self.books_tb = self.digital_library_db.books_table
-        self.authors_tb = self.digital_library_db.authors_table
+        if backend is None:
+            backend = connect_backend()
+        self.client = backend.client
+        self.digital_library_db = backend
+        self.books_tb = self.digital_library_db[BOOKS_TABLE]
+        self.authors_tb = self.digital_library_db[AUTHORS_TABLE]
+        self.tombstones_tb = self.digital_library_db[TOMBSTONES_TABLE]
+        self.links_tb = self.digital_library_db[LINKS_TABLE]
+        if secondary_indexes is None:
+            secondary_indexes = DEFAULT_SECONDARY_INDEXES
+        self.secondary_indexes = secondary_indexes
+        self.write_listeners = []
+        self.last_modified = 0
+        self.modified_lock = threading.Lock()
+
+    def get_table(self, table_name):
+        """
+        Get books/authors table by its name
+        """
+        if table_name == BOOKS_TABLE:
+            return self.books_tb
+        if table_name == AUTHORS_TABLE:
+            return self.authors_tb
+        if table_name == TOMBSTONES_TABLE:
+            return self.tombstones_tb
+        raise ValueError(f'Table {table_name} does not exist')
+
+    def add_write_listener(self, listener):
+        """
+        Register listener(table_name) called after every write of books/authors tables,
+        e.g. to invalidate cached reads of the table
+        """
+        self.write_listeners.append(listener)
+
+    def notify_write(self, table_name):
+        """
+        Call the write listeners after the table is written
+        """
+        for listener in self.write_listeners:
+            listener(table_name)
+
+    def ensure_indexes(self):
+        """
+        Ensure unique indexes on book_id/author_id, indexes on the modification marker,
+        full-text indexes, indexes of the links table and the configured secondary indexes.
+        Building an index that already exists is a no-op in mongoDB.
+        Return whether all indexes are ensured, errors such as an unreachable server or
+        duplicate ids for a unique index are logged.
+        """
+        try:
+            # indexes not built through build_index raise if the server is unreachable,
+            # so ensuring stops at the first one instead of waiting for every index
+            self.tombstones_tb.create_index([('table', ASCENDING), ('id', ASCENDING)], unique=True)
+            self.links_tb.create_index([('rel', ASCENDING), ('src_id', ASCENDING),
+                                        ('dst_id', ASCENDING)], unique=True)
+            self.links_tb.create_index([('rel', ASCENDING), ('dst_id', ASCENDING)])
+        except PyMongoError as error:
+            logging.error(f'Cannot ensure indexes: {error}')
+            return False
+        names = [self.build_index(TOMBSTONES_TABLE, MODIFIED_FIELD)]
+        for table_name, field in UNIQUE_INDEXES.items():
+            names.append(self.build_index(table_name, field, unique=True))
+            names.append(self.build_index(table_name, MODIFIED_FIELD))
+            names.append(self.build_text_index(table_name))
+        for table_name, fields in self.secondary_indexes.items():
+            names.extend(self.build_index(table_name, field) for field in fields)
+        return None not in names
+
+    def next_modified(self):
+        """
+        Return a new modification marker: the time in microseconds, strictly increasing
+        in the process. Every write stamps the documents it touches with a new marker, so
+        documents changed after an export have a marker greater than the watermark of that
+        export. Markers are made without a round trip to the database, and writes of
+        different processes are ordered by their clocks.
+        """
+        with self.modified_lock:
+            self.last_modified = max(self.last_modified + 1, time.time_ns() // 1000)
+            return self.last_modified
+
+    def current_modified(self):
+        """
+        Return the latest modification marker, without using it
+        """
+        with self.modified_lock:
+            return max(self.last_modified, time.time_ns() // 1000)
+
+    def settled_modified(self):
+        """
+        Return the marker up to which every write is visible. A marker is made before the
+        write is sent, so documents with a marker shortly before the latest one may still be
+        in flight: readers of the writes since a marker, exports and mirrors, resume from
+        this one instead of the latest, and read again the writes of the last MARKER_LAG.
+        """
+        return self.current_modified() - MARKER_LAG
+
+    def update_links(self, table_name, documents):
+        """
+        Replace the outgoing links of the books/authors in documents, for every relation
+        whose id field is given in the document. Documents without the field keep their links.
+
+        Parameters:
+        table_name (str): table of the documents
+        documents (list): dicts of books/authors with their id
+        """
+        id_key = UNIQUE_INDEXES[table_name]
+        for rel, (source_table, field, _) in LINK_RELATIONS.items():
+            if source_table != table_name:
+                continue
+            src_ids = []
+            links = []
+            for doc in documents:
+                if field not in doc or id_key not in doc:
+                    continue
+                src_ids.append(doc[id_key])
+                dst_ids = doc[field] if isinstance(doc[field], list) else [doc[field]]
+                dst_ids = [dst_id for dst_id in dst_ids if isinstance(dst_id, str) and dst_id]
+                for rank, dst_id in enumerate(dict.fromkeys(dst_ids)):
+                    links.append({'rel': rel, 'src_id': doc[id_key], 'dst_id': dst_id,
+                                  'rank': rank})
+            if not src_ids:
+                continue
+            self.links_tb.delete_many({'rel': rel, 'src_id': {'$in': src_ids}})
+            if not links:
+                continue
+            try:
+                self.links_tb.insert_many(links, ordered=False)
+            except BulkWriteError as error:
+                logging.error(f'{len(error.details["writeErrors"])} {rel} links '
+                              f'of {table_name} are not written')
+
+    def remove_links(self, table_name, doc_ids):
+        """
+        Remove the outgoing links of deleted books/authors
+        """
+        rels = [rel for rel, (source_table, _, _) in LINK_RELATIONS.items()
+                if source_table == table_name]
+        self.links_tb.delete_many({'rel': {'$in': rels}, 'src_id': {'$in': doc_ids}})
+
+    def rebuild_links(self, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Rebuild the links table from the id fields of all books/authors.
+        Books with author_url but no author_id get it from the url, written with one bulk
+        write per chunk and stamped with a modification marker.
+        Return the number of links.
+        """
+        self.links_tb.delete_many({})
+        marker = self.next_modified()
+        projection = {field: 1 for _, field, _ in LINK_RELATIONS.values()}
+        for table_name, id_key in UNIQUE_INDEXES.items():
+            table = self.get_table(table_name)
+            table_projection = dict(projection, author_url=1, **{id_key: 1})
+            documents = []
+            operations = []
+            is_written = False
+            for doc in table.find({}, table_projection).batch_size(chunk_size):
+                if table_name == BOOKS_TABLE and 'author_id' not in doc:
+                    author_id = find_author_id(doc.get('author_url', ''))
+                    if author_id:
+                        doc['author_id'] = author_id
+                        operations.append(UpdateOne({'_id': doc['_id']}, {'$set': {
+                            'author_id': author_id, MODIFIED_FIELD: marker}}))
+                documents.append(doc)
+                if len(documents) >= chunk_size:
+                    if operations:
+                        table.bulk_write(operations, ordered=False)
+                        is_written = True
+                        operations = []
+                    self.update_links(table_name, documents)
+                    documents = []
+            if operations:
+                table.bulk_write(operations, ordered=False)
+                is_written = True
+            self.update_links(table_name, documents)
+            if is_written:
+                self.notify_write(table_name)
+        count = self.links_tb.count_documents({})
+        print(f'{count} links are rebuilt')
+        return count
+
+    def find_linked_ids(self, rel, doc_id, reverse=False):
+        """
+        Return the ids linked from the book/author by the relation in scraped order,
+        or linking to it if reverse is True
+        """
+        if reverse:
+            cursor = self.links_tb.find({'rel': rel, 'dst_id': doc_id}, {'_id': 0, 'src_id': 1})
+            return [link['src_id'] for link in cursor]
+        cursor = self.links_tb.find({'rel': rel, 'src_id': doc_id},
+                                    {'_id': 0, 'dst_id': 1}).sort('rank', ASCENDING)
+        return [link['dst_id'] for link in cursor]
+
+    def find_neighbors(self, rel, doc_id, reverse=False):
+        """
+        Return the books/authors linked from the book/author by the relation,
+        or linking to it if reverse is True, with one indexed query on each table.
+        Linked ids which are not in the database are left out.
+
+        Parameters:
+        rel (str): 'similar_book', 'book_author' or 'related_author'
+        doc_id (str): id of the book/author
+        reverse (bool): follow the links backwards
+        """
+        source_table, _, destination_table = LINK_RELATIONS[rel]
+        table_name = source_table if reverse else destination_table
+        id_key = UNIQUE_INDEXES[table_name]
+        linked_ids = self.find_linked_ids(rel, doc_id, reverse)
+        docs = {doc[id_key]: doc for doc in self.get_table(table_name).find(
+            {id_key: {'$in': linked_ids}}, OUTPUT_PROJECTION)}
+        return [docs[linked_id] for linked_id in linked_ids if linked_id in docs]
+
+    def list_indexes(self, table_name):
+        """
+        List indexes of the table as dicts with name, keys and whether it is unique
+        """
+        indexes = []
+        for index in self.get_table(table_name).list_indexes():
+            indexes.append({'name': index['name'], 'keys': list(index['key'].items()),
+                            'unique': index.get('unique', False)})
+        return indexes
+
+    def build_index(self, table_name, field, unique=False, direction=ASCENDING):
+        """
+        Build index on the field of the table and return the index name.
+        Return None if the index cannot be built, e.g. duplicate ids for unique index.
+        """
+        try:
+            return self.get_table(table_name).create_index([(field, direction)], unique=unique)
+        except PyMongoError as error:
+            logging.error(f'Cannot build index on {field} of {table_name}: {error}')
+            return None
+
+    def build_text_index(self, table_name):
+        """
+        Build the full-text index over the fields of TEXT_INDEXES of the table and return
+        the index name. The index is maintained by the database on every write.
+        Words are neither stemmed nor dropped as stop words, titles are matched as written.
+        Return None if the index cannot be built, e.g. another text index exists.
+        """
+        weights = TEXT_INDEXES[table_name]
+        try:
+            return self.get_table(table_name).create_index(
+                [(field, TEXT) for field in weights], name=TEXT_INDEX_NAME, weights=weights,
+                default_language='none')
+        except PyMongoError as error:
+            logging.error(f'Cannot build text index of {table_name}: {error}')
+            return None
+
+    def text_search(self, table_name, search, ranked=False):
+        """
+        Return the cursor of books/authors whose text fields contain any word of search,
+        resolved through the full-text index instead of scanning the table.
+        Words prefixed with '-' exclude books/authors, text in quotes is an exact phrase.
+
+        Parameters:
+        table_name (str): BOOKS_TABLE or AUTHORS_TABLE
+        search (str): words to search
+        ranked (bool): sort by relevance and output the text score as 'score'
+        """
+        my_filter = {'$text': {'$search': search}}
+        if not ranked:
+            return self.get_table(table_name).find(my_filter, OUTPUT_PROJECTION)
+        projection = dict(OUTPUT_PROJECTION, score=TEXT_SCORE)
+        return self.get_table(table_name).find(my_filter, projection).sort([('score', TEXT_SCORE)])
+
+    def top_rated(self, table_name, k):
+        """
+        Return the k books/authors with the highest ratings, with fields of TOP_RATED_FIELDS.
+        They are sorted and limited by the database through the index of rating,
+        so only k documents are read. Ratings not stored as numbers are left out,
+        so ratings are ordered as numbers.
+
+        Parameters:
+        table_name (str): BOOKS_TABLE or AUTHORS_TABLE
+        k (int): number of books/authors
+        """
+        projection = {'_id': 0}
+        projection.update(dict.fromkeys(TOP_RATED_FIELDS[table_name], 1))
+        cursor = self.get_table(table_name).find({'rating': {'$type': 'number'}}, projection)
+        return list(cursor.sort('rating', DESCENDING).limit(k))
+
+    def drop_index(self, table_name, index_name):
+        """
+        Drop index of the table by its name.
+        Return whether the index is dropped.
+        """
+        try:
+            self.get_table(table_name).drop_index(index_name)
+        except PyMongoError as error:
+            logging.error(f'Cannot drop index {index_name} of {table_name}: {error}')
+            return False
+        return True
+
+    def migrate_numeric_fields(self, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        One-shot migration of rating, rating_count and review_count stored as strings
+        into numbers in books/authors tables. Values which are not numbers are removed.
+        Return the number of migrated documents.
+        """
+        count = 0
+        marker = self.next_modified()
+        string_filter = {'$or': [{field: {'$type': 'string'}} for field in NUMERIC_FIELDS]}
+        projection = {field: 1 for field in NUMERIC_FIELDS}
+        for table_name in TABLE_NAMES:
+            table = self.get_table(table_name)
+            operations = []
+            for doc in table.find(string_filter, projection).batch_size(chunk_size):
+                new_values = {MODIFIED_FIELD: marker}
+                old_values = {}
+                for field, number_type in NUMERIC_FIELDS.items():
+                    if not isinstance(doc.get(field), str):
+                        continue
+                    number = to_number(doc[field], number_type)
+                    if number is None:
+                        old_values[field] = ''
+                    else:
+                        new_values[field] = number
+                update = {'$set': new_values}
+                if old_values:
+                    update['$unset'] = old_values
+                operations.append(UpdateOne({'_id': doc['_id']}, update))
+                if len(operations) >= chunk_size:
+                    table.bulk_write(operations, ordered=False)
+                    count += len(operations)
+                    operations = []
+            if operations:
+                table.bulk_write(operations, ordered=False)
+                count += len(operations)
+            self.notify_write(table_name)
+        print(f'{count} books/authors are migrated to numeric rating fields')
+        return count
 
     def is_book_exist(self, book_dic):
         """
@@ -64,116 +565,364 @@ class Database:
             return True
         return False
 
-    def update_insert_from_json_file(self, json_file):
+    def update_insert_from_json_file(self, json_file, chunk_size=DEFAULT_CHUNK_SIZE,
+                                     streaming=False, resume=False):
         """
         Update on or insert into the existing books/authors tables from json file.
         Handle invalid json file and malformed data structure.
+        Books/authors are written as chunked bulk upserts by id, and a report
+        with inserted/updated/skipped counts is returned for every chunk.
+        In streaming mode, or for newline-delimited JSON and BSON files, records are parsed
+        one by one and written as soon as a chunk is full.
+        Files compressed with gzip or xz are detected and decompressed on the fly.
+        In resume mode, the import is checkpointed after every chunk and
+        continues from the checkpoint of an interrupted import of the same file.
         """
-        with open(json_file, 'r') as file:
+        if resume:
+            return self.resume_from_json_file(json_file, chunk_size)
+        if streaming or is_ndjson_file(json_file) or is_bson_file(json_file):
+            return self.stream_from_json_file(json_file, chunk_size)
+        with open_library_file(json_file, 'rt') as file:
             try:
                 content = json.load(file)
             except ValueError:
                 logging.error('Invalid JSON file: File given is not a valid JSON file')
-                return
+                return []
+            except DECOMPRESSION_ERRORS as error:
+                logging.error(f'Invalid compressed file: {error}')
+                return []
         if not isinstance(content, dict):
             print('Malformed data structure: Content of JSON file is not a dict')
-            return
-        array_books = content['books']
-        array_authors = content['authors']
-        for book_dic in array_books:
-            book_dic = remove_empty_string(book_dic)
-            if 'book_id' not in book_dic.keys():
-                # Skip if no book_id
-                print('Skip one book from json file with no id')
+            return []
+        # deleted ids of an incremental export are applied before changed documents
+        records = ((section, dic) for section in list(DELETED_SECTIONS) + list(SECTIONS)
+                   for dic in content.get(section, []))
+        return self.bulk_upsert(records, chunk_size)
+
+    def stream_from_json_file(self, json_file, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Parse json/BSON file incrementally and feed the records into chunked bulk upserts,
+        so memory only holds one chunk per table regardless of file size.
+        Chunks written before a malformed record is found are kept.
+        """
+        reports = []
+        binary = is_bson_file(json_file)
+        with open_library_file(json_file, 'rb' if binary else 'rt') as file:
+            try:
+                self.bulk_upsert(iter_file_records(file, json_file), chunk_size, reports)
+            except ValueError as error:
+                logging.error(f'Invalid JSON file: {error}')
+            except DECOMPRESSION_ERRORS as error:
+                logging.error(f'Invalid compressed file: {error}')
+        return reports
+
+    def resume_from_json_file(self, json_file, chunk_size=DEFAULT_CHUNK_SIZE,
+                              checkpoint_file=None):
+        """
+        Import json/BSON file in streaming mode and save a checkpoint after every chunk,
+        with the identity of the file, the number of records which are all written
+        and the counts so far. If the import stops, e.g. malformed record or lost
+        connection to database, running it again skips the records already written.
+        The checkpoint is ignored if the file has changed and removed when import completes.
+        Return the list of per-chunk reports of this run.
+
+        Parameters:
+        json_file (str): path of the file to import
+        chunk_size (int): number of documents in one bulk write
+        checkpoint_file (str): path of the checkpoint, json_file + '.checkpoint' if not given
+        """
+        if checkpoint_file is None:
+            checkpoint_file = json_file + CHECKPOINT_EXTENSION
+        identity = file_identity(json_file)
+        checkpoint = read_checkpoint(checkpoint_file)
+        if checkpoint is not None and checkpoint.get('identity') != identity:
+            print(f'Checkpoint {checkpoint_file} belongs to another version of {json_file}, '
+                  f'import starts over')
+            checkpoint = None
+        if checkpoint is None:
+            checkpoint = {'identity': identity, 'records': 0,
+                          'counts': {key: 0 for key in REPORT_COUNTS}}
+        else:
+            print(f'Resume import of {json_file} after {checkpoint["records"]} records')
+        offset = checkpoint['records']
+
+        def on_commit(committed, report):
+            checkpoint['records'] = offset + committed
+            for key in REPORT_COUNTS:
+                checkpoint['counts'][key] += report.get(key, 0)
+            write_checkpoint(checkpoint_file, checkpoint)
+
+        reports = []
+        binary = is_bson_file(json_file)
+        with open_library_file(json_file, 'rb' if binary else 'rt') as file:
+            # records already written are parsed again but not written
+            records = itertools.islice(iter_file_records(file, json_file), offset, None)
+            try:
+                self.bulk_upsert(records, chunk_size, reports, on_commit)
+            except ValueError as error:
+                logging.error(f'Invalid JSON file: {error}')
+                return reports
+            except DECOMPRESSION_ERRORS as error:
+                logging.error(f'Invalid compressed file: {error}')
+                return reports
+            except PyMongoError as error:
+                logging.error(f'Import of {json_file} stopped after {checkpoint["records"]} '
+                              f'records, run it again to resume: {error}')
+                return reports
+        if os.path.exists(checkpoint_file):
+            os.remove(checkpoint_file)
+        counts = ', '.join(f'{count} {key}' for key, count in checkpoint['counts'].items())
+        print(f'Import of {json_file} is complete: {counts}')
+        return reports
+
+    def bulk_upsert_books(self, array_books, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Upsert books into books table by book id using unordered bulk writes.
+        Only valid attributes are written, books with no id are skipped.
+        Return the list of per-chunk reports.
+        """
+        return self.bulk_upsert((('books', book_dic) for book_dic in array_books), chunk_size)
+
+    def bulk_upsert_authors(self, array_authors, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Upsert authors into authors table by author id using unordered bulk writes.
+        Only valid attributes are written, authors with no id are skipped.
+        Return the list of per-chunk reports.
+        """
+        return self.bulk_upsert((('authors', author_dic) for author_dic in array_authors),
+                                chunk_size)
+
+    def bulk_upsert(self, records, chunk_size=DEFAULT_CHUNK_SIZE, reports=None, on_commit=None):
+        """
+        Group validated documents into chunks of upserts per table and write
+        every chunk with one unordered bulk write as soon as it is full.
+        Deleted ids of an incremental export are grouped into chunks of deletes, and
+        pending deletes/upserts of a table are written before the other one, so
+        the order of the records is kept for every table.
+        Return the list of per-chunk reports.
+
+        Parameters:
+        records (iterable): (section, dict) pairs, section is 'books', 'authors',
+                            'deleted_books' or 'deleted_authors'
+        chunk_size (int): number of documents in one bulk write
+        reports (list): list which reports are appended to, new list if not given
+        on_commit (function): called after every chunk with the number of leading records
+                              which are all written and the report of the chunk
+        """
+        chunk_size = max(int(chunk_size), 1)
+        if reports is None:
+            reports = []
+        sections = list(DELETED_SECTIONS) + list(SECTIONS)
+        documents = {section: [] for section in sections}
+        skipped = {section: 0 for section in sections}
+        chunk_numbers = {section: 0 for section in sections}
+        # position of the first record not written yet in every section
+        first_pending = {section: None for section in sections}
+        # upserts and deletes of the same table
+        siblings = {}
+        for deleted_section, section in DELETED_SECTIONS.items():
+            siblings[deleted_section] = section
+            siblings[section] = deleted_section
+        position = 0
+
+        def write(section):
+            chunk_numbers[section] += 1
+            report = self.write_chunk(section, documents[section], skipped[section],
+                                      chunk_numbers[section])
+            reports.append(report)
+            documents[section] = []
+            skipped[section] = 0
+            first_pending[section] = None
+            if on_commit is not None:
+                pending = [index for index in first_pending.values() if index is not None]
+                on_commit(min(pending, default=position), report)
+
+        for position, (section, dic) in enumerate(records, 1):
+            if section == WATERMARK_KEY:
                 continue
-            if self.is_book_exist(book_dic):
-                # book already exist in database, update valid attributes
-                self.update_books_tb_from_json(book_dic)
+            if section in DELETED_SECTIONS:
+                document = self.to_deleted_id(section, dic)
+            elif section in SECTIONS:
+                document = self.to_upsert_document(section, dic)
             else:
-                # book not exist in database, insert valid attributes
-                self.insert_books_tb_from_json(book_dic)
-        for author_dic in array_authors:
-            author_dic = remove_empty_string(author_dic)
-            if 'author_id' not in author_dic.keys():
-                # Skip if no author_id
-                print('Skip one author from json file with no id')
+                print(f'Skip one record from json file in unknown section {section}')
                 continue
-            if self.is_author_exist(author_dic):
-                # Author already exist in database, update valid attributes
-                self.update_authors_tb_from_json(author_dic)
+            if document is None:
+                skipped[section] += 1
+                continue
+            if documents[siblings[section]]:
+                write(siblings[section])
+            if not documents[section]:
+                first_pending[section] = position - 1
+            documents[section].append(document)
+            if len(documents[section]) >= chunk_size:
+                write(section)
+        for section in sections:
+            if documents[section] or skipped[section]:
+                write(section)
+        return reports
+
+    @staticmethod
+    def to_upsert_document(section, dic):
+        """
+        Validate and normalize the dict of book/author with the schema of the section.
+        Return None if dict is malformed or has no id.
+        """
+        return normalize_document(SECTIONS[section][2], dic)
+
+    @staticmethod
+    def to_deleted_id(section, record):
+        """
+        Return the id of a deleted book/author, given as id string or as dict with the id.
+        Return None if record is malformed.
+        """
+        _, id_key, _, object_name = SECTIONS[DELETED_SECTIONS[section]]
+        if isinstance(record, dict):
+            record = record.get(id_key)
+        if not isinstance(record, str) or record == '':
+            print(f'Malformed data structure: Deleted {object_name.lower()} has no valid id')
+            return None
+        return record
+
+    def write_chunk(self, section, documents, skipped, chunk_number, replace=False):
+        """
+        Stamp one chunk of documents with a new modification marker, write them with
+        one unordered bulk write of upserts by id and return the report with
+        inserted/updated/skipped counts.
+        For deleted sections, documents are ids to delete and the report has deleted count.
+
+        Parameters:
+        section (str): section of the documents in JSON file
+        documents (list): dicts of books/authors, or ids for deleted sections
+        skipped (int): number of records skipped before the write
+        chunk_number (int): number of the chunk reported
+        replace (bool): replace whole documents instead of setting their attributes
+        """
+        if section in DELETED_SECTIONS:
+            return self.write_deleted_chunk(section, documents, skipped, chunk_number)
+        table_name, id_key, _, object_name = SECTIONS[section]
+        report = {'table': table_name, 'chunk': chunk_number,
+                  'inserted': 0, 'updated': 0, 'skipped': skipped}
+        if not documents:
+            return report
+        marker = self.next_modified()
+        operations = []
+        for doc in documents:
+            doc[MODIFIED_FIELD] = marker
+            if replace:
+                operations.append(ReplaceOne({id_key: doc[id_key]}, doc, upsert=True))
             else:
-                # Author not exist in database, insert valid attributes
-                self.insert_authors_tb_from_json(author_dic)
+                operations.append(UpdateOne({id_key: doc[id_key]}, {'$set': doc}, upsert=True))
+        try:
+            details = self.get_table(table_name).bulk_write(operations,
+                                                            ordered=False).bulk_api_result
+        except BulkWriteError as error:
+            details = error.details
+            logging.error(f'{len(details["writeErrors"])} {object_name.lower()}s '
+                          f'failed in chunk {chunk_number}')
+        # links of documents whose write failed are kept as stored
+        failed = {write_error['index'] for write_error in details['writeErrors']}
+        self.update_links(table_name, [doc for i, doc in enumerate(documents) if i not in failed])
+        self.notify_write(table_name)
+        report['inserted'] = details['nUpserted']
+        report['updated'] = details['nMatched']
+        report['skipped'] += len(details['writeErrors'])
+        print(f'{object_name}s chunk {chunk_number}: {report["inserted"]} inserted, '
+              f'{report["updated"]} updated, {report["skipped"]} skipped')
+        return report
+
+    def write_deleted_chunk(self, section, doc_ids, skipped, chunk_number):
+        """
+        Delete one chunk of books/authors by id and return the report
+        with deleted/skipped counts
+        """
+        table_name, _, _, object_name = SECTIONS[DELETED_SECTIONS[section]]
+        report = {'table': table_name, 'chunk': chunk_number, 'deleted': 0, 'skipped': skipped}
+        if doc_ids:
+            report['deleted'] = self.delete_by_ids(table_name, doc_ids)
+        print(f'Deleted {object_name.lower()}s chunk {chunk_number}: '
+              f'{report["deleted"]} deleted, {report["skipped"]} skipped')
+        return report
+
+    def delete_by_ids(self, table_name, doc_ids):
+        """
+        Delete books/authors by id and record a tombstone stamped with a new
+        modification marker for every id, so incremental exports carry the deletes.
+        Return the number of deleted documents.
+        """
+        id_key = UNIQUE_INDEXES[table_name]
+        result = self.get_table(table_name).delete_many({id_key: {'$in': doc_ids}})
+        self.remove_links(table_name, doc_ids)
+        marker = self.next_modified()
+        operations = [UpdateOne({'table': table_name, 'id': doc_id},
+                                {'$set': {MODIFIED_FIELD: marker}}, upsert=True)
+                      for doc_id in doc_ids]
+        self.tombstones_tb.bulk_write(operations, ordered=False)
+        # listeners are called once the tombstones are written, so they can read them
+        self.notify_write(table_name)
+        return result.deleted_count
+
+    def delete_book(self, book_id):
+        """
+        Delete book from books table by id and record its tombstone.
+        Return whether the book is deleted.
+        """
+        return self.delete_by_ids(BOOKS_TABLE, [book_id]) > 0
+
+    def delete_author(self, author_id):
+        """
+        Delete author from authors table by id and record its tombstone.
+        Return whether the author is deleted.
+        """
+        return self.delete_by_ids(AUTHORS_TABLE, [author_id]) > 0
 
     def update_books_tb_from_json(self, book_dic):
         """
         Update books table from JSON file.
         Only update value in valid attributes
         """
-        book_dic = remove_empty_string(book_dic)
-        book_id = book_dic['book_id']
-        my_query = {'book_id': book_id}
-        for attribute in book_dic.keys():
-            if attribute not in BOOK_ATTRIBUTES:
-                print(f'Malformed data structure: '
-                      f'Book with id {book_id} has invalid attribute {attribute}')
-                continue
-            new_values = {'$set': {attribute: book_dic[attribute]}}
-            self.books_tb.update_one(my_query, new_values)
-            print(f'{attribute} entry of book with id {book_id} is updated')
+        book_dic = normalize_document(BOOK_SCHEMA, book_dic)
+        if book_dic is None:
+            return
+        self.update_books_tb_attributes(book_dic)
+        for attribute in book_dic:
+            if attribute != MODIFIED_FIELD:
+                print(f'{attribute} entry of book with id {book_dic["book_id"]} is updated')
 
     def update_authors_tb_from_json(self, author_dic):
         """
         Update authors table from JSON file.
         Only update value in valid attributes
         """
-        author_dic = remove_empty_string(author_dic)
-        author_id = author_dic['author_id']
-        my_query = {'author_id': author_id}
-        for attribute in author_dic.keys():
-            if attribute not in AUTHOR_ATTRIBUTES:
-                print(f'Malformed data structure: '
-                      f'Author with id {author_id} has invalid attribute {attribute}')
-                continue
-            new_values = {'$set': {attribute: author_dic[attribute]}}
-            self.authors_tb.update_one(my_query, new_values)
-            print(f'{attribute} entry of author with id {author_id} is updated')
+        author_dic = normalize_document(AUTHOR_SCHEMA, author_dic)
+        if author_dic is None:
+            return
+        self.update_authors_tb_attributes(author_dic)
+        for attribute in author_dic:
+            if attribute != MODIFIED_FIELD:
+                print(f'{attribute} entry of author with id {author_dic["author_id"]} is updated')
 
     def insert_books_tb_from_json(self, book_dic):
         """
         Insert into books table from JSON file.
         Only insert valid attributes and skip invalid attributes
         """
-        book_dic = remove_empty_string(book_dic)
-        invalid_keys = []
-        book_id = book_dic['book_id']
-        for attribute in book_dic.keys():
-            if attribute not in BOOK_ATTRIBUTES:
-                print(f'Malformed data structure: '
-                      f'Book with id {book_id} has invalid attribute {attribute}')
-                invalid_keys.append(attribute)
-        for key in invalid_keys:
-            book_dic.pop(key, None)
+        book_dic = normalize_document(BOOK_SCHEMA, book_dic)
+        if book_dic is None:
+            return
         self.insert_books_tb(book_dic)
-        print(f'Book with id {book_id} is created')
+        print(f'Book with id {book_dic["book_id"]} is created')
 
     def insert_authors_tb_from_json(self, author_dic):
         """
         Insert into authors table from JSON file.
         Only insert valid attributes and skip invalid attributes
         """
-        author_dic = remove_empty_string(author_dic)
-        invalid_keys = []
-        author_id = author_dic['author_id']
-        for attribute in author_dic.keys():
-            if attribute not in AUTHOR_ATTRIBUTES:
-                print(f'Malformed data structure: '
-                      f'Author with id {author_id} has invalid attribute {attribute}')
-                invalid_keys.append(attribute)
-        for key in invalid_keys:
-            author_dic.pop(key, None)
+        author_dic = normalize_document(AUTHOR_SCHEMA, author_dic)
+        if author_dic is None:
+            return
         self.insert_authors_tb(author_dic)
-        print(f'Author with id {author_id} is created')
+        print(f'Author with id {author_dic["author_id"]} is created')
 
     def update_insert_books_tb(self, book_dic):
         """
@@ -181,7 +930,9 @@ class Database:
         If book title exists in table, then update.
         Otherwise, insert into table
         """
-        book_dic = remove_empty_string(book_dic)
+        book_dic = normalize_document(BOOK_SCHEMA, book_dic)
+        if book_dic is None:
+            return
         book_id = book_dic['book_id']
         if self.is_book_exist(book_dic):
             # If book_id already exist in table, then update the book
@@ -198,7 +949,9 @@ class Database:
         If author name exists in table, then update.
         Otherwise, insert into table
         """
-        author_dic = remove_empty_string(author_dic)
+        author_dic = normalize_document(AUTHOR_SCHEMA, author_dic)
+        if author_dic is None:
+            return
         author_id = author_dic['author_id']
         if self.is_author_exist(author_dic):
             # If author_id already exist in table, then update the author
@@ -209,43 +962,279 @@ class Database:
             self.insert_authors_tb(author_dic)
             print(f'Author with id {author_id} is created')
 
+    def update_books_tb_attributes(self, book_dic):
+        """
+        Set the attributes of book_dic on the book with its id in books table
+        """
+        book_dic[MODIFIED_FIELD] = self.next_modified()
+        self.books_tb.update_one({'book_id': book_dic['book_id']}, {'$set': book_dic})
+        self.update_links(BOOKS_TABLE, [book_dic])
+        self.notify_write(BOOKS_TABLE)
+
+    def update_authors_tb_attributes(self, author_dic):
+        """
+        Set the attributes of author_dic on the author with its id in authors table
+        """
+        author_dic[MODIFIED_FIELD] = self.next_modified()
+        self.authors_tb.update_one({'author_id': author_dic['author_id']}, {'$set': author_dic})
+        self.update_links(AUTHORS_TABLE, [author_dic])
+        self.notify_write(AUTHORS_TABLE)
+
     def update_books_tb(self, book_dic, book_id):
         """
         Update book_dic in books table
         """
-        self.books_tb.delete_one({'book_id': book_id})
-        self.insert_books_tb(book_dic)
+        book_dic[MODIFIED_FIELD] = self.next_modified()
+        self.books_tb.replace_one({'book_id': book_id}, book_dic)
+        self.update_links(BOOKS_TABLE, [book_dic])
+        self.notify_write(BOOKS_TABLE)
 
     def update_authors_tb(self, author_dic, author_id):
         """
         Update author_dic in authors table
         """
-        self.authors_tb.delete_one({'author_id': author_id})
-        self.insert_authors_tb(author_dic)
+        author_dic[MODIFIED_FIELD] = self.next_modified()
+        self.authors_tb.replace_one({'author_id': author_id}, author_dic)
+        self.update_links(AUTHORS_TABLE, [author_dic])
+        self.notify_write(AUTHORS_TABLE)
 
     def insert_books_tb(self, book_dic):
         """
         Insert book_dic into book table
         """
+        book_dic[MODIFIED_FIELD] = self.next_modified()
         self.books_tb.insert_one(book_dic)
+        self.update_links(BOOKS_TABLE, [book_dic])
+        self.notify_write(BOOKS_TABLE)
 
     def insert_authors_tb(self, author_dic):
         """
         Insert author_dic into author table
         """
+        author_dic[MODIFIED_FIELD] = self.next_modified()
         self.authors_tb.insert_one(author_dic)
+        self.update_links(AUTHORS_TABLE, [author_dic])
+        self.notify_write(AUTHORS_TABLE)
+
+    def export_to_json_file(self, output_file=DEFAULT_EXPORT_FILE, ndjson=None,
+                            batch_size=EXPORT_BATCH_SIZE, since=None):
+        """
+        Export existing books/authors into JSON file from database.
+        Documents are streamed from cursor batches straight into the file, either as
+        {'watermark': ..., 'books': [...], 'authors': [...]}, as newline-delimited JSON
+        with a 'type' key, or as BSON documents with a 'type' key for .bson files,
+        so memory does not grow with the size of the library.
+        Files ending with .gz or .xz are compressed with gzip or xz.
+        The watermark is the settled modification marker at the start of the export, so
+        writes in flight during the export are after it. Given the watermark of a previous
+        export as since, only books/authors changed after it are exported, preceded by
+        'deleted_books'/'deleted_authors' arrays of deleted ids. Changes shortly before
+        the watermark are exported again, importing them again leaves the same books/authors.
+        Return the number of exported documents.
+
+        Parameters:
+        output_file (str): path of the output file
+        ndjson (bool): write newline-delimited JSON, inferred from file extension if None
+        batch_size (int): number of documents fetched from database at once
+        since (int): watermark of a previous export, export everything if None
+        """
+        if ndjson is None:
+            ndjson = is_ndjson_file(output_file)
+        binary = is_bson_file(output_file)
+        watermark = self.settled_modified()
+        sections = list(SECTIONS)
+        my_filter = {}
+        if since is not None:
+            sections = list(DELETED_SECTIONS) + sections
+            my_filter = {MODIFIED_FIELD: {'$gt': since}}
+        if ndjson or binary:
+            count = self.export_records(output_file, sections, my_filter, batch_size,
+                                        watermark, binary)
+            print(f'{count} books/authors are exported into {output_file} '
+                  f'at watermark {watermark}')
+            return count
+        count = 0
+        with open_library_file(output_file, 'wt', EXPORT_BUFFER_SIZE) as file:
+            file.write(f'{{\n"{WATERMARK_KEY}": {watermark}')
+            for section in sections:
+                cursor = self.export_cursor(section, my_filter, batch_size)
+                file.write(f',\n"{section}": [')
+                count += write_json_documents(file, cursor)
+                file.write('\n]')
+            file.write('\n}\n')
+        print(f'{count} books/authors are exported into {output_file} at watermark {watermark}')
+        return count
+
+    def export_records(self, output_file, sections, my_filter, batch_size, watermark, binary):
+        """
+        Export the sections as newline-delimited JSON or BSON records and return the count.
+        Every section is encoded, and compressed, into its own part file by a separate
+        thread. The parts are concatenated after the watermark record, since
+        concatenated lines, BSON documents, gzip members and xz streams stay one valid file.
+        """
+        root, extension = os.path.splitext(output_file)
+        part_files = [f'{root}.part{i}{extension}' for i in range(len(sections) + 1)]
+        header = {NDJSON_TYPE_KEY: WATERMARK_KEY, WATERMARK_KEY: watermark}
+        try:
+            with open_library_file(part_files[0], 'wb' if binary else 'wt') as file:
+                file.write(bson.encode(header) if binary else json.dumps(header) + '\n')
+            with ThreadPoolExecutor(max_workers=len(sections)) as executor:
+                futures = [executor.submit(self.export_part, part_file, section, my_filter,
+                                           batch_size, binary)
+                           for part_file, section in zip(part_files[1:], sections)]
+                count = sum(future.result() for future in futures)
+            with open(output_file, 'wb') as output:
+                for part_file in part_files:
+                    with open(part_file, 'rb') as part:
+                        shutil.copyfileobj(part, output, EXPORT_BUFFER_SIZE)
+        finally:
+            for part_file in part_files:
+                if os.path.exists(part_file):
+                    os.remove(part_file)
+        return count
+
+    def export_part(self, part_file, section, my_filter, batch_size, binary):
+        """
+        Write the records of one section into a part file and return the count
+        """
+        cursor = self.export_cursor(section, my_filter, batch_size)
+        with open_library_file(part_file, 'wb' if binary else 'wt', EXPORT_BUFFER_SIZE) as file:
+            if binary:
+                return write_bson_documents(file, cursor, section)
+            return write_ndjson_documents(file, cursor, section)
+
+    def export_cursor(self, section, my_filter, batch_size=EXPORT_BATCH_SIZE):
+        """
+        Return the iterable of documents exported in the section.
+        Deleted sections yield dicts with the ids of tombstones matching the filter.
+        """
+        if section in SECTIONS:
+            table_name = SECTIONS[section][0]
+            return self.get_table(table_name).find(my_filter, OUTPUT_PROJECTION) \
+                .batch_size(batch_size)
+        table_name, id_key, _, _ = SECTIONS[DELETED_SECTIONS[section]]
+        cursor = self.tombstones_tb.find(dict(my_filter, table=table_name),
+                                         {'_id': 0, 'id': 1}).batch_size(batch_size)
+        return ({id_key: tombstone['id']} for tombstone in cursor)
+
+
+class WriteBehindBuffer:
+    """
+    Buffer books/authors scraped by the crawler and write them to database in bulk.
+    Repeated ids are coalesced so only the latest dict is written. The buffer is
+    flushed by a background thread when it holds max_size documents or when the oldest
+    pending document waited max_delay seconds, and flushed once more on exit.
+    """
+
+    def __init__(self, database, max_size=WRITE_BEHIND_MAX_SIZE,
+                 max_delay=WRITE_BEHIND_MAX_DELAY):
+        """
+        Initialize the buffer and start its flushing thread
+
+        Parameters:
+        database (Database): database to write into
+        max_size (int): number of pending documents which triggers a flush
+        max_delay (float): seconds a pending document waits at most before a flush
+        """
+        self.database = database
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self.pending = {section: {} for section in SECTIONS}
+        self.oldest_time = None
+        self.flush_count = 0
+        self.closed = False
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.wake_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def __len__(self):
+        """
+        Number of pending books/authors
+        """
+        with self.lock:
+            return sum(len(docs) for docs in self.pending.values())
+
+    def add_book(self, book_dic):
+        """
+        Buffer book_dic to be upserted into books table
+        """
+        self.add('books', book_dic)
+
+    def add_author(self, author_dic):
+        """
+        Buffer author_dic to be upserted into authors table
+        """
+        self.add('authors', author_dic)
 
-    def export_to_json_file(self):
+    def add(self, section, dic):
         """
-        Export existing books/authors into JSON files from database.
-        JSON file name is 'library.json'
+        Buffer dict of book/author, replacing any pending dict with the same id.
+        Dicts which are malformed or have no id are skipped.
+        Wake up the flushing thread if the buffer is full.
         """
-        dictionary = {'books': [], 'authors': []}
-        for book_info in self.books_tb.find({}, {'_id': 0}):
-            book_info_dic = json.loads(dumps(book_info))
-            dictionary['books'].append(book_info_dic)
-        for author_info in self.authors_tb.find({}, {'_id': 0}):
-            author_info_dic = json.loads(dumps(author_info))
-            dictionary['authors'].append(author_info_dic)
-        with open('src/library.json', 'w') as output_file:
-            json.dump(dictionary, output_file, indent=4)
+        _, id_key, schema, _ = SECTIONS[section]
+        dic = normalize_document(schema, dic)
+        if dic is None:
+            return
+        with self.lock:
+            self.pending[section][dic[id_key]] = dic
+            if self.oldest_time is None:
+                self.oldest_time = time.monotonic()
+            is_full = sum(len(docs) for docs in self.pending.values()) >= self.max_size
+        if is_full:
+            self.wake_event.set()
+
+    def run(self):
+        """
+        Flush the buffer whenever it is full or its oldest document is due
+        """
+        while not self.closed:
+            with self.lock:
+                oldest_time = self.oldest_time
+            timeout = self.max_delay
+            if oldest_time is not None:
+                timeout = max(oldest_time + self.max_delay - time.monotonic(), 0)
+            self.wake_event.wait(timeout)
+            self.wake_event.clear()
+            if not self.closed:
+                self.flush()
+
+    def flush(self):
+        """
+        Write all pending books/authors as bulk upserts replacing documents by id.
+        Documents of a failed write are put back unless a newer dict was buffered.
+        """
+        with self.flush_lock:
+            with self.lock:
+                pending = self.pending
+                self.pending = {section: {} for section in SECTIONS}
+                self.oldest_time = None
+            for section, docs in pending.items():
+                if not docs:
+                    continue
+                self.flush_count += 1
+                try:
+                    self.database.write_chunk(section, list(docs.values()), 0, self.flush_count,
+                                              replace=True)
+                except PyMongoError as error:
+                    logging.error(f'Cannot flush {len(docs)} {section}: {error}')
+                    with self.lock:
+                        for doc_id, doc in docs.items():
+                            self.pending[section].setdefault(doc_id, doc)
+                        if self.oldest_time is None:
+                            self.oldest_time = time.monotonic()
+
+    def close(self):
+        """
+        Stop the flushing thread and flush the remaining documents
+        """
+        if self.closed:
+            return
+        self.closed = True
+        self.wake_event.set()
+        self.thread.join()
+        self.flush()
+        atexit.unregister(self.close)
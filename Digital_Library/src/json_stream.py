@@ -0,0 +1,279 @@
+"""
+This module is used to parse library JSON files incrementally.
+Elements of the 'books' and 'authors' arrays are yielded one by one while the file
+is read in fixed-size blocks, so memory does not grow with the size of the file.
+Newline-delimited JSON (one book/author dict per line) and BSON dumps (one book/author
+document after another) are supported as well, optionally compressed with gzip or xz.
+"""
+import gzip
+import json
+import lzma
+import os
+import zlib
+
+import bson
+from bson.errors import InvalidBSON
+
+READ_SIZE = 1 << 16
+# largest book/author value read ahead before it is reported as malformed,
+# like the 16MB limit of mongoDB documents
+MAX_RECORD_SIZE = 1 << 24
+WHITESPACE = ' \t\n\r'
+DELIMITERS = WHITESPACE + ',:]}'
+NDJSON_EXTENSIONS = ('.ndjson', '.jsonl')
+BSON_EXTENSION = '.bson'
+GZIP = 'gzip'
+XZ = 'xz'
+COMPRESSION_EXTENSIONS = {'.gz': GZIP, '.xz': XZ}
+COMPRESSION_MAGIC = {GZIP: b'\x1f\x8b', XZ: b'\xfd7zXZ\x00'}
+GZIP_LEVEL = 6
+# errors raised when reading a corrupted or truncated compressed file
+DECOMPRESSION_ERRORS = (EOFError, gzip.BadGzipFile, lzma.LZMAError, zlib.error)
+NDJSON_TYPE_KEY = 'type'
+NDJSON_TYPES = {'book': 'books', 'author': 'authors', 'deleted_book': 'deleted_books',
+                'deleted_author': 'deleted_authors', 'watermark': 'watermark'}
+LIBRARY_SECTIONS = ('books', 'authors', 'deleted_books', 'deleted_authors')
+
+
+class StreamParser:
+    """
+    Minimal pull parser over a text file which decodes one JSON value at a time
+    """
+
+    def __init__(self, file, read_size=READ_SIZE, max_record_size=MAX_RECORD_SIZE):
+        """
+        Initialize the parser with an opened text file
+
+        Parameters:
+        file (object): file opened in text mode
+        read_size (int): number of characters read from file at once
+        max_record_size (int): number of characters of the largest value decoded
+        """
+        self.file = file
+        self.read_size = read_size
+        self.max_record_size = max_record_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+        # offset in the file of the start of the buffer
+        self.offset = 0
+        self.eof = False
+
+    def fill(self, size=0):
+        """
+        Drop consumed characters and read the next block of the file,
+        of at least size characters if given.
+        Return False if the end of file is reached.
+        """
+        chunk = self.file.read(max(self.read_size, size))
+        if not chunk:
+            self.eof = True
+            return False
+        self.offset += self.pos
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """
+        Skip whitespace and return the next character without consuming it.
+        Return empty string at the end of file.
+        """
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return ''
+
+    def next_char(self):
+        """
+        Consume and return the next non-whitespace character
+        """
+        char = self.peek()
+        self.pos += len(char)
+        return char
+
+    def expect(self, expected):
+        """
+        Consume the next non-whitespace character, which must be the expected one
+        """
+        char = self.next_char()
+        if char != expected:
+            raise ValueError(f'Expected {expected!r} but found {char!r} in JSON file')
+
+    def decode_value(self):
+        """
+        Decode and return the next complete JSON value.
+        ValueError is raised with the offset of the value if it is malformed, or if it is
+        not complete within max_record_size characters, so a malformed value is not
+        searched for its end through the rest of the file.
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError as error:
+                # value is incomplete, read more unless file has ended
+                pending = len(self.buffer) - self.pos
+                if pending >= self.max_record_size:
+                    raise ValueError(f'JSON value at offset {self.offset + self.pos} is '
+                                     f'malformed or larger than {self.max_record_size} '
+                                     f'characters') from error
+                # read as much as is pending, so values are decoded again
+                # a logarithmic number of times
+                if self.eof or not self.fill(min(pending, self.max_record_size - pending)):
+                    raise ValueError(f'Malformed JSON value at offset '
+                                     f'{self.offset + self.pos}: {error.msg}') from error
+                continue
+            if not self.eof and (end == len(self.buffer) or self.buffer[end] not in DELIMITERS) \
+                    and self.fill():
+                # a number may continue in the next block
+                continue
+            self.pos = end
+            return value
+
+
+def iter_library_records(file):
+    """
+    Yield (section, dict) pairs from a JSON file shaped as {'books': [...], 'authors': [...]},
+    with 'deleted_books'/'deleted_authors' arrays in incremental exports.
+    Values of other keys are skipped. ValueError is raised for malformed content.
+
+    Parameters:
+    file (object): file opened in text mode
+    """
+    parser = StreamParser(file)
+    if parser.peek() != '{':
+        raise ValueError('Content of JSON file is not a dict')
+    parser.expect('{')
+    if parser.peek() == '}':
+        return
+    while True:
+        section = parser.decode_value()
+        parser.expect(':')
+        if section in LIBRARY_SECTIONS and parser.peek() == '[':
+            parser.expect('[')
+            if parser.peek() == ']':
+                parser.expect(']')
+            else:
+                while True:
+                    yield section, parser.decode_value()
+                    separator = parser.next_char()
+                    if separator == ']':
+                        break
+                    if separator != ',':
+                        raise ValueError(f'Expected "," or "]" in array {section}')
+        else:
+            parser.decode_value()
+        separator = parser.next_char()
+        if separator == '}':
+            return
+        if separator != ',':
+            raise ValueError('Expected "," or "}" in JSON file')
+
+
+def iter_ndjson_records(file):
+    """
+    Yield (section, dict) pairs from a newline-delimited JSON file.
+    Section of a line is given by its 'type' key ('book', 'author', 'deleted_book',
+    'deleted_author' or 'watermark'), otherwise it is inferred from book_id/author_id.
+
+    Parameters:
+    file (object): file opened in text mode
+    """
+    for line in file:
+        line = line.strip()
+        if not line:
+            continue
+        yield record_section(json.loads(line))
+
+
+def iter_bson_records(file):
+    """
+    Yield (section, dict) pairs from a BSON dump, each document tagged
+    like a newline-delimited JSON record. ValueError is raised for malformed content.
+
+    Parameters:
+    file (object): file opened in binary mode
+    """
+    try:
+        for doc in bson.decode_file_iter(file):
+            yield record_section(doc)
+    except InvalidBSON as error:
+        raise ValueError(f'Invalid BSON document: {error}') from error
+
+
+def record_section(dic):
+    """
+    Return (section, dict) of a single NDJSON record, section is None if unknown
+    """
+    if not isinstance(dic, dict):
+        return None, dic
+    record_type = dic.pop(NDJSON_TYPE_KEY, None)
+    if record_type in NDJSON_TYPES:
+        return NDJSON_TYPES[record_type], dic
+    if 'book_id' in dic:
+        return 'books', dic
+    if 'author_id' in dic:
+        return 'authors', dic
+    return None, dic
+
+
+def is_ndjson_file(file_name):
+    """
+    Check whether the file name has a newline-delimited JSON extension,
+    ignoring the extension of compression
+    """
+    return strip_compression(file_name).lower().endswith(NDJSON_EXTENSIONS)
+
+
+def is_bson_file(file_name):
+    """
+    Check whether the file name has a BSON extension, ignoring the extension of compression
+    """
+    return strip_compression(file_name).lower().endswith(BSON_EXTENSION)
+
+
+def strip_compression(file_name):
+    """
+    Remove the extension of compression (.gz or .xz) from the file name
+    """
+    root, extension = os.path.splitext(file_name)
+    if extension.lower() in COMPRESSION_EXTENSIONS:
+        return root
+    return file_name
+
+
+def file_compression(file_name, mode='r'):
+    """
+    Return the compression of the file, 'gzip', 'xz' or None.
+    Files to read are detected by their magic bytes, files to write by their extension.
+    """
+    if 'r' in mode:
+        with open(file_name, 'rb') as file:
+            head = file.read(max(len(magic) for magic in COMPRESSION_MAGIC.values()))
+        for compression, magic in COMPRESSION_MAGIC.items():
+            if head.startswith(magic):
+                return compression
+        return None
+    return COMPRESSION_EXTENSIONS.get(os.path.splitext(file_name)[1].lower())
+
+
+def open_library_file(file_name, mode='rt', buffering=-1):
+    """
+    Open a library file for reading or writing, decompressing or compressing it
+    with gzip or xz when needed.
+
+    Parameters:
+    file_name (str): path of the file
+    mode (str): 'rt', 'wt', 'rb' or 'wb'
+    buffering (int): buffer size of uncompressed files
+    """
+    compression = file_compression(file_name, mode)
+    if compression == GZIP:
+        return gzip.open(file_name, mode, compresslevel=GZIP_LEVEL)
+    if compression == XZ:
+        return lzma.open(file_name, mode)
+    return open(file_name, mode, buffering=buffering)
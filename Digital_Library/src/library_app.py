@@ -3,25 +3,62 @@ Web api using flask which supports GET, PUT, POST, DELETE.
 Error message and HTTP status code (200, 400, 415, 404) is returned if error occurs in web api.
 Only error message is returned if functions in this file is used in other local files.
 """
+import itertools
 import json
+import math
+from concurrent.futures import ThreadPoolExecutor
 
-from flask import Flask, jsonify, request, make_response, render_template
-from bson.json_util import dumps
+from flask import Flask, Response, jsonify, request, make_response, render_template
+from bson.json_util import dumps, default
 
-from src.database import Database
+from src.database import Database, OUTPUT_PROJECTION, BOOKS_TABLE, AUTHORS_TABLE
+from src.result_cache import ResultCache
+from src.rating_stats import RatingStats, STAT_FIELDS, DEFAULT_BUCKET_WIDTHS, MIN_BUCKET_WIDTH
+from src.trigram_index import TrigramIndex, DEFAULT_FUZZY_LIMIT
+from src.prefix_index import PrefixIndex, DEFAULT_AUTOCOMPLETE_LIMIT
+from src.schema import BOOK_SCHEMA, AUTHOR_SCHEMA, BOOK_ATTRIBUTES, AUTHOR_ATTRIBUTES
 from src.book_scraper import is_book, scrape_book_page
 from src.author_scraper import is_author, scrape_author_page
-from src.query import query, check_content_type, MALFORMED_QUERY_STRING, OBJECT_NOT_EXIST, \
-    FIELD_NOT_EXIST, VALUE_TYPE_ERROR, OPERATOR_NOT_APPLICABLE
+from src.query import query_page, query_tables, explain_query, text_query, fuzzy_query, \
+    autocomplete_query, fields_projection, split_fields, normalize_query_string, is_error_occur, \
+    OBJECT_TABLES, MALFORMED_QUERY_STRING, OBJECT_NOT_EXIST, FIELD_NOT_EXIST, VALUE_TYPE_ERROR, \
+    OPERATOR_NOT_APPLICABLE
 
 app = Flask(__name__)
 mongo_db = Database()
+# responses of searches, dropped whenever their table is written
+result_cache = ResultCache()
+mongo_db.add_write_listener(result_cache.invalidate)
+# statistics of ratings, refreshed with the books/authors written since they were computed
+rating_stats = RatingStats(mongo_db)
+# trigrams of titles/names for searches tolerating typos
+trigram_index = TrigramIndex(mongo_db)
+# keys of titles/names sorted for search as you type
+prefix_index = PrefixIndex(mongo_db)
 
 DEFAULT_INPUT = -1
 OK = 200
 BAD_REQUEST = 400
 NOT_FOUND = 404
 UNSUPPORTED_MEDIA_TYPE = 415
+TRUE_STRINGS = ('true', '1')
+MAX_PAGE_SIZE = 1000
+MAX_BATCH_QUERIES = 50
+# threads running the query strings of one batch
+MAX_BATCH_WORKERS = 8
+DEFAULT_TOP_K = 10
+MAX_TOP_K = 1000
+# number of documents serialized into one chunk of a streamed response
+STREAM_BATCH_SIZE = 100
+JSON_FORMAT = 'json'
+NDJSON_FORMAT = 'ndjson'
+FORMAT_MIMETYPES = {JSON_FORMAT: 'application/json', NDJSON_FORMAT: 'application/x-ndjson'}
+NEXT_AFTER_HEADER = 'X-Next-After'
+QUERY_ERROR_MESSAGES = {MALFORMED_QUERY_STRING: 'Malformed query strings',
+                        OBJECT_NOT_EXIST: 'Object in json is incorrect',
+                        FIELD_NOT_EXIST: 'Field in json or fields is incorrect',
+                        VALUE_TYPE_ERROR: 'Value type of the field should be number',
+                        OPERATOR_NOT_APPLICABLE: 'Comparison operators not applicable for string'}
 
 
 @app.route('/')
@@ -64,28 +101,35 @@ def top_books_page():
     return render_template('top_books.html')
 
 
-# http://127.0.0.1:5000/api/book?id={attr_value} Example: /book?id=3735293
+# http://127.0.0.1:5000/api/book?id={attr_value}&fields={fields} Example: /book?id=3735293
 @app.route('/api/book', methods=['GET'])
-def get_book_by_id(book_id_input=DEFAULT_INPUT):
+def get_book_by_id(book_id_input=DEFAULT_INPUT, fields_input=DEFAULT_INPUT):
     """
-    Get the book info by book id.
+    Get the book info by book id, only the comma separated fields if fields are given.
     Error should be reported with HTTP status code BAD_REQUEST if provided parameter is invalid.
     Error should be reported with HTTP status code NOT_FOUND if no such ID is found.
 
     Parameters:
     book_id_input (str): book id for api given from local
+    fields_input (str): comma separated fields for api given from local
     """
     to_web = True
     if book_id_input != DEFAULT_INPUT:
         arg = book_id_input
+        fields = None if fields_input == DEFAULT_INPUT else fields_input
         to_web = False
     else:
         arg = request.args.get('id')
+        fields = request.args.get('fields')
     if not arg.isnumeric():
         return proceed_to_output({'GET error': f'Book id {arg} is not valid'}, BAD_REQUEST, to_web)
+    projection = fields_projection(fields, BOOK_ATTRIBUTES)
+    if is_error_occur(projection):
+        return proceed_to_output({'GET error': f'Fields {fields} are not valid'},
+                                 BAD_REQUEST, to_web)
     book_id = arg
-    book_doc = mongo_db.books_tb.find_one({'book_id': book_id}, {'_id': 0})
-    if not book_doc:
+    book_doc = mongo_db.books_tb.find_one({'book_id': book_id}, projection)
+    if book_doc is None:
         return proceed_to_output({'GET error': f'Book with id {book_id} is not found'},
                                  NOT_FOUND, to_web)
     # ready for service
@@ -93,29 +137,36 @@ def get_book_by_id(book_id_input=DEFAULT_INPUT):
     return proceed_to_output(book, OK, to_web)
 
 
-# http://127.0.0.1:5000/api/author?id={attr_value} Example: /author?id=45372
+# http://127.0.0.1:5000/api/author?id={attr_value}&fields={fields} Example: /author?id=45372
 @app.route('/api/author', methods=['GET'])
-def get_author_by_id(author_id_input=DEFAULT_INPUT):
+def get_author_by_id(author_id_input=DEFAULT_INPUT, fields_input=DEFAULT_INPUT):
     """
-    Get the author info by author id.
+    Get the author info by author id, only the comma separated fields if fields are given.
     Error should be reported with HTTP status code BAD_REQUEST if provided parameter is invalid.
     Error should be reported with HTTP status code NOT_FOUND if no such ID is found.
 
     Parameters:
     author_id_input (str): author id for api given from local
+    fields_input (str): comma separated fields for api given from local
     """
     to_web = True
     if author_id_input != DEFAULT_INPUT:
         arg = author_id_input
+        fields = None if fields_input == DEFAULT_INPUT else fields_input
         to_web = False
     else:
         arg = request.args.get('id')
+        fields = request.args.get('fields')
     if not arg.isnumeric():
         return proceed_to_output({'GET error': f'Author id {arg} is not valid'},
                                  BAD_REQUEST, to_web)
+    projection = fields_projection(fields, AUTHOR_ATTRIBUTES)
+    if is_error_occur(projection):
+        return proceed_to_output({'GET error': f'Fields {fields} are not valid'},
+                                 BAD_REQUEST, to_web)
     author_id = arg
-    author_doc = mongo_db.authors_tb.find_one({'author_id': author_id}, {'_id': 0})
-    if not author_doc:
+    author_doc = mongo_db.authors_tb.find_one({'author_id': author_id}, projection)
+    if author_doc is None:
         return proceed_to_output({'GET error': f'Author with id {author_id} is not found'},
                                  NOT_FOUND, to_web)
     # ready for service
@@ -123,50 +174,511 @@ def get_author_by_id(author_id_input=DEFAULT_INPUT):
     return proceed_to_output(author, OK, to_web)
 
 
-# http://127.0.0.1:5000/api/search?q={query_string} Example: /search?q=book.id%3A123
+# http://127.0.0.1:5000/api/search?q={query_string}&limit={int}&after={id}&format={json|ndjson}
+# &fields={fields} Example: /search?q=book.id%3A123&fields=book_id,rating
 @app.route('/api/search', methods=['GET'])
-def get_by_query(query_string_input=DEFAULT_INPUT):
+def get_by_query(query_string_input=DEFAULT_INPUT, limit_input=DEFAULT_INPUT,
+                 after_input=DEFAULT_INPUT, fields_input=DEFAULT_INPUT):
     """
     Get search results based on the specified query string.
     Errors should be reported if invalid search query.
+    Results are streamed as a JSON array, or as newline-delimited JSON if format is ndjson.
+    If limit is given, at most limit results ordered by id are returned, and the id to pass
+    as after for the next page is in header X-Next-After if there are more results.
+    If fields are given, results only have these comma separated fields.
+    Responses are cached until one of the tables searched is written.
 
     Parameters:
     query_string_input (str): query string for api given from local
+    limit_input (str): maximum number of results for api given from local
+    after_input (str): id of the last result of the previous page for api given from local
+    fields_input (str): comma separated fields for api given from local
     """
     to_web = True
     if query_string_input != DEFAULT_INPUT:
         query_string = query_string_input
+        limit = None if limit_input == DEFAULT_INPUT else str(limit_input)
+        after = None if after_input == DEFAULT_INPUT else str(after_input)
+        output_format = JSON_FORMAT
+        fields = None if fields_input == DEFAULT_INPUT else fields_input
         to_web = False
     else:
         query_string = request.args.get('q')
+        limit = request.args.get('limit')
+        after = request.args.get('after')
+        output_format = request.args.get('format', JSON_FORMAT)
+        fields = request.args.get('fields')
+    page_error = check_page(limit, after)
+    if page_error is not None:
+        return proceed_to_output({'GET error': page_error}, BAD_REQUEST, to_web)
+    if output_format not in FORMAT_MIMETYPES:
+        return proceed_to_output({'GET error': f'Format {output_format} is not supported'},
+                                 BAD_REQUEST, to_web)
+    limit = int(limit) if limit is not None else 0
+    cache_key = (normalize_query_string(query_string), limit, after, fields, output_format)
+    if to_web:
+        cached = result_cache.get(cache_key)
+        if cached is not None:
+            return search_response(cached[0], output_format, cached[1])
+    # read before the query runs, so a result read during a write is not cached
+    tables = query_tables(query_string)
+    if is_error_occur(tables):
+        return proceed_to_output({'GET error': QUERY_ERROR_MESSAGES[tables]}, BAD_REQUEST, to_web)
+    generation = result_cache.generation(tables)
     # Parse and execute query string and get result documents
-    documents = query(query_string, mongo_db)
+    res = search_page(query_string, limit, after, fields)
     # Handle all the errors
-    if documents is None:
+    if is_error_occur(res):
+        return proceed_to_output({'GET error': QUERY_ERROR_MESSAGES[res]}, BAD_REQUEST, to_web)
+    documents, next_after = res
+    documents = iter(documents)
+    first_doc = next(documents, None)
+    if first_doc is None:
         return proceed_to_output({'GET error': 'Result is not found in database'},
                                  NOT_FOUND, to_web)
+    documents = itertools.chain([first_doc], documents)
+    if not to_web:
+        return [json.loads(dumps(doc)) for doc in documents]
+    chunks = cache_chunks(stream_documents(documents, output_format), cache_key, generation,
+                          next_after)
+    return search_response(chunks, output_format, next_after)
+
+
+def search_page(query_string, limit, after, fields):
+    """
+    Run the search and return (documents, id of the next page or None), or the error if any.
+    Documents are a cursor if limit is 0, otherwise the list of the page.
+
+    Parameters:
+    query_string (str): query string for search
+    limit (int): maximum number of results, 0 for no limit
+    after (str): id of the last result of the previous page, None for the first page
+    fields (str): comma separated fields of results, None for all fields
+    """
+    res = query_page(query_string, mongo_db, limit + 1 if limit else 0, after, fields)
+    if is_error_occur(res):
+        return res
+    id_key, documents = res
+    next_after = None
+    if limit:
+        # one more result than the page tells whether there is a next page
+        page = list(documents)
+        if len(page) > limit:
+            page = page[:limit]
+            next_after = page[-1][id_key]
+        if fields is not None and id_key not in split_fields(fields):
+            # the id is only projected to find the next page
+            for doc in page:
+                del doc[id_key]
+        documents = page
+    return documents, next_after
+
+
+def search_response(chunks, output_format, next_after):
+    """
+    Response of a search streaming the chunks, with the id of the next page if any
+    """
+    response = Response(chunks, mimetype=FORMAT_MIMETYPES[output_format])
+    if next_after is not None:
+        response.headers[NEXT_AFTER_HEADER] = next_after
+    return response
+
+
+def cache_chunks(chunks, cache_key, generation, next_after):
+    """
+    Generate the chunks of a search response and cache the whole response once it is sent.
+    Chunks are only kept while they fit in the cache, so large results are not cached.
+
+    Parameters:
+    chunks (iterator): chunks of the response
+    cache_key (tuple): key of the search in the cache
+    generation (dict): generation of the tables the results are read from,
+                       read before the search
+    next_after (str): id of the next page, None if there is none
+    """
+    kept = []
+    size = 0
+    for chunk in chunks:
+        if kept is not None:
+            size += len(chunk)
+            if size <= result_cache.max_bytes:
+                kept.append(chunk)
+            else:
+                kept = None
+        yield chunk
+    if kept is not None:
+        result_cache.put(cache_key, generation, (''.join(kept), next_after), size)
+
+
+# http://127.0.0.1:5000/api/search/batch?limit={int}&fields={fields}
+# Example: POST ["book.rating:>4", "author.name:Martin"] to /search/batch?limit=20
+@app.route('/api/search/batch', methods=['POST'])
+def post_search_batch(json_file_input=DEFAULT_INPUT, limit_input=DEFAULT_INPUT,
+                      fields_input=DEFAULT_INPUT):
+    """
+    Run the list of query strings in the json concurrently, and return one entry per query
+    string in the same order: the query string with its results, or with the error message
+    and error code of the query string.
+    Limit and fields apply to every query string like in api/search, and the id to search
+    after for the next page is in next_after if a query string has more results.
+    Error should be reported if the json is not a list of 1 to MAX_BATCH_QUERIES queries.
+    Error should be reported with HTTP status code UNSUPPORTED_MEDIA_TYPE if content type header
+    is not application/json.
+
+    Parameters:
+    json_file_input (str): json file for api given from local
+    limit_input (str): maximum number of results per query string for api given from local
+    fields_input (str): comma separated fields for api given from local
+    """
+    to_web = True
+    # Get json content
+    if json_file_input != DEFAULT_INPUT:
+        to_web = False
+        limit = None if limit_input == DEFAULT_INPUT else str(limit_input)
+        fields = None if fields_input == DEFAULT_INPUT else fields_input
+        with open(json_file_input, 'r') as file:
+            try:
+                json_content = json.load(file)
+            except ValueError:
+                return proceed_to_output('Invalid JSON file: File given is not a valid JSON file',
+                                         BAD_REQUEST, to_web)
+    else:
+        if not is_content_type_json():
+            return proceed_to_output({'POST error': 'Content type header is not application/json'},
+                                     UNSUPPORTED_MEDIA_TYPE, to_web)
+        json_content = request.json
+        limit = request.args.get('limit')
+        fields = request.args.get('fields')
+    if not isinstance(json_content, list):
+        return proceed_to_output({'JSON structure error': 'Content of json is not a list'},
+                                 BAD_REQUEST, to_web)
+    if not 1 <= len(json_content) <= MAX_BATCH_QUERIES:
+        return proceed_to_output({'POST error': f'Batch should have 1 to {MAX_BATCH_QUERIES} '
+                                                f'query strings'}, BAD_REQUEST, to_web)
+    page_error = check_page(limit, None)
+    if page_error is not None:
+        return proceed_to_output({'POST error': page_error}, BAD_REQUEST, to_web)
+    limit = int(limit) if limit is not None else 0
+    # the same query string is run once
+    query_strings = list(dict.fromkeys(query_string for query_string in json_content
+                                       if isinstance(query_string, str)))
+    results = {}
+    if query_strings:
+        with ThreadPoolExecutor(max_workers=min(len(query_strings),
+                                                MAX_BATCH_WORKERS)) as executor:
+            futures = [executor.submit(batch_search, query_string, limit, fields)
+                       for query_string in query_strings]
+            results = dict(zip(query_strings, (future.result() for future in futures)))
+    response = []
+    for query_string in json_content:
+        res = results.get(query_string) if isinstance(query_string, str) \
+            else MALFORMED_QUERY_STRING
+        if is_error_occur(res):
+            response.append({'query': query_string, 'error': QUERY_ERROR_MESSAGES[res],
+                             'code': res})
+            continue
+        entry = {'query': query_string, 'results': res[0]}
+        if res[1] is not None:
+            entry['next_after'] = res[1]
+        response.append(entry)
+    return proceed_to_output(response, OK, to_web)
+
+
+def batch_search(query_string, limit, fields):
+    """
+    Run one query string of a batch and return (results, id of the next page or None),
+    or the error if any. Results are read from the cursor in the thread of the query string.
+    """
+    res = search_page(query_string, limit, None, fields)
+    if is_error_occur(res):
+        return res
+    return json.loads(dumps(list(res[0]))), res[1]
+
+
+# http://127.0.0.1:5000/api/search/explain?q={query_string}&limit={int}&after={id}
+# Example: /search/explain?q=book.rating%3A>4
+@app.route('/api/search/explain', methods=['GET'])
+def get_query_explain(query_string_input=DEFAULT_INPUT, limit_input=DEFAULT_INPUT,
+                      after_input=DEFAULT_INPUT):
+    """
+    Explain the search of the query string: compiled filter, whether the plan cache was hit,
+    parse time, index used, documents examined vs returned and execution time.
+    Errors should be reported if invalid search query.
+
+    Parameters:
+    query_string_input (str): query string for api given from local
+    limit_input (str): maximum number of results for api given from local
+    after_input (str): id of the last result of the previous page for api given from local
+    """
+    to_web = True
+    if query_string_input != DEFAULT_INPUT:
+        query_string = query_string_input
+        limit = None if limit_input == DEFAULT_INPUT else str(limit_input)
+        after = None if after_input == DEFAULT_INPUT else str(after_input)
+        to_web = False
+    else:
+        query_string = request.args.get('q')
+        limit = request.args.get('limit')
+        after = request.args.get('after')
+    page_error = check_page(limit, after)
+    if page_error is not None:
+        return proceed_to_output({'GET error': page_error}, BAD_REQUEST, to_web)
+    res = explain_query(query_string, mongo_db, int(limit) if limit is not None else 0, after)
+    if is_error_occur(res):
+        return proceed_to_output({'GET error': QUERY_ERROR_MESSAGES[res]}, BAD_REQUEST, to_web)
+    return proceed_to_output(json.loads(dumps(res)), OK, to_web)
+
+
+def check_page(limit, after):
+    """
+    Return the error message of invalid limit or after of a search, None if both are valid
+    """
+    # isdecimal() since int() rejects other numeric characters such as '²'
+    if limit is not None and not (limit.isdecimal() and 0 < int(limit) <= MAX_PAGE_SIZE):
+        return f'Limit should be from 1 to {MAX_PAGE_SIZE}'
+    if after is not None and not after.isnumeric():
+        return f'Id {after} to search after is not valid'
+    return None
+
+
+def stream_documents(documents, output_format):
+    """
+    Generate the chunks of documents serialized as a JSON array or newline-delimited JSON.
+    Documents are read from the cursor while the response is sent, so memory is bounded
+    by STREAM_BATCH_SIZE documents however many results there are.
+
+    Parameters:
+    documents (iterator): documents to serialize
+    output_format (str): 'json' or 'ndjson'
+    """
+    separator = '\n' if output_format == NDJSON_FORMAT else ',\n'
+    if output_format == JSON_FORMAT:
+        yield '['
+    is_first = True
+    while True:
+        batch = [json.dumps(doc, default=default)
+                 for doc in itertools.islice(documents, STREAM_BATCH_SIZE)]
+        if not batch:
+            break
+        if output_format == NDJSON_FORMAT:
+            yield separator.join(batch) + separator
+        else:
+            yield ('' if is_first else separator) + separator.join(batch)
+        is_first = False
+    if output_format == JSON_FORMAT:
+        yield ']\n'
+
+
+# http://127.0.0.1:5000/api/search/text?object={book|author}&q={words}&rank={true|false}
+# Example: /search/text?object=book&q=clean%20code&rank=true
+@app.route('/api/search/text', methods=['GET'])
+def get_by_text(obj_input=DEFAULT_INPUT, search_input=DEFAULT_INPUT, rank_input=DEFAULT_INPUT):
+    """
+    Get books/authors whose title/name or similar/related lists contain any of the words,
+    found through the full-text index. Results are sorted by relevance if rank is true.
+    Errors should be reported if object or words are invalid.
+
+    Parameters:
+    obj_input (str): 'book' or 'author' for api given from local
+    search_input (str): words to search for api given from local
+    rank_input (str): 'true' to rank results for api given from local
+    """
+    to_web = True
+    if search_input != DEFAULT_INPUT:
+        obj = obj_input
+        search = search_input
+        rank = rank_input
+        to_web = False
+    else:
+        obj = request.args.get('object')
+        search = request.args.get('q')
+        rank = request.args.get('rank', '')
+    documents = text_query(obj, search, mongo_db, str(rank).lower() in TRUE_STRINGS)
     if documents == MALFORMED_QUERY_STRING:
-        return proceed_to_output({'GET error': 'Malformed query strings'}, BAD_REQUEST, to_web)
+        return proceed_to_output({'GET error': 'No words to search'}, BAD_REQUEST, to_web)
     if documents == OBJECT_NOT_EXIST:
-        return proceed_to_output({'GET error': 'Object in json is incorrect'}, BAD_REQUEST, to_web)
-    if documents == FIELD_NOT_EXIST:
-        return proceed_to_output({'GET error': 'Field in json is incorrect'}, BAD_REQUEST, to_web)
-    if documents == VALUE_TYPE_ERROR:
-        return proceed_to_output({'GET error': 'Value type of the field should be number'},
-                                 BAD_REQUEST, to_web)
-    if documents == OPERATOR_NOT_APPLICABLE:
-        return proceed_to_output({'GET error': 'Comparison operators not applicable for string'},
-                                 BAD_REQUEST, to_web)
-    if documents.count() == 0:
+        return proceed_to_output({'GET error': f'Object {obj} is incorrect'}, BAD_REQUEST, to_web)
+    res = json.loads(dumps(list(documents)))
+    if not res:
+        return proceed_to_output({'GET error': 'Result is not found in database'},
+                                 NOT_FOUND, to_web)
+    return proceed_to_output(res, OK, to_web)
+
+
+# http://127.0.0.1:5000/api/search/fuzzy?object={book|author}&q={title/name}&limit={int}
+# Example: /search/fuzzy?object=book&q=Refactorng
+@app.route('/api/search/fuzzy', methods=['GET'])
+def get_by_fuzzy(obj_input=DEFAULT_INPUT, search_input=DEFAULT_INPUT, limit_input=DEFAULT_INPUT):
+    """
+    Get books/authors whose title/name is similar to the search even if it is misspelled,
+    found through the trigram index, the most similar first with their similarity as 'score'.
+    Errors should be reported if object, search or limit are invalid.
+
+    Parameters:
+    obj_input (str): 'book' or 'author' for api given from local
+    search_input (str): title/name to search for api given from local
+    limit_input (str): maximum number of results for api given from local
+    """
+    to_web = True
+    if search_input != DEFAULT_INPUT:
+        obj = obj_input
+        search = search_input
+        limit = str(DEFAULT_FUZZY_LIMIT) if limit_input == DEFAULT_INPUT else str(limit_input)
+        to_web = False
+    else:
+        obj = request.args.get('object')
+        search = request.args.get('q')
+        limit = request.args.get('limit', str(DEFAULT_FUZZY_LIMIT))
+    limit_error = check_page(limit, None)
+    if limit_error is not None:
+        return proceed_to_output({'GET error': limit_error}, BAD_REQUEST, to_web)
+    res = fuzzy_query(obj, search, trigram_index, int(limit))
+    if res == MALFORMED_QUERY_STRING:
+        return proceed_to_output({'GET error': 'No words to search'}, BAD_REQUEST, to_web)
+    if res == OBJECT_NOT_EXIST:
+        return proceed_to_output({'GET error': f'Object {obj} is incorrect'}, BAD_REQUEST, to_web)
+    res = json.loads(dumps(res))
+    if not res:
         return proceed_to_output({'GET error': 'Result is not found in database'},
                                  NOT_FOUND, to_web)
-    # Process output
-    res = []
-    for doc in documents:
-        res.append(json.loads(dumps(doc)))
     return proceed_to_output(res, OK, to_web)
 
 
+# http://127.0.0.1:5000/api/autocomplete?object={book|author}&q={prefix}&limit={int}
+# Example: /autocomplete?object=book&q=clean%20c
+@app.route('/api/autocomplete', methods=['GET'])
+def get_autocomplete(obj_input=DEFAULT_INPUT, prefix_input=DEFAULT_INPUT,
+                     limit_input=DEFAULT_INPUT):
+    """
+    Get id, title/name and rating count of the books/authors whose title/name, or a word
+    of it, starts with the prefix, ranked by rating count, from the prefix index in memory.
+    Errors should be reported if object, prefix or limit are invalid.
+
+    Parameters:
+    obj_input (str): 'book' or 'author' for api given from local
+    prefix_input (str): start of the title/name for api given from local
+    limit_input (str): maximum number of results for api given from local
+    """
+    to_web = True
+    if prefix_input != DEFAULT_INPUT:
+        obj = obj_input
+        prefix = prefix_input
+        limit = str(DEFAULT_AUTOCOMPLETE_LIMIT) if limit_input == DEFAULT_INPUT \
+            else str(limit_input)
+        to_web = False
+    else:
+        obj = request.args.get('object')
+        prefix = request.args.get('q')
+        limit = request.args.get('limit', str(DEFAULT_AUTOCOMPLETE_LIMIT))
+    limit_error = check_page(limit, None)
+    if limit_error is not None:
+        return proceed_to_output({'GET error': limit_error}, BAD_REQUEST, to_web)
+    res = autocomplete_query(obj, prefix, prefix_index, int(limit))
+    if res == MALFORMED_QUERY_STRING:
+        return proceed_to_output({'GET error': 'No prefix to complete'}, BAD_REQUEST, to_web)
+    if res == OBJECT_NOT_EXIST:
+        return proceed_to_output({'GET error': f'Object {obj} is incorrect'}, BAD_REQUEST, to_web)
+    if not res:
+        return proceed_to_output({'GET error': 'Result is not found in database'},
+                                 NOT_FOUND, to_web)
+    return proceed_to_output(res, OK, to_web)
+
+
+# http://127.0.0.1:5000/api/top-books?k={int} Example: /top-books?k=20
+@app.route('/api/top-books', methods=['GET'])
+def get_top_books(k_input=DEFAULT_INPUT):
+    """
+    Get id, title and rating of the k books with the highest ratings, in descending order.
+    Error should be reported with HTTP status code BAD_REQUEST if k is invalid.
+
+    Parameters:
+    k_input (str): number of books for api given from local
+    """
+    return get_top_rated(BOOKS_TABLE, k_input)
+
+
+# http://127.0.0.1:5000/api/top-authors?k={int} Example: /top-authors?k=20
+@app.route('/api/top-authors', methods=['GET'])
+def get_top_authors(k_input=DEFAULT_INPUT):
+    """
+    Get id, name and rating of the k authors with the highest ratings, in descending order.
+    Error should be reported with HTTP status code BAD_REQUEST if k is invalid.
+
+    Parameters:
+    k_input (str): number of authors for api given from local
+    """
+    return get_top_rated(AUTHORS_TABLE, k_input)
+
+
+def get_top_rated(table_name, k_input):
+    """
+    Get the top rated books/authors, ranked by the database instead of the pages.
+
+    Parameters:
+    table_name (str): BOOKS_TABLE or AUTHORS_TABLE
+    k_input (str): number of books/authors for api given from local
+    """
+    to_web = True
+    if k_input != DEFAULT_INPUT:
+        k = str(k_input)
+        to_web = False
+    else:
+        k = request.args.get('k', str(DEFAULT_TOP_K))
+    # isdecimal() since int() rejects other numeric characters such as '½'
+    if not k.isdecimal() or not 1 <= int(k) <= MAX_TOP_K:
+        return proceed_to_output({'GET error': f'k should be from 1 to {MAX_TOP_K}'},
+                                 BAD_REQUEST, to_web)
+    docs = json.loads(dumps(mongo_db.top_rated(table_name, int(k))))
+    return proceed_to_output(docs, OK, to_web)
+
+
+# http://127.0.0.1:5000/api/stats?object={book|author}&field={field}&bucket={width}
+# Example: /stats?object=book&field=rating&bucket=0.25
+@app.route('/api/stats', methods=['GET'])
+def get_stats(obj_input=DEFAULT_INPUT, field_input=DEFAULT_INPUT, bucket_input=DEFAULT_INPUT):
+    """
+    Get count, mean, min, max, percentiles and histogram of rating, rating_count or
+    review_count of all books/authors. Statistics are kept up to date with writes
+    without reading the whole table again.
+    Errors should be reported if object, field or bucket width are invalid.
+
+    Parameters:
+    obj_input (str): 'book' or 'author' for api given from local
+    field_input (str): field of the statistics for api given from local
+    bucket_input (str): width of histogram buckets for api given from local
+    """
+    to_web = True
+    if obj_input != DEFAULT_INPUT:
+        obj = obj_input
+        field = 'rating' if field_input == DEFAULT_INPUT else field_input
+        bucket = None if bucket_input == DEFAULT_INPUT else str(bucket_input)
+        to_web = False
+    else:
+        obj = request.args.get('object')
+        field = request.args.get('field', 'rating')
+        bucket = request.args.get('bucket')
+    if obj not in OBJECT_TABLES:
+        return proceed_to_output({'GET error': f'Object {obj} is incorrect'}, BAD_REQUEST, to_web)
+    if field not in STAT_FIELDS:
+        return proceed_to_output({'GET error': f'Statistics of {field} are not supported'},
+                                 BAD_REQUEST, to_web)
+    try:
+        bucket_width = DEFAULT_BUCKET_WIDTHS[field] if bucket is None else float(bucket)
+    except ValueError:
+        bucket_width = 0
+    if not bucket_width >= MIN_BUCKET_WIDTH or math.isinf(bucket_width):
+        return proceed_to_output({'GET error': f'Bucket width {bucket} is not valid'},
+                                 BAD_REQUEST, to_web)
+    try:
+        stats = rating_stats.stats(OBJECT_TABLES[obj], field, bucket_width)
+    except ValueError:
+        # too many buckets between the values to number them
+        return proceed_to_output({'GET error': f'Bucket width {bucket} is not valid'},
+                                 BAD_REQUEST, to_web)
+    return proceed_to_output(dict(stats, object=obj, field=field, bucket_width=bucket_width),
+                             OK, to_web)
+
+
 # http://127.0.0.1:5000/api/book?id={attr_value}
 @app.route('/api/book', methods=['PUT'])
 def put_book_by_id(book_id_input=DEFAULT_INPUT, json_file_input=DEFAULT_INPUT):
@@ -192,7 +704,7 @@ def put_book_by_id(book_id_input=DEFAULT_INPUT, json_file_input=DEFAULT_INPUT):
     if not arg.isnumeric():
         return proceed_to_output({'PUT error': f'Book id {arg} is not valid'}, BAD_REQUEST, to_web)
     book_id = arg
-    book_doc = mongo_db.books_tb.find_one({'book_id': book_id}, {'_id': 0})
+    book_doc = mongo_db.books_tb.find_one({'book_id': book_id}, OUTPUT_PROJECTION)
     if not book_doc:
         return proceed_to_output({'PUT error': f'Book with id {book_id} is not found'},
                                  NOT_FOUND, to_web)
@@ -213,11 +725,12 @@ def put_book_by_id(book_id_input=DEFAULT_INPUT, json_file_input=DEFAULT_INPUT):
     if not isinstance(book_dic, dict):
         return proceed_to_output({'JSON structure error': 'Content of json is not a dict'},
                                  BAD_REQUEST, to_web)
-    if not is_dict_value_type_valid(book_dic):
-        return proceed_to_output({'JSON content error': 'Incorrect value type in json'},
-                                 BAD_REQUEST, to_web)
     book_dic['book_id'] = book_id
-    mongo_db.update_books_tb_from_json(book_dic)
+    report = BOOK_SCHEMA.validate(book_dic)
+    if report['errors']:
+        return proceed_to_output(content_error(report), BAD_REQUEST, to_web)
+    BOOK_SCHEMA.print_report(report)
+    mongo_db.update_books_tb_attributes(report['document'])
     return proceed_to_output({'PUT success': f'Book with id {book_id} is updated'}, OK, to_web)
 
 
@@ -245,7 +758,7 @@ def put_author_by_id(author_id_input=DEFAULT_INPUT, json_file_input=DEFAULT_INPU
         return proceed_to_output({'PUT error': f'Author id {arg} is not valid'},
                                  BAD_REQUEST, to_web)
     author_id = arg
-    author_doc = mongo_db.authors_tb.find_one({'author_id': author_id}, {'_id': 0})
+    author_doc = mongo_db.authors_tb.find_one({'author_id': author_id}, OUTPUT_PROJECTION)
     if not author_doc:
         return proceed_to_output({'PUT error': f'Author with id {author_id} is not found'},
                                  NOT_FOUND, to_web)
@@ -266,11 +779,12 @@ def put_author_by_id(author_id_input=DEFAULT_INPUT, json_file_input=DEFAULT_INPU
     if not isinstance(author_dic, dict):
         return proceed_to_output({'JSON structure error': 'Content of json is not a dict'},
                                  BAD_REQUEST, to_web)
-    if not is_dict_value_type_valid(author_dic):
-        return proceed_to_output({'JSON content error': 'Incorrect value type in json'},
-                                 BAD_REQUEST, to_web)
     author_dic['author_id'] = author_id
-    mongo_db.update_authors_tb_from_json(author_dic)
+    report = AUTHOR_SCHEMA.validate(author_dic)
+    if report['errors']:
+        return proceed_to_output(content_error(report), BAD_REQUEST, to_web)
+    AUTHOR_SCHEMA.print_report(report)
+    mongo_db.update_authors_tb_attributes(report['document'])
     return proceed_to_output({'PUT success': f'Author with id {author_id} is updated'}, OK, to_web)
 
 
@@ -308,10 +822,6 @@ def post_book(json_file_input=DEFAULT_INPUT):
         # If JSON is not a dict, error
         response_dic['JSON structure error'] = 'Content of json is not a dict'
         return proceed_to_output(response_dic, BAD_REQUEST, to_web)
-    if not is_dict_value_type_valid(book_dic):
-        # If dict value is not valid, error
-        response_dic['JSON content error'] = 'Incorrect value type in json'
-        return proceed_to_output(response_dic, BAD_REQUEST, to_web)
     if 'book_id' not in book_dic.keys():
         # If 'book_id' is not found in dict keys, error
         response_dic['JSON structure error'] = 'Found book dict with no book id'
@@ -321,12 +831,17 @@ def post_book(json_file_input=DEFAULT_INPUT):
         # If 'book_id' is empty, error
         response_dic['POST input error'] = 'Invalid book id'
         return proceed_to_output(response_dic, BAD_REQUEST, to_web)
+    report = BOOK_SCHEMA.validate(book_dic)
+    if report['errors']:
+        # If dict value is not valid, error
+        return proceed_to_output(content_error(report), BAD_REQUEST, to_web)
     if mongo_db.is_book_exist(book_dic):
         # If value of 'book_id' already exists, error
         response_dic['POST input error'] = f'Book with id {book_id} already exists'
         return proceed_to_output(response_dic, BAD_REQUEST, to_web)
     # For the book, insert if id does not exist in database
-    mongo_db.insert_books_tb_from_json(book_dic)
+    BOOK_SCHEMA.print_report(report)
+    mongo_db.insert_books_tb(report['document'])
     response_dic['POST success'] = f'Book with id {book_id} is inserted'
     return proceed_to_output(response_dic, OK, to_web)
 
@@ -365,22 +880,23 @@ def post_books(json_file_input=DEFAULT_INPUT):
         # If JSON is not a list, return with message
         response_dic['JSON structure error'] = 'Content of json is not a list'
         return proceed_to_output(response_dic, BAD_REQUEST, to_web)
-    for book_dic in array_books:
+    for book_dic, report in zip(array_books, BOOK_SCHEMA.validate_batch(array_books)):
         # For every book, insert if id is found
-        if 'book_id' not in book_dic.keys():
+        if not isinstance(book_dic, dict) or 'book_id' not in book_dic.keys():
             response_dic['JSON structure error'] = 'Found book dict with no book id'
             continue
-        if not is_dict_value_type_valid(book_dic):
-            response_dic['JSON content error'] = 'Incorrect value type in json'
-            continue
         book_id = book_dic['book_id']
         if not book_id:
             response_dic['POST input error'] = 'Invalid book id'
             continue
+        if report['errors']:
+            response_dic.update(content_error(report))
+            continue
         if mongo_db.is_book_exist(book_dic):
             response_dic['POST input error'] = f'Book with id {book_id} already exists'
             continue
-        mongo_db.insert_books_tb_from_json(book_dic)
+        BOOK_SCHEMA.print_report(report)
+        mongo_db.insert_books_tb(report['document'])
         response_dic[f'POST {book_id} success'] = f'Book with id {book_id} is inserted'
     return proceed_to_output(response_dic, OK, to_web)
 
@@ -419,10 +935,6 @@ def post_author(json_file_input=DEFAULT_INPUT):
         # If JSON is not a dict, error
         response_dic['JSON structure error'] = 'Content of json is not a dict'
         return proceed_to_output(response_dic, BAD_REQUEST, to_web)
-    if not is_dict_value_type_valid(author_dic):
-        # If dict value is not valid, error
-        response_dic['JSON content error'] = 'Incorrect value type in json'
-        return proceed_to_output(response_dic, BAD_REQUEST, to_web)
     if 'author_id' not in author_dic.keys():
         # If 'author_id' not in dict keys, error
         response_dic['JSON structure error'] = 'Found author dict with no author id'
@@ -432,12 +944,17 @@ def post_author(json_file_input=DEFAULT_INPUT):
         # If 'author_id' is empty, error
         response_dic['POST input error'] = 'Invalid author id'
         return proceed_to_output(response_dic, BAD_REQUEST, to_web)
+    report = AUTHOR_SCHEMA.validate(author_dic)
+    if report['errors']:
+        # If dict value is not valid, error
+        return proceed_to_output(content_error(report), BAD_REQUEST, to_web)
     if mongo_db.is_author_exist(author_dic):
         # If value of 'author_id' already exists, error
         response_dic['POST input error'] = f'Author with id {author_id} already exists'
         return proceed_to_output(response_dic, BAD_REQUEST, to_web)
     # For the author, insert if id does not exists in database
-    mongo_db.insert_authors_tb_from_json(author_dic)
+    AUTHOR_SCHEMA.print_report(report)
+    mongo_db.insert_authors_tb(report['document'])
     response_dic['POST success'] = f'Author with id {author_id} is inserted'
     return proceed_to_output(response_dic, OK, to_web)
 
@@ -476,22 +993,23 @@ def post_authors(json_file_input=DEFAULT_INPUT):
         # If JSON is not a list, return with message
         response_dic['JSON structure error'] = 'Content of json is not a list'
         return proceed_to_output(response_dic, BAD_REQUEST, to_web)
-    for author_dic in array_authors:
+    for author_dic, report in zip(array_authors, AUTHOR_SCHEMA.validate_batch(array_authors)):
         # For every book, insert if id is found
-        if 'author_id' not in author_dic.keys():
+        if not isinstance(author_dic, dict) or 'author_id' not in author_dic.keys():
             response_dic['JSON structure error'] = 'Found author dict with no author id'
             continue
-        if not is_dict_value_type_valid(author_dic):
-            response_dic['JSON content error'] = 'Incorrect value type in json'
-            continue
         author_id = author_dic['author_id']
         if not author_id:
             response_dic['POST input error'] = 'Invalid author id'
             continue
+        if report['errors']:
+            response_dic.update(content_error(report))
+            continue
         if mongo_db.is_author_exist(author_dic):
             response_dic['POST input error'] = f'Author with id {author_id} already exists'
             continue
-        mongo_db.insert_authors_tb_from_json(author_dic)
+        AUTHOR_SCHEMA.print_report(report)
+        mongo_db.insert_authors_tb(report['document'])
         response_dic[f'POST {author_id} success'] = f'Author with id {author_id} is inserted'
     return proceed_to_output(response_dic, OK, to_web)
 
@@ -571,12 +1089,12 @@ def delete_book_by_id(book_id_input=DEFAULT_INPUT):
         return proceed_to_output({'DELETE error': f'Book id {arg} is not valid'},
                                  BAD_REQUEST, to_web)
     book_id = arg
-    book_doc = mongo_db.books_tb.find_one({'book_id': book_id}, {'_id': 0})
+    book_doc = mongo_db.books_tb.find_one({'book_id': book_id}, OUTPUT_PROJECTION)
     if not book_doc:
         return proceed_to_output({'DELETE error': f'Book with id {book_id} is not found'},
                                  NOT_FOUND, to_web)
     # ready for service
-    mongo_db.books_tb.delete_one({'book_id': book_id})
+    mongo_db.delete_book(book_id)
     return proceed_to_output({'DELETE success': f'Book with id {book_id} is deleted'}, OK, to_web)
 
 
@@ -601,12 +1119,12 @@ def delete_author_by_id(author_id_input=DEFAULT_INPUT):
         return proceed_to_output({'DELETE error': f'Author id {arg} is not valid'},
                                  BAD_REQUEST, to_web)
     author_id = arg
-    author_doc = mongo_db.authors_tb.find_one({'author_id': author_id}, {'_id': 0})
+    author_doc = mongo_db.authors_tb.find_one({'author_id': author_id}, OUTPUT_PROJECTION)
     if not author_doc:
         return proceed_to_output({'DELETE error': f'Author with id {author_id} is not found'},
                                  NOT_FOUND, to_web)
     # ready for service
-    mongo_db.authors_tb.delete_one({'author_id': author_id})
+    mongo_db.delete_author(author_id)
     return proceed_to_output({'DELETE success': f'Author with id {author_id} is deleted'},
                              OK, to_web)
 
@@ -620,20 +1138,82 @@ def is_content_type_json():
     return False
 
 
-def is_dict_value_type_valid(dic):
+# http://127.0.0.1:5000/api/book/similar?id={attr_value} Example: /book/similar?id=3735293
+@app.route('/api/book/similar', methods=['GET'])
+def get_similar_books(book_id_input=DEFAULT_INPUT):
+    """
+    Get the similar books of the book specified by the ID.
+    Error should be reported with HTTP status code BAD_REQUEST if provided parameter is invalid.
+    Error should be reported with HTTP status code NOT_FOUND if no such ID is found.
+
+    Parameters:
+    book_id_input (str): book id for api given from local
+    """
+    return get_linked('similar_book', 'Book', book_id_input)
+
+
+# http://127.0.0.1:5000/api/author/related?id={attr_value} Example: /author/related?id=45372
+@app.route('/api/author/related', methods=['GET'])
+def get_related_authors(author_id_input=DEFAULT_INPUT):
+    """
+    Get the related authors of the author specified by the ID.
+    Error should be reported with HTTP status code BAD_REQUEST if provided parameter is invalid.
+    Error should be reported with HTTP status code NOT_FOUND if no such ID is found.
+
+    Parameters:
+    author_id_input (str): author id for api given from local
+    """
+    return get_linked('related_author', 'Author', author_id_input)
+
+
+# http://127.0.0.1:5000/api/author/books?id={attr_value} Example: /author/books?id=45372
+@app.route('/api/author/books', methods=['GET'])
+def get_author_books(author_id_input=DEFAULT_INPUT):
+    """
+    Get the books written by the author specified by the ID.
+    Error should be reported with HTTP status code BAD_REQUEST if provided parameter is invalid.
+    Error should be reported with HTTP status code NOT_FOUND if no such ID is found.
+
+    Parameters:
+    author_id_input (str): author id for api given from local
+    """
+    return get_linked('book_author', 'Author', author_id_input, reverse=True)
+
+
+def get_linked(rel, object_name, id_input, reverse=False):
     """
-    Check whether value type of the dict is string or list,
-    and whether fields supposed to store number indeed store number.
+    Get the books/authors linked with the book/author specified by the ID in links table.
 
     Parameters:
-    dic (dict): dictionary given to check its value type
+    rel (str): relation in links table
+    object_name (str): 'Book' or 'Author', object of the ID
+    id_input (str): id for api given from local
+    reverse (bool): follow the links backwards
+    """
+    to_web = True
+    if id_input != DEFAULT_INPUT:
+        arg = id_input
+        to_web = False
+    else:
+        arg = request.args.get('id')
+    if not arg.isnumeric():
+        return proceed_to_output({'GET error': f'{object_name} id {arg} is not valid'},
+                                 BAD_REQUEST, to_web)
+    doc_id = arg
+    table = mongo_db.books_tb if object_name == 'Book' else mongo_db.authors_tb
+    if not table.find_one({f'{object_name.lower()}_id': doc_id}, {'_id': 1}):
+        return proceed_to_output({'GET error': f'{object_name} with id {doc_id} is not found'},
+                                 NOT_FOUND, to_web)
+    # ready for service
+    docs = json.loads(dumps(mongo_db.find_neighbors(rel, doc_id, reverse)))
+    return proceed_to_output(docs, OK, to_web)
+
+
+def content_error(report):
+    """
+    Response of a book/author dict with invalid values, given its validation report
     """
-    for key in dic:
-        if not isinstance(dic[key], str) and not isinstance(dic[key], list):
-            return False
-        if check_content_type(key, dic[key]) == VALUE_TYPE_ERROR:
-            return False
-    return True
+    return {'JSON content error': 'Incorrect value in json: ' + '; '.join(report['errors'])}
 
 
 def proceed_to_output(response, status, to_web):
@@ -652,4 +1232,8 @@ def proceed_to_output(response, status, to_web):
 
 
 if __name__ == '__main__':
+    mongo_db.ensure_indexes()
+    # build the prefix index before the first search as you type
+    for table in OBJECT_TABLES.values():
+        prefix_index.refresh(table)
     app.run(debug=True)
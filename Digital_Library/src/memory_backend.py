@@ -0,0 +1,1486 @@
+"""
+This module is an embedded storage backend which implements the subset of the pymongo
+database/collection/cursor API used by Database, library_app and query.
+Documents are kept in memory in insertion order, indexed fields have hash indexes
+(used for equality lookups and unique constraints), and the tables can optionally be
+persisted to a SQLite file which is loaded again at startup.
+Text indexes are inverted indexes from words to documents, used by $text queries.
+Aggregation pipelines support the $match, $lookup, $unwind, $sort, $skip, $limit and
+$project stages, a leading $match is resolved through the indexes like find.
+It supports the filters generated by query.query, so the library can be deployed and
+tested without a mongoDB server.
+Write operations of bulk_write are the pymongo operations defined here, which keep their
+arguments public, so they are executed without reading private attributes of pymongo.
+"""
+import copy
+import itertools
+import re
+import sqlite3
+import threading
+import time
+
+from bson import ObjectId
+from bson.json_util import dumps, loads
+import pymongo
+from pymongo import ASCENDING, TEXT
+from pymongo.errors import DuplicateKeyError, BulkWriteError, OperationFailure
+from pymongo.results import InsertOneResult, InsertManyResult, UpdateResult, DeleteResult, \
+    BulkWriteResult
+
+DUPLICATE_KEY_ERROR = 11000
+ID_INDEX = '_id_'
+# rank of value types in the sort order of mongoDB
+TYPE_RANKS = {type(None): 1, int: 2, float: 2, str: 3, dict: 4, list: 5, ObjectId: 7, bool: 8}
+TYPE_ALIASES = {'null': (type(None),), 'int': (int,), 'long': (int,), 'double': (float,),
+                'number': (int, float), 'string': (str,), 'object': (dict,), 'array': (list,),
+                'bool': (bool,), 'objectId': (ObjectId,)}
+TEXT_SCORE = {'$meta': 'textScore'}
+# words of text indexes, matched case-insensitively
+WORD_RE = re.compile(r'\w+')
+PHRASE_RE = re.compile(r'"([^"]*)"')
+
+
+class InsertOne(pymongo.InsertOne):
+    """
+    pymongo InsertOne whose document is public. Operations of this module are valid
+    pymongo operations, so Database builds them for mongoDB and the embedded backend alike.
+    """
+
+    def __init__(self, document):
+        """
+        Initialize the operation
+
+        Parameters:
+        document (dict): document to insert
+        """
+        super().__init__(document)
+        self.document = document
+
+
+class UpdateOne(pymongo.UpdateOne):
+    """
+    pymongo UpdateOne whose filter, update and upsert are public
+    """
+
+    def __init__(self, my_filter, update, upsert=False):
+        """
+        Initialize the operation
+
+        Parameters:
+        my_filter (dict): filter of the document to update
+        update (dict): update operators
+        upsert (bool): insert a document if none matches
+        """
+        super().__init__(my_filter, update, upsert)
+        self.filter = my_filter
+        self.document = update
+        self.upsert = upsert
+
+
+class UpdateMany(pymongo.UpdateMany):
+    """
+    pymongo UpdateMany whose filter, update and upsert are public
+    """
+
+    def __init__(self, my_filter, update, upsert=False):
+        """
+        Initialize the operation
+
+        Parameters:
+        my_filter (dict): filter of the documents to update
+        update (dict): update operators
+        upsert (bool): insert a document if none matches
+        """
+        super().__init__(my_filter, update, upsert)
+        self.filter = my_filter
+        self.document = update
+        self.upsert = upsert
+
+
+class ReplaceOne(pymongo.ReplaceOne):
+    """
+    pymongo ReplaceOne whose filter, replacement and upsert are public
+    """
+
+    def __init__(self, my_filter, replacement, upsert=False):
+        """
+        Initialize the operation
+
+        Parameters:
+        my_filter (dict): filter of the document to replace
+        replacement (dict): new document
+        upsert (bool): insert the document if none matches
+        """
+        super().__init__(my_filter, replacement, upsert)
+        self.filter = my_filter
+        self.document = replacement
+        self.upsert = upsert
+
+
+class DeleteOne(pymongo.DeleteOne):
+    """
+    pymongo DeleteOne whose filter is public
+    """
+
+    def __init__(self, my_filter):
+        """
+        Initialize the operation
+
+        Parameters:
+        my_filter (dict): filter of the document to delete
+        """
+        super().__init__(my_filter)
+        self.filter = my_filter
+
+
+class DeleteMany(pymongo.DeleteMany):
+    """
+    pymongo DeleteMany whose filter is public
+    """
+
+    def __init__(self, my_filter):
+        """
+        Initialize the operation
+
+        Parameters:
+        my_filter (dict): filter of the documents to delete
+        """
+        super().__init__(my_filter)
+        self.filter = my_filter
+
+
+def get_values(doc, path):
+    """
+    Get all values of the dotted path in doc, arrays on the path are expanded.
+    Return empty list if path is missing.
+
+    Parameters:
+    doc (dict): document to look into
+    path (str): dotted field path, e.g. 'rating' or '_author.rating'
+    """
+    values = [doc]
+    for key in path.split('.'):
+        next_values = []
+        for value in values:
+            if isinstance(value, dict):
+                if key in value:
+                    next_values.append(value[key])
+            elif isinstance(value, list):
+                for element in value:
+                    if isinstance(element, dict) and key in element:
+                        next_values.append(element[key])
+        values = next_values
+    return values
+
+
+def get_value(doc, path):
+    """
+    Get the value of the dotted path in doc without expanding arrays, None if missing
+    """
+    value = doc
+    for key in path.split('.'):
+        if not isinstance(value, dict) or key not in value:
+            return None
+        value = value[key]
+    return value
+
+
+def set_value(doc, path, value):
+    """
+    Set the value of the dotted path in doc, creating embedded dicts if needed
+    """
+    keys = path.split('.')
+    for key in keys[:-1]:
+        doc = doc.setdefault(key, {})
+    doc[keys[-1]] = value
+
+
+def unset_value(doc, path):
+    """
+    Remove the dotted path from doc if it exists
+    """
+    keys = path.split('.')
+    for key in keys[:-1]:
+        doc = doc.get(key)
+        if not isinstance(doc, dict):
+            return
+    doc.pop(keys[-1], None)
+
+
+def sort_key(value):
+    """
+    Key which orders values of different types like mongoDB does
+    """
+    if isinstance(value, bool):
+        return TYPE_RANKS[bool], value
+    rank = TYPE_RANKS.get(type(value), 6)
+    if isinstance(value, (dict, list)):
+        return rank, dumps(value)
+    if rank == 6:
+        return rank, str(value)
+    return rank, value
+
+
+def index_key(value):
+    """
+    Hashable key of value in hash indexes, 1 and 1.0 share the same key
+    """
+    if isinstance(value, bool) or value is None or isinstance(value, (str, ObjectId)):
+        return value
+    if isinstance(value, (int, float)):
+        return float(value)
+    return dumps(value)
+
+
+def is_same_type(first, second):
+    """
+    Check whether two values can be compared with each other
+    """
+    return sort_key(first)[0] == sort_key(second)[0]
+
+
+def candidates(values):
+    """
+    Values to compare with a condition: values themselves plus elements of arrays
+    """
+    result = list(values)
+    for value in values:
+        if isinstance(value, list):
+            result.extend(value)
+    return result
+
+
+def match_document(doc, my_filter):
+    """
+    Check whether doc matches the filter
+    """
+    for key, condition in my_filter.items():
+        if key == '$and':
+            if not all(match_document(doc, sub_filter) for sub_filter in condition):
+                return False
+        elif key == '$or':
+            if not any(match_document(doc, sub_filter) for sub_filter in condition):
+                return False
+        elif key == '$nor':
+            if any(match_document(doc, sub_filter) for sub_filter in condition):
+                return False
+        elif key == '$expr':
+            if not evaluate_expression(doc, condition):
+                return False
+        elif key.startswith('$'):
+            raise OperationFailure(f'unknown top level operator: {key}')
+        elif not match_condition(get_values(doc, key), condition):
+            return False
+    return True
+
+
+def text_words(text):
+    """
+    Words of text in lower case
+    """
+    return WORD_RE.findall(text.casefold())
+
+
+def parse_text_search(search):
+    """
+    Split $search string into (words, negated words, phrases) like mongoDB does:
+    words prefixed with '-' are negated and text in quotes is a phrase
+    """
+    phrases = [phrase.casefold() for phrase in PHRASE_RE.findall(search) if phrase.strip()]
+    words = []
+    negated_words = []
+    for term in PHRASE_RE.sub(' ', search).split():
+        if term.startswith('-'):
+            negated_words.extend(text_words(term[1:]))
+        else:
+            words.extend(text_words(term))
+    for phrase in phrases:
+        words.extend(text_words(phrase))
+    return words, negated_words, phrases
+
+
+def is_operator_dict(condition):
+    """
+    Check whether condition is a dict of query operators, e.g. {'$gt': 1}
+    """
+    return isinstance(condition, dict) and condition \
+        and all(key.startswith('$') for key in condition)
+
+
+def match_condition(values, condition):
+    """
+    Check whether values of a field match the condition of the field
+    """
+    if isinstance(condition, re.Pattern):
+        return match_operator(values, '$regex', condition, {})
+    if not is_operator_dict(condition):
+        return match_operator(values, '$eq', condition, {})
+    return all(match_operator(values, operator, argument, condition)
+               for operator, argument in condition.items())
+
+
+def match_operator(values, operator, argument, condition):
+    """
+    Check whether values of a field match one query operator
+    """
+    if operator == '$eq':
+        if argument is None and not values:
+            return True
+        return any(is_same_type(value, argument) and value == argument
+                   for value in candidates(values))
+    if operator == '$ne':
+        return not match_operator(values, '$eq', argument, condition)
+    if operator in ('$gt', '$gte', '$lt', '$lte'):
+        return any(is_same_type(value, argument) and compare(operator, value, argument)
+                   for value in candidates(values))
+    if operator == '$in':
+        return any(match_condition(values, element) for element in argument)
+    if operator == '$nin':
+        return not match_operator(values, '$in', argument, condition)
+    if operator == '$exists':
+        return bool(values) == bool(argument)
+    if operator == '$regex':
+        pattern = compile_regex(argument, condition.get('$options', ''))
+        return any(isinstance(value, str) and pattern.search(value)
+                   for value in candidates(values))
+    if operator == '$options':
+        return True
+    if operator == '$type':
+        types = TYPE_ALIASES.get(argument, ())
+        return any(type(value) in types for value in candidates(values))
+    if operator == '$not':
+        return not match_condition(values, argument)
+    if operator == '$elemMatch':
+        return any(isinstance(value, list) and any(
+            match_document(element, argument) if isinstance(element, dict)
+            and not is_operator_dict(argument) else match_condition([element], argument)
+            for element in value) for value in values)
+    if operator == '$size':
+        return any(isinstance(value, list) and len(value) == argument for value in values)
+    raise OperationFailure(f'unknown operator: {operator}')
+
+
+def compare(operator, first, second):
+    """
+    Compare two values of the same type with $gt, $gte, $lt or $lte
+    """
+    first, second = sort_key(first), sort_key(second)
+    if operator == '$gt':
+        return first > second
+    if operator == '$gte':
+        return first >= second
+    if operator == '$lt':
+        return first < second
+    return first <= second
+
+
+def compile_regex(pattern, options):
+    """
+    Compile $regex pattern with its $options
+    """
+    if isinstance(pattern, re.Pattern):
+        return pattern
+    flags = 0
+    if 'i' in options:
+        flags |= re.IGNORECASE
+    if 'm' in options:
+        flags |= re.MULTILINE
+    if 's' in options:
+        flags |= re.DOTALL
+    if 'x' in options:
+        flags |= re.VERBOSE
+    return re.compile(pattern, flags)
+
+
+def evaluate_expression(doc, expression):
+    """
+    Evaluate aggregation expression used in $expr against doc
+    """
+    if isinstance(expression, str) and expression.startswith('$'):
+        return get_value(doc, expression[1:])
+    if isinstance(expression, list):
+        return [evaluate_expression(doc, element) for element in expression]
+    if not is_operator_dict(expression) or len(expression) != 1:
+        return expression
+    operator, argument = next(iter(expression.items()))
+    if operator == '$literal':
+        return argument
+    arguments = evaluate_expression(doc, argument)
+    if operator == '$toDouble':
+        return to_double(arguments)
+    if operator == '$and':
+        return all(arguments)
+    if operator == '$or':
+        return any(arguments)
+    if operator == '$not':
+        return not arguments[0] if isinstance(arguments, list) else not arguments
+    first, second = arguments
+    if operator == '$eq':
+        return sort_key(first) == sort_key(second)
+    if operator == '$ne':
+        return sort_key(first) != sort_key(second)
+    if operator in ('$gt', '$gte', '$lt', '$lte'):
+        return compare(operator, first, second)
+    raise OperationFailure(f'unknown expression operator: {operator}')
+
+
+def to_double(value):
+    """
+    Convert value like $toDouble, raise OperationFailure if it cannot be converted
+    """
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise OperationFailure(f'Failed to parse number {value!r} in $toDouble') from None
+
+
+def project(doc, projection):
+    """
+    Return a copy of doc with the projection applied
+    """
+    if not projection:
+        return copy.deepcopy(doc)
+    included = {key for key, value in projection.items()
+                if key != '_id' and value and not isinstance(value, dict)}
+    if included:
+        result = {}
+        for key, value in doc.items():
+            if key in included or (key == '_id' and projection.get('_id', 1)):
+                result[key] = copy.deepcopy(value)
+        return result
+    return {key: copy.deepcopy(value) for key, value in doc.items()
+            if projection.get(key, 1) or isinstance(projection.get(key), dict)}
+
+
+def apply_update(doc, update, is_insert=False):
+    """
+    Apply update operators ($set, $unset, $inc, $setOnInsert) to doc in place.
+    If update has no operator, doc is replaced by update (keeping _id).
+    """
+    if not is_operator_dict(update):
+        doc_id = doc.get('_id')
+        doc.clear()
+        doc.update(copy.deepcopy(update))
+        if doc_id is not None:
+            doc['_id'] = doc_id
+        return
+    for operator, fields in update.items():
+        if operator == '$setOnInsert' and not is_insert:
+            continue
+        for path, value in fields.items():
+            if operator in ('$set', '$setOnInsert'):
+                set_value(doc, path, copy.deepcopy(value))
+            elif operator == '$unset':
+                unset_value(doc, path)
+            elif operator == '$inc':
+                set_value(doc, path, (get_value(doc, path) or 0) + value)
+            elif operator == '$max':
+                current = get_value(doc, path)
+                if current is None or compare('$gt', value, current):
+                    set_value(doc, path, value)
+            else:
+                raise OperationFailure(f'unknown update operator: {operator}')
+
+
+def upsert_document(my_filter):
+    """
+    Base document of an upsert built from the equality conditions of the filter
+    """
+    doc = {}
+    for key, condition in my_filter.items():
+        if key == '$and':
+            for sub_filter in condition:
+                doc.update(upsert_document(sub_filter))
+        elif not key.startswith('$') and not is_operator_dict(condition):
+            set_value(doc, key, copy.deepcopy(condition))
+        elif is_operator_dict(condition) and '$eq' in condition:
+            set_value(doc, key, copy.deepcopy(condition['$eq']))
+    return doc
+
+
+def unwind(argument, docs):
+    """
+    Output one document per element of the array at the path of the $unwind stage
+    """
+    if isinstance(argument, str):
+        argument = {'path': argument}
+    field = argument['path'][1:]
+    results = []
+    for doc in docs:
+        values = get_value(doc, field)
+        if isinstance(values, list) and values:
+            for value in values:
+                result = copy.deepcopy(doc)
+                set_value(result, field, value)
+                results.append(result)
+        elif values is not None and not isinstance(values, list):
+            results.append(doc)
+        elif argument.get('preserveNullAndEmptyArrays'):
+            result = copy.deepcopy(doc)
+            unset_value(result, field)
+            results.append(result)
+    return results
+
+
+def normalize_keys(keys, direction=ASCENDING):
+    """
+    Normalize index/sort keys into a list of (field, direction)
+    """
+    if isinstance(keys, str):
+        return [(keys, direction)]
+    return [(key, key_direction) for key, key_direction in keys]
+
+
+class Index:
+    """
+    Hash index over one or more fields of a collection
+    """
+    is_text = False
+
+    def __init__(self, name, keys, unique=False):
+        """
+        Initialize an empty index
+
+        Parameters:
+        name (str): index name
+        keys (list): list of (field, direction)
+        unique (bool): whether the index rejects duplicate keys
+        """
+        self.name = name
+        self.keys = keys
+        self.unique = unique
+        self.fields = [field for field, _ in keys]
+        self.entries = {}
+
+    def doc_keys(self, doc):
+        """
+        Index keys of doc. Single-field indexes index every element of arrays.
+        """
+        if len(self.fields) > 1:
+            return {tuple(index_key(get_value(doc, field)) for field in self.fields)}
+        values = get_values(doc, self.fields[0])
+        if not values:
+            return {None}
+        keys = set()
+        for value in values:
+            keys.add(index_key(value))
+            if isinstance(value, list):
+                keys.update(index_key(element) for element in value)
+        return keys
+
+    def add(self, doc_id, doc):
+        """
+        Add doc to the index
+        """
+        for key in self.doc_keys(doc):
+            self.entries.setdefault(key, set()).add(doc_id)
+
+    def remove(self, doc_id, doc):
+        """
+        Remove doc from the index
+        """
+        for key in self.doc_keys(doc):
+            doc_ids = self.entries.get(key)
+            if doc_ids is None:
+                continue
+            doc_ids.discard(doc_id)
+            if not doc_ids:
+                del self.entries[key]
+
+    def find_conflicts(self, doc_id, doc):
+        """
+        Return the keys of doc which violate this unique index
+        """
+        if not self.unique:
+            return []
+        return [key for key in self.doc_keys(doc) if self.entries.get(key, set()) - {doc_id}]
+
+    def lookup(self, values):
+        """
+        Ids of documents whose single indexed field equals one of values
+        """
+        doc_ids = set()
+        for value in values:
+            doc_ids |= self.entries.get(index_key(value), set())
+        return doc_ids
+
+    def to_info(self):
+        """
+        Index description in the shape of pymongo's list_indexes
+        """
+        info = {'v': 2, 'key': dict(self.keys), 'name': self.name}
+        if self.unique and self.name != ID_INDEX:
+            info['unique'] = True
+        return info
+
+
+class TextIndex(Index):
+    """
+    Inverted index from the words of string (or array of strings) fields to documents,
+    keeping how often each word occurs in each field for ranking
+    """
+    is_text = True
+
+    def __init__(self, name, keys, weights=None):
+        """
+        Initialize an empty text index
+
+        Parameters:
+        name (str): index name
+        keys (list): list of (field, 'text')
+        weights (dict): field to its weight in the text score, 1 if not given
+        """
+        super().__init__(name, keys)
+        self.weights = {field: (weights or {}).get(field, 1) for field in self.fields}
+
+    def doc_words(self, doc):
+        """
+        Word to {field: number of occurrences} of the indexed fields of doc
+        """
+        words = {}
+        for field in self.fields:
+            for value in candidates(get_values(doc, field)):
+                if not isinstance(value, str):
+                    continue
+                for word in text_words(value):
+                    counts = words.setdefault(word, {})
+                    counts[field] = counts.get(field, 0) + 1
+        return words
+
+    def add(self, doc_id, doc):
+        """
+        Add the words of doc to the index
+        """
+        for word, counts in self.doc_words(doc).items():
+            self.entries.setdefault(word, {})[doc_id] = counts
+
+    def remove(self, doc_id, doc):
+        """
+        Remove the words of doc from the index
+        """
+        for word in self.doc_words(doc):
+            postings = self.entries.get(word)
+            if postings is None:
+                continue
+            postings.pop(doc_id, None)
+            if not postings:
+                del self.entries[word]
+
+    def find_conflicts(self, doc_id, doc):
+        """
+        Text indexes are never unique
+        """
+        return []
+
+    def search(self, search, documents):
+        """
+        Return {document id: text score} of the documents matching the $search string:
+        documents containing any word and every phrase, but no negated word.
+        The score sums the occurrences of the words weighted by their fields.
+
+        Parameters:
+        search (str): $search string
+        documents (dict): documents of the collection by id, used to check phrases
+        """
+        words, negated_words, phrases = parse_text_search(search)
+        scores = {}
+        for word in set(words):
+            for doc_id, counts in self.entries.get(word, {}).items():
+                score = sum(self.weights[field] * count for field, count in counts.items())
+                scores[doc_id] = scores.get(doc_id, 0.0) + score
+        for word in negated_words:
+            for doc_id in self.entries.get(word, {}):
+                scores.pop(doc_id, None)
+        if phrases:
+            scores = {doc_id: score for doc_id, score in scores.items()
+                      if all(self.has_phrase(documents[doc_id], phrase) for phrase in phrases)}
+        return scores
+
+    def has_phrase(self, doc, phrase):
+        """
+        Check whether an indexed field of doc contains the phrase in lower case
+        """
+        return any(isinstance(value, str) and phrase in value.casefold()
+                   for field in self.fields for value in candidates(get_values(doc, field)))
+
+    def to_info(self):
+        """
+        Index description in the shape of pymongo's list_indexes
+        """
+        return {'v': 2, 'key': {'_fts': 'text', '_ftsx': 1}, 'name': self.name,
+                'weights': dict(self.weights), 'default_language': 'none'}
+
+
+def make_index(name, keys, unique=False, weights=None):
+    """
+    Create a text index if keys are text keys, otherwise a hash index
+    """
+    if any(direction == TEXT for _, direction in keys):
+        return TextIndex(name, keys, weights)
+    return Index(name, keys, unique)
+
+
+class MemoryCursor:
+    """
+    Cursor over the documents of a MemoryCollection matching a filter.
+    Results are computed once on first iteration.
+    """
+
+    def __init__(self, collection, my_filter=None, projection=None):
+        """
+        Initialize the cursor
+
+        Parameters:
+        collection (MemoryCollection): collection to query
+        my_filter (dict): query filter
+        projection (dict): fields to include/exclude
+        """
+        self.collection = collection
+        self.filter = my_filter or {}
+        self.projection = projection
+        self.sort_keys = []
+        self.skip_count = 0
+        self.limit_count = 0
+        self.results = None
+        self.iterator = None
+        self.stats = {}
+        self.scores = {}
+
+    def sort(self, key_or_list, direction=ASCENDING):
+        """
+        Sort results by key or list of (key, direction)
+        """
+        self.sort_keys = normalize_keys(key_or_list, direction)
+        return self
+
+    def skip(self, skip_count):
+        """
+        Skip the first results
+        """
+        self.skip_count = skip_count
+        return self
+
+    def limit(self, limit_count):
+        """
+        Limit the number of results, 0 means no limit
+        """
+        self.limit_count = limit_count
+        return self
+
+    def batch_size(self, _):
+        """
+        Batch size has no effect on an in-memory cursor
+        """
+        return self
+
+    def evaluate(self):
+        """
+        Select, sort, skip, limit and project the documents
+        """
+        if self.results is not None:
+            return self.results
+        start_time = time.perf_counter()
+        self.scores = {}
+        docs, examined, index_name = self.collection.select(self.filter, self.scores)
+        for key, direction in reversed(self.sort_keys):
+            if direction == TEXT_SCORE:
+                docs.sort(key=lambda doc: self.scores[doc['_id']], reverse=True)
+                continue
+            docs.sort(key=lambda doc, field=key: sort_key(get_value(doc, field)),
+                      reverse=direction < 0)
+        docs = docs[self.skip_count:]
+        if self.limit_count:
+            docs = docs[:abs(self.limit_count)]
+        self.results = [self.project(doc) for doc in docs]
+        self.stats = {'index_name': index_name, 'examined': examined,
+                      'time': (time.perf_counter() - start_time) * 1000}
+        return self.results
+
+    def project(self, doc):
+        """
+        Apply the projection to doc, adding the text score of fields projected with $meta
+        """
+        result = project(doc, self.projection)
+        for key, value in (self.projection or {}).items():
+            if value == TEXT_SCORE:
+                result[key] = self.scores.get(doc['_id'], 0.0)
+        return result
+
+    def __iter__(self):
+        return iter(self.evaluate())
+
+    def __next__(self):
+        if self.iterator is None:
+            self.iterator = iter(self.evaluate())
+        return next(self.iterator)
+
+    next = __next__
+
+    def count(self, with_limit_and_skip=False):
+        """
+        Number of matching documents, like pymongo 3 Cursor.count
+        """
+        if with_limit_and_skip:
+            return len(self.evaluate())
+        docs, _, _ = self.collection.select(self.filter)
+        return len(docs)
+
+    def explain(self):
+        """
+        Explain output shaped like mongoDB's queryPlanner/executionStats
+        """
+        self.results = None
+        self.evaluate()
+        index_name = self.stats['index_name']
+        if index_name:
+            winning_plan = {'stage': 'FETCH', 'inputStage': {'stage': 'IXSCAN',
+                                                             'indexName': index_name}}
+        else:
+            winning_plan = {'stage': 'COLLSCAN'}
+        return {'queryPlanner': {'namespace': self.collection.name, 'parsedQuery': self.filter,
+                                 'winningPlan': winning_plan},
+                'executionStats': {'nReturned': len(self.results),
+                                   'totalDocsExamined': self.stats['examined'],
+                                   'executionTimeMillis': self.stats['time']}}
+
+    def close(self):
+        """
+        Release the results
+        """
+        self.results = None
+
+
+class MemoryCommandCursor:
+    """
+    Cursor over the results of an aggregation pipeline, computed when it is created
+    like pymongo's CommandCursor
+    """
+
+    def __init__(self, results):
+        """
+        Initialize the cursor
+
+        Parameters:
+        results (list): documents output by the pipeline
+        """
+        self.results = results
+        self.iterator = iter(results)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self.iterator)
+
+    next = __next__
+
+    def batch_size(self, _):
+        """
+        Batch size has no effect on an in-memory cursor
+        """
+        return self
+
+    def close(self):
+        """
+        Release the results
+        """
+        self.iterator = iter(())
+
+
+class MemoryCollection:
+    """
+    Collection of documents kept in memory with hash indexes
+    """
+
+    def __init__(self, name, store=None, database=None):
+        """
+        Initialize the collection and load its documents from the store
+
+        Parameters:
+        name (str): collection name
+        store (SqliteStore): persistent store, or None to keep documents in memory only
+        database (MemoryDatabase): database of the collection, used by $lookup
+        """
+        self.name = name
+        self.store = store
+        self.database = database
+        self.documents = {}
+        self.sequence = {}
+        self.counter = itertools.count()
+        self.indexes = {ID_INDEX: Index(ID_INDEX, [('_id', ASCENDING)], unique=True)}
+        self.lock = threading.RLock()
+        if store is not None:
+            for index_name, keys, unique, weights in store.load_indexes(name):
+                self.indexes[index_name] = make_index(index_name, keys, unique, weights)
+            for doc in store.load_documents(name):
+                self.add_document(doc)
+
+    # ---- internal helpers, callers hold the lock ----
+
+    def add_document(self, doc):
+        """
+        Store doc and add it to all indexes
+        """
+        self.documents[doc['_id']] = doc
+        self.sequence[doc['_id']] = next(self.counter)
+        for index in self.indexes.values():
+            index.add(doc['_id'], doc)
+
+    def replace_document(self, doc_id, new_doc):
+        """
+        Replace stored doc in place and update all indexes
+        """
+        old_doc = self.documents[doc_id]
+        for index in self.indexes.values():
+            index.remove(doc_id, old_doc)
+            index.add(doc_id, new_doc)
+        self.documents[doc_id] = new_doc
+
+    def remove_document(self, doc_id):
+        """
+        Remove doc from storage and all indexes
+        """
+        doc = self.documents.pop(doc_id)
+        del self.sequence[doc_id]
+        for index in self.indexes.values():
+            index.remove(doc_id, doc)
+        return doc
+
+    def check_unique(self, doc_id, doc):
+        """
+        Raise DuplicateKeyError if doc violates a unique index
+        """
+        for index in self.indexes.values():
+            keys = index.find_conflicts(doc_id, doc)
+            if keys:
+                raise DuplicateKeyError(
+                    f'E11000 duplicate key error collection: {self.name} index: {index.name} '
+                    f'dup key: {keys[0]!r}', DUPLICATE_KEY_ERROR,
+                    {'code': DUPLICATE_KEY_ERROR, 'keyValue': {index.fields[0]: keys[0]}})
+
+    def select(self, my_filter, scores=None):
+        """
+        Return (matching documents, number of examined documents, used index name).
+        Equality/$in conditions on an indexed field are resolved through the index.
+        A top level $text condition is resolved through the text index, and the text
+        scores of the matching documents are put into scores if given.
+        """
+        with self.lock:
+            if '$text' in my_filter:
+                doc_ids, index_name = self.text_candidates(my_filter['$text'], scores)
+                my_filter = {key: condition for key, condition in my_filter.items()
+                             if key != '$text'}
+            else:
+                doc_ids, index_name = self.index_candidates(my_filter)
+            if doc_ids is None:
+                docs = list(self.documents.values())
+            else:
+                docs = [self.documents[doc_id]
+                        for doc_id in sorted(doc_ids, key=self.sequence.__getitem__)]
+            return [doc for doc in docs if match_document(doc, my_filter)], len(docs), index_name
+
+    def text_candidates(self, text_condition, scores=None):
+        """
+        Ids of documents matching the $text condition and the name of the text index
+        """
+        for index in self.indexes.values():
+            if index.is_text:
+                doc_scores = index.search(text_condition['$search'], self.documents)
+                if scores is not None:
+                    scores.update(doc_scores)
+                return set(doc_scores), index.name
+        raise OperationFailure('text index required for $text query')
+
+    def index_candidates(self, my_filter):
+        """
+        Ids of candidate documents from a single-field index, or None to scan
+        """
+        for key, condition in my_filter.items():
+            if key.startswith('$'):
+                continue
+            if is_operator_dict(condition):
+                if '$eq' in condition:
+                    values = [condition['$eq']]
+                elif '$in' in condition and not any(isinstance(value, re.Pattern)
+                                                    for value in condition['$in']):
+                    values = condition['$in']
+                else:
+                    continue
+            elif isinstance(condition, (dict, list, re.Pattern)):
+                continue
+            else:
+                values = [condition]
+            for index in self.indexes.values():
+                if index.fields == [key] and not index.is_text:
+                    return index.lookup(values), index.name
+        return None, None
+
+    def insert(self, doc):
+        """
+        Insert a copy of doc, generating _id if needed, and return its _id
+        """
+        if '_id' not in doc:
+            doc['_id'] = ObjectId()
+        new_doc = copy.deepcopy(doc)
+        self.check_unique(new_doc['_id'], new_doc)
+        self.add_document(new_doc)
+        return new_doc['_id']
+
+    def update(self, my_filter, update, upsert=False, multi=False):
+        """
+        Update (or replace) matching documents.
+        Return (matched count, modified count, upserted id, changed ids).
+        """
+        docs, _, _ = self.select(my_filter)
+        if not multi:
+            docs = docs[:1]
+        if not docs:
+            if not upsert:
+                return 0, 0, None, []
+            new_doc = upsert_document(my_filter)
+            apply_update(new_doc, update, is_insert=True)
+            doc_id = self.insert(new_doc)
+            return 0, 0, doc_id, [doc_id]
+        new_docs = []
+        for doc in docs:
+            new_doc = copy.deepcopy(doc)
+            apply_update(new_doc, update)
+            self.check_unique(doc['_id'], new_doc)
+            new_docs.append(new_doc)
+        changed_ids = []
+        for doc, new_doc in zip(docs, new_docs):
+            if new_doc != doc:
+                self.replace_document(doc['_id'], new_doc)
+                changed_ids.append(doc['_id'])
+        return len(docs), len(changed_ids), None, changed_ids
+
+    def delete(self, my_filter, multi=False):
+        """
+        Delete matching documents and return the deleted ids
+        """
+        docs, _, _ = self.select(my_filter)
+        if not multi:
+            docs = docs[:1]
+        doc_ids = [doc['_id'] for doc in docs]
+        for doc_id in doc_ids:
+            self.remove_document(doc_id)
+        return doc_ids
+
+    def persist(self, changed_ids=(), removed_ids=()):
+        """
+        Write changed documents and removals through to the store
+        """
+        if self.store is None:
+            return
+        self.store.save_documents(self.name, [self.documents[doc_id] for doc_id in changed_ids
+                                              if doc_id in self.documents])
+        self.store.remove_documents(self.name, removed_ids)
+
+    # ---- pymongo collection API ----
+
+    def find(self, my_filter=None, projection=None):
+        """
+        Return a cursor over documents matching the filter
+        """
+        return MemoryCursor(self, my_filter, projection)
+
+    def find_one(self, my_filter=None, projection=None):
+        """
+        Return the first document matching the filter, or None
+        """
+        for doc in self.find(my_filter, projection).limit(1):
+            return doc
+        return None
+
+    def aggregate(self, pipeline, **_):
+        """
+        Run the aggregation pipeline and return a cursor over its results
+        """
+        stages = list(pipeline)
+        if stages and '$match' in stages[0]:
+            docs, _, _ = self.select(stages.pop(0)['$match'])
+        else:
+            with self.lock:
+                docs = list(self.documents.values())
+        # stages below add fields, so they work on copies of the stored documents
+        docs = [copy.deepcopy(doc) for doc in docs]
+        for stage in stages:
+            docs = self.run_stage(stage, docs)
+        return MemoryCommandCursor(docs)
+
+    def run_stage(self, stage, docs):
+        """
+        Apply one stage of an aggregation pipeline to the documents
+        """
+        operator, argument = next(iter(stage.items()))
+        if operator == '$match':
+            return [doc for doc in docs if match_document(doc, argument)]
+        if operator == '$lookup':
+            return self.lookup(argument, docs)
+        if operator == '$unwind':
+            return unwind(argument, docs)
+        if operator == '$sort':
+            for key, direction in reversed(list(argument.items())):
+                docs.sort(key=lambda doc, field=key: sort_key(get_value(doc, field)),
+                          reverse=direction < 0)
+            return docs
+        if operator == '$skip':
+            return docs[argument:]
+        if operator == '$limit':
+            return docs[:argument]
+        if operator == '$project':
+            return [project(doc, argument) for doc in docs]
+        raise OperationFailure(f'unknown pipeline stage: {operator}')
+
+    def lookup(self, argument, docs):
+        """
+        Join the documents of another collection whose foreignField equals the localField
+        of each document, found through the index of foreignField if any
+        """
+        foreign = self.database[argument['from']]
+        for doc in docs:
+            values = get_values(doc, argument['localField'])
+            condition = {'$in': values} if values else None
+            doc[argument['as']] = list(foreign.find({argument['foreignField']: condition}))
+        return docs
+
+    def count_documents(self, my_filter):
+        """
+        Number of documents matching the filter
+        """
+        if not my_filter:
+            return len(self.documents)
+        return len(self.select(my_filter)[0])
+
+    def insert_one(self, document):
+        """
+        Insert one document
+        """
+        with self.lock:
+            doc_id = self.insert(document)
+            self.persist([doc_id])
+        return InsertOneResult(doc_id, True)
+
+    def insert_many(self, documents, ordered=True):
+        """
+        Insert documents
+        """
+        documents = list(documents)
+        self.bulk_write([InsertOne(document) for document in documents], ordered)
+        return InsertManyResult([document['_id'] for document in documents], True)
+
+    def update_one(self, my_filter, update, upsert=False):
+        """
+        Update the first document matching the filter
+        """
+        return self.update_result(my_filter, update, upsert, multi=False)
+
+    def update_many(self, my_filter, update, upsert=False):
+        """
+        Update all documents matching the filter
+        """
+        return self.update_result(my_filter, update, upsert, multi=True)
+
+    def replace_one(self, my_filter, replacement, upsert=False):
+        """
+        Replace the first document matching the filter
+        """
+        return self.update_result(my_filter, replacement, upsert, multi=False)
+
+    def update_result(self, my_filter, update, upsert, multi):
+        """
+        Run update and wrap its outcome into an UpdateResult
+        """
+        with self.lock:
+            matched, modified, upserted_id, changed_ids = self.update(my_filter, update,
+                                                                      upsert, multi)
+            self.persist(changed_ids)
+        raw_result = {'n': matched or int(upserted_id is not None), 'nModified': modified}
+        if upserted_id is not None:
+            raw_result['upserted'] = upserted_id
+        return UpdateResult(raw_result, True)
+
+    def find_one_and_update(self, my_filter, update, projection=None, upsert=False,
+                            return_document=False):
+        """
+        Update the first document matching the filter and return it before or
+        after the update (return_document=ReturnDocument.AFTER)
+        """
+        with self.lock:
+            before = self.find_one(my_filter)
+            _, _, upserted_id, changed_ids = self.update(my_filter, update, upsert)
+            self.persist(changed_ids)
+            if not return_document:
+                return None if before is None else project(before, projection)
+            doc_id = upserted_id if upserted_id is not None else \
+                (before or {}).get('_id')
+            if doc_id is None:
+                return None
+            return project(self.documents[doc_id], projection)
+
+    def delete_one(self, my_filter):
+        """
+        Delete the first document matching the filter
+        """
+        with self.lock:
+            removed_ids = self.delete(my_filter)
+            self.persist(removed_ids=removed_ids)
+        return DeleteResult({'n': len(removed_ids)}, True)
+
+    def delete_many(self, my_filter):
+        """
+        Delete all documents matching the filter
+        """
+        with self.lock:
+            removed_ids = self.delete(my_filter, multi=True)
+            self.persist(removed_ids=removed_ids)
+        return DeleteResult({'n': len(removed_ids)}, True)
+
+    def bulk_write(self, requests, ordered=True):
+        """
+        Execute write operations of this module (InsertOne, UpdateOne, UpdateMany,
+        ReplaceOne, DeleteOne, DeleteMany). Raise BulkWriteError with details on duplicate keys.
+        """
+        details = {'nInserted': 0, 'nUpserted': 0, 'nMatched': 0, 'nModified': 0,
+                   'nRemoved': 0, 'upserted': [], 'writeErrors': [],
+                   'writeConcernErrors': []}
+        changed_ids = set()
+        removed_ids = set()
+        with self.lock:
+            for i, request in enumerate(requests):
+                try:
+                    self.execute_request(request, i, details, changed_ids, removed_ids)
+                except DuplicateKeyError as error:
+                    details['writeErrors'].append({'index': i, 'code': DUPLICATE_KEY_ERROR,
+                                                   'errmsg': str(error)})
+                    if ordered:
+                        break
+            self.persist(changed_ids - removed_ids, removed_ids)
+        if details['writeErrors']:
+            raise BulkWriteError(details)
+        return BulkWriteResult(details, True)
+
+    def execute_request(self, request, i, details, changed_ids, removed_ids):
+        """
+        Execute one request of bulk_write and record its outcome in details
+        """
+        if isinstance(request, InsertOne):
+            doc_id = self.insert(request.document)
+            details['nInserted'] += 1
+            changed_ids.add(doc_id)
+        elif isinstance(request, (UpdateOne, UpdateMany, ReplaceOne)):
+            multi = isinstance(request, UpdateMany)
+            matched, modified, upserted_id, ids = self.update(request.filter, request.document,
+                                                              request.upsert, multi)
+            details['nMatched'] += matched
+            details['nModified'] += modified
+            if upserted_id is not None:
+                details['nUpserted'] += 1
+                details['upserted'].append({'index': i, '_id': upserted_id})
+            changed_ids.update(ids)
+        elif isinstance(request, (DeleteOne, DeleteMany)):
+            ids = self.delete(request.filter, multi=isinstance(request, DeleteMany))
+            details['nRemoved'] += len(ids)
+            removed_ids.update(ids)
+        else:
+            raise TypeError(f'{request!r} is not a valid request, '
+                            f'write operations of src.memory_backend are expected')
+
+    def create_index(self, keys, unique=False, **kwargs):
+        """
+        Build a hash index, or a text index if keys are text keys, and return its name.
+        Weights of a text index are given by keyword argument weights.
+        """
+        keys = normalize_keys(keys)
+        name = kwargs.get('name') or '_'.join(f'{field}_{direction}' for field, direction in keys)
+        with self.lock:
+            index = make_index(name, keys, unique, kwargs.get('weights'))
+            if name in self.indexes:
+                if index.is_text and self.indexes[name].weights != index.weights:
+                    self.indexes[name].weights = index.weights
+                    if self.store is not None:
+                        self.store.save_index(self.name, name, keys, unique, index.weights)
+                return name
+            if index.is_text and any(other.is_text for other in self.indexes.values()):
+                raise OperationFailure(f'collection {self.name} already has a text index')
+            for doc_id, doc in self.documents.items():
+                if index.find_conflicts(doc_id, doc):
+                    raise OperationFailure(f'E11000 duplicate key error collection: '
+                                           f'{self.name} index: {name}', DUPLICATE_KEY_ERROR)
+                index.add(doc_id, doc)
+            self.indexes[name] = index
+            if self.store is not None:
+                self.store.save_index(self.name, name, keys, unique,
+                                      index.weights if index.is_text else None)
+        return name
+
+    def list_indexes(self):
+        """
+        Descriptions of the indexes
+        """
+        with self.lock:
+            return [index.to_info() for index in self.indexes.values()]
+
+    def index_information(self):
+        """
+        Index descriptions keyed by index name
+        """
+        return {info['name']: info for info in self.list_indexes()}
+
+    def drop_index(self, index_name):
+        """
+        Drop the index by its name
+        """
+        with self.lock:
+            if index_name == ID_INDEX or index_name not in self.indexes:
+                raise OperationFailure(f'index not found with name [{index_name}]')
+            del self.indexes[index_name]
+            if self.store is not None:
+                self.store.remove_index(self.name, index_name)
+
+    def drop(self):
+        """
+        Remove all documents and indexes
+        """
+        with self.lock:
+            self.persist(removed_ids=list(self.documents))
+            for index_name in list(self.indexes):
+                if index_name != ID_INDEX:
+                    self.drop_index(index_name)
+            self.documents = {}
+            self.sequence = {}
+            self.indexes[ID_INDEX].entries = {}
+
+
+class SqliteStore:
+    """
+    SQLite file which persists the documents and index definitions of collections
+    """
+
+    def __init__(self, path):
+        """
+        Open (or create) the SQLite file
+
+        Parameters:
+        path (str): path of the SQLite file
+        """
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.connection:
+            self.connection.execute('CREATE TABLE IF NOT EXISTS documents ('
+                                    'collection TEXT NOT NULL, id TEXT NOT NULL, '
+                                    'document TEXT NOT NULL, PRIMARY KEY (collection, id))')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS indexes ('
+                                    'collection TEXT NOT NULL, name TEXT NOT NULL, '
+                                    'keys TEXT NOT NULL, is_unique INTEGER NOT NULL, '
+                                    'weights TEXT, PRIMARY KEY (collection, name))')
+            columns = [row[1] for row in self.connection.execute('PRAGMA table_info(indexes)')]
+            if 'weights' not in columns:
+                # files saved before weights of text indexes were persisted
+                self.connection.execute('ALTER TABLE indexes ADD COLUMN weights TEXT')
+
+    def load_documents(self, collection):
+        """
+        Documents of the collection in insertion order
+        """
+        with self.lock:
+            rows = self.connection.execute('SELECT document FROM documents WHERE collection = ? '
+                                           'ORDER BY rowid', (collection,)).fetchall()
+        return [loads(row[0]) for row in rows]
+
+    def save_documents(self, collection, docs):
+        """
+        Insert or replace documents of the collection
+        """
+        if not docs:
+            return
+        rows = [(collection, dumps(doc['_id']), dumps(doc)) for doc in docs]
+        with self.lock, self.connection:
+            self.connection.executemany('INSERT INTO documents VALUES (?, ?, ?) '
+                                        'ON CONFLICT (collection, id) '
+                                        'DO UPDATE SET document = excluded.document', rows)
+
+    def remove_documents(self, collection, doc_ids):
+        """
+        Remove documents of the collection by _id
+        """
+        if not doc_ids:
+            return
+        rows = [(collection, dumps(doc_id)) for doc_id in doc_ids]
+        with self.lock, self.connection:
+            self.connection.executemany('DELETE FROM documents WHERE collection = ? AND id = ?',
+                                        rows)
+
+    def load_indexes(self, collection):
+        """
+        (name, keys, unique, weights) of the indexes of the collection,
+        weights are None except for text indexes
+        """
+        with self.lock:
+            rows = self.connection.execute('SELECT name, keys, is_unique, weights FROM indexes '
+                                           'WHERE collection = ?', (collection,)).fetchall()
+        return [(name, [tuple(key) for key in loads(keys)], bool(unique),
+                 None if weights is None else loads(weights))
+                for name, keys, unique, weights in rows]
+
+    def save_index(self, collection, name, keys, unique, weights=None):
+        """
+        Save the definition of an index, with the weights of its fields if it is a text index
+        """
+        with self.lock, self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO indexes VALUES (?, ?, ?, ?, ?)',
+                                    (collection, name, dumps(keys), int(unique),
+                                     None if weights is None else dumps(weights)))
+
+    def remove_index(self, collection, name):
+        """
+        Remove the definition of an index
+        """
+        with self.lock, self.connection:
+            self.connection.execute('DELETE FROM indexes WHERE collection = ? AND name = ?',
+                                    (collection, name))
+
+
+class MemoryDatabase:
+    """
+    Embedded database whose collections live in memory,
+    optionally persisted to a SQLite file
+    """
+
+    def __init__(self, sqlite_path=None, name='Digital_Library'):
+        """
+        Initialize the database
+
+        Parameters:
+        sqlite_path (str): path of the SQLite file, None to keep everything in memory
+        name (str): database name
+        """
+        self.name = name
+        self.client = None
+        self.store = SqliteStore(sqlite_path) if sqlite_path else None
+        self.collections = {}
+        self.lock = threading.Lock()
+
+    def __getitem__(self, collection_name):
+        """
+        Get collection by its name, creating it if needed
+        """
+        with self.lock:
+            if collection_name not in self.collections:
+                collection = MemoryCollection(collection_name, self.store, self)
+                self.collections[collection_name] = collection
+            return self.collections[collection_name]
+
+    def list_collection_names(self):
+        """
+        Names of the collections
+        """
+        return list(self.collections)
+
+    def drop_collection(self, collection_name):
+        """
+        Remove all documents and indexes of the collection
+        """
+        self[collection_name].drop()
@@ -0,0 +1,158 @@
+"""
+This module completes the start of a title/name typed by users with the books/authors
+having the most ratings, e.g. 'clean c' with 'Clean Code'.
+Titles and names are kept in memory as a sorted array of keys, one key per word of the
+title/name running to its end, so the books/authors matching a prefix are one range of
+the array found by binary search instead of a scan of the table.
+The array mirrors the tables and is refreshed incrementally on writes.
+"""
+import heapq
+import re
+from bisect import bisect_left
+
+from src.database import BOOKS_TABLE, AUTHORS_TABLE, UNIQUE_INDEXES
+from src.table_mirror import TableMirror
+
+AUTOCOMPLETE_FIELDS = {BOOKS_TABLE: 'title', AUTHORS_TABLE: 'name'}
+RANK_FIELD = 'rating_count'
+DEFAULT_AUTOCOMPLETE_LIMIT = 10
+# results of prefixes up to this length match many books/authors and are cached
+CACHED_PREFIX_LENGTH = 2
+WORD_RE = re.compile(r'\w+')
+# greater than any character, ends the range of keys starting with a prefix
+MAX_CHAR = chr(0x10ffff)
+
+
+def normalize_text(text):
+    """
+    Return the text in lower case with single spaces between words
+    """
+    return ' '.join(text.lower().split())
+
+
+def prefix_keys(text):
+    """
+    Return the keys of the title/name: the normalized text from the start of every word
+    """
+    text = normalize_text(text)
+    return frozenset(text[match.start():] for match in WORD_RE.finditer(text))
+
+
+class PrefixIndex(TableMirror):
+    """
+    Sorted array of title/name keys of books/authors, searched by prefix
+    """
+
+    def __init__(self, database):
+        """
+        Initialize the index of the database, tables are indexed on first search
+
+        Parameters:
+        database (Database): database of books/authors
+        """
+        super().__init__(database, {table_name: [field, RANK_FIELD]
+                                    for table_name, field in AUTOCOMPLETE_FIELDS.items()})
+        self.reset()
+
+    def reset(self):
+        """
+        Empty the index
+        """
+        # sorted (key, id), entries of updated or deleted books/authors are removed lazily
+        self.entries = {table_name: [] for table_name in AUTOCOMPLETE_FIELDS}
+        # id: (title/name, rating count, keys)
+        self.documents = {table_name: {} for table_name in AUTOCOMPLETE_FIELDS}
+        self.stale_counts = dict.fromkeys(AUTOCOMPLETE_FIELDS, 0)
+        self.unsorted = set()
+        self.results = {}
+
+    def set_document(self, table_name, doc_id, doc):
+        """
+        Index the title/name and rating count of the book/author.
+        New keys are appended and sorted before the next search.
+        """
+        text = doc.get(AUTOCOMPLETE_FIELDS[table_name])
+        keys = prefix_keys(text) if isinstance(text, str) else None
+        if not keys:
+            self.remove_document(table_name, doc_id)
+            return
+        rating_count = doc.get(RANK_FIELD)
+        if not isinstance(rating_count, (int, float)) or isinstance(rating_count, bool):
+            rating_count = 0
+        documents = self.documents[table_name]
+        previous = documents.get(doc_id)
+        documents[doc_id] = (text, rating_count, keys)
+        if previous is not None and previous[2] == keys:
+            return
+        if previous is not None:
+            self.stale_counts[table_name] += len(previous[2])
+        self.entries[table_name].extend((key, doc_id) for key in keys)
+        self.unsorted.add(table_name)
+
+    def remove_document(self, table_name, doc_id):
+        """
+        Remove the book/author from the index
+        """
+        previous = self.documents[table_name].pop(doc_id, None)
+        if previous is not None:
+            self.stale_counts[table_name] += len(previous[2])
+
+    def prepare(self, table_name):
+        """
+        Sort the entries appended since the previous search, or rebuild them if more than
+        half are stale. Sorting is cheap since the entries before the appended ones are sorted.
+        """
+        if 2 * self.stale_counts[table_name] > len(self.entries[table_name]):
+            self.entries[table_name] = sorted(
+                (key, doc_id) for doc_id, (_, _, keys) in self.documents[table_name].items()
+                for key in keys)
+            self.stale_counts[table_name] = 0
+        elif table_name in self.unsorted:
+            self.entries[table_name].sort()
+        self.unsorted.discard(table_name)
+
+    def search(self, table_name, prefix, limit=DEFAULT_AUTOCOMPLETE_LIMIT):
+        """
+        Return id, title/name and rating count of at most limit books/authors having a word
+        of the title/name starting with prefix, and the rest of the title/name continuing
+        it, ranked by rating count. Prefix is matched ignoring case.
+
+        Parameters:
+        table_name (str): BOOKS_TABLE or AUTHORS_TABLE
+        prefix (str): start of the title/name, or of a word of it
+        limit (int): maximum number of results
+        """
+        prefix = normalize_text(prefix)
+        if not prefix:
+            return []
+        result_key = (table_name, prefix, limit)
+        with self.lock:
+            if self.refresh(table_name):
+                self.results = {cached_key: result for cached_key, result in self.results.items()
+                                if cached_key[0] != table_name}
+            if result_key in self.results:
+                return self.results[result_key]
+            self.prepare(table_name)
+            entries = self.entries[table_name]
+            documents = self.documents[table_name]
+            start = bisect_left(entries, (prefix,))
+            end = bisect_left(entries, (prefix + MAX_CHAR,), start)
+            # ids in order of keys, so ties of rating count are ranked alphabetically
+            doc_ids = dict.fromkeys(doc_id for key, doc_id in entries[start:end]
+                                    if doc_id in documents and key in documents[doc_id][2])
+            top_ids = heapq.nlargest(limit, doc_ids, key=lambda doc_id: documents[doc_id][1])
+            id_key = UNIQUE_INDEXES[table_name]
+            field = AUTOCOMPLETE_FIELDS[table_name]
+            result = [{id_key: doc_id, field: documents[doc_id][0],
+                       RANK_FIELD: documents[doc_id][1]} for doc_id in top_ids]
+            if len(prefix) <= CACHED_PREFIX_LENGTH:
+                self.results[result_key] = result
+            return result
+
+    def clear(self):
+        """
+        Drop the index, it is built again on next search
+        """
+        with self.lock:
+            super().clear()
+            self.reset()
@@ -9,10 +9,12 @@ import sys
 
 from src.book_scraper import scrape_book_page, is_book
 from src.author_scraper import scrape_author_page
-from src.database import Database
+from src.database import Database, WriteBehindBuffer, DEFAULT_CHUNK_SIZE, DEFAULT_EXPORT_FILE, \
+    BOOKS_TABLE, AUTHORS_TABLE
 from src.library_app import get_book_by_id, get_author_by_id, get_by_query, put_book_by_id, \
     put_author_by_id, post_book, post_books, post_author, post_authors, post_scrape, \
-    delete_book_by_id, delete_author_by_id
+    delete_book_by_id, delete_author_by_id, get_similar_books, get_related_authors, \
+    get_author_books, get_by_text, get_query_explain
 
 BOOK_WARNING_NUMBER = 200
 AUTHOR_WARNING_NUMBER = 50
@@ -25,6 +27,9 @@ OPTION_THREE = 3
 OPTION_FOUR = 4
 OPTION_FIVE = 5
 OPTION_SIX = 6
+OPTION_SEVEN = 7
+OPTION_EIGHT = 8
+OPTION_NINE = 9
 
 
 def show_menu():
@@ -37,12 +42,15 @@ def show_menu():
                        "1 = Scrape books and authors by starting url\n"
                        "2 = Read from JSON file and update/insert to database\n"
                        "3 = Simulate web api in command line\n"
-                       "4 = Export existing books/authors into src/library.json\n"
+                       "4 = Export existing books/authors into JSON file\n"
+                       "5 = Manage indexes of books/authors tables\n"
+                       "6 = Migrate rating/rating_count/review_count stored as strings to numbers\n"
+                       "7 = Rebuild links between books/authors from their ids\n"
                        "0 = EXIT\n\n")
         if not choice.isnumeric():
             continue
         choice = int(choice)
-        if OPTION_EXIT <= choice <= OPTION_FOUR:
+        if OPTION_EXIT <= choice <= OPTION_SEVEN:
             break
 
     # Handle different options
@@ -75,21 +83,43 @@ def show_menu():
     if choice == OPTION_TWO:
         # Read from json file and update database
         json_file = input("Please enter the JSON file to read:\n\n")
+        chunk_size = input("Please enter the number of books/authors in one bulk write "
+                           f"(default {DEFAULT_CHUNK_SIZE}):\n\n")
+        chunk_size = int(chunk_size) if chunk_size.isnumeric() else DEFAULT_CHUNK_SIZE
+        streaming = input("Stream the file record by record? (y/n):\n\n").lower() == 'y'
+        resume = input("Save a checkpoint to resume an interrupted import? (y/n):\n\n") \
+            .lower() == 'y'
         if json_file is not None:
-            database.update_insert_from_json_file(json_file)
+            database.update_insert_from_json_file(json_file, chunk_size, streaming, resume)
     if choice == OPTION_THREE:
         # Simulate web api in local
         simulate_api()
     if choice == OPTION_FOUR:
         # Export existing books/authors into JSON files
-        database.export_to_json_file()
+        output_file = input("Please enter the output file, .ndjson for newline-delimited JSON, "
+                            ".bson for BSON, add .gz or .xz to compress "
+                            f"(default {DEFAULT_EXPORT_FILE}):\n\n")
+        since = input("Please enter the watermark of a previous export to only export changes "
+                      "(empty for full export):\n\n")
+        since = int(since) if since.isnumeric() else None
+        database.export_to_json_file(output_file or DEFAULT_EXPORT_FILE, since=since)
+    if choice == OPTION_FIVE:
+        # List, build or drop indexes
+        manage_indexes()
+    if choice == OPTION_SIX:
+        # One-shot migration of numeric fields
+        database.migrate_numeric_fields()
+    if choice == OPTION_SEVEN:
+        # Rebuild links table, e.g. after importing books/authors
+        database.rebuild_links()
 
 
 def scrape(number_books, number_authors):
     """
     Scrape from starting url with given number of books and authors.
-    Force to stop when count of books/authors in database is 2000.
+    Force to stop when count of books/authors in database and write buffer is 2000.
     Export existing books/authors into JSON files in the end.
+    Scraped books/authors are written to database in bulk through the write buffer.
     """
     # Print warnings
     if number_books > BOOK_WARNING_NUMBER:
@@ -99,8 +129,10 @@ def scrape(number_books, number_authors):
 
     # Scrape books/authors until the given number
     while len(books_url_set) < number_books or len(authors_url_set) < number_authors:
-        if books_tb.count_documents({}) >= MAX_STOP_NUMBER \
-                or authors_tb.count_documents({}) >= MAX_STOP_NUMBER:
+        # books/authors waiting in the write buffer are not counted in the tables yet
+        pending_number = len(write_buffer)
+        if books_tb.count_documents({}) + pending_number >= MAX_STOP_NUMBER \
+                or authors_tb.count_documents({}) + pending_number >= MAX_STOP_NUMBER:
             print('Program will not go beyond 2000 books or authors')
             break
         # if no book urls and no author urls left in queue to scrape, break the loop
@@ -124,6 +156,8 @@ def scrape(number_books, number_authors):
         # Try to scrape current author
         if len(authors_url_set) < number_authors and author_url not in authors_url_set:
             scrape_author_and_store(author_url, number_authors)
+    # Write the remaining scraped books/authors
+    write_buffer.flush()
 
 
 def scrape_book_and_store(book_url, number_books):
@@ -136,7 +170,7 @@ def scrape_book_and_store(book_url, number_books):
     book_dic, similar_books_urls = scrape_book_page(book_url)
     if book_dic is None:
         return
-    database.update_insert_books_tb(book_dic)
+    write_buffer.add_book(book_dic)
     authors_url_queue.append(book_dic['author_url'])
     books_url_set.add(book_dic['book_url'])
     for similar_book_url in similar_books_urls:
@@ -154,13 +188,46 @@ def scrape_author_and_store(author_url, number_authors):
     author_dic, related_authors_urls = scrape_author_page(author_url)
     if author_dic is None:
         return
-    database.update_insert_authors_tb(author_dic)
+    write_buffer.add_author(author_dic)
     authors_url_set.add(author_dic['author_url'])
     for related_author_url in related_authors_urls:
         if related_author_url not in authors_url_queue:
             authors_url_queue.append(related_author_url)
 
 
+def manage_indexes():
+    """
+    Show the menu of index management and perform the chosen action
+    """
+    while True:
+        option = input("Choose index action from one of the following:\n"
+                       "1 = List indexes\n"
+                       "2 = Build index\n"
+                       "3 = Drop index\n"
+                       "4 = go back to previous menu\n\n")
+        if not option.isnumeric():
+            continue
+        option = int(option)
+        if OPTION_ONE <= option <= OPTION_FOUR:
+            break
+    if option == OPTION_FOUR:
+        show_menu()
+        return
+    while True:
+        table_name = input(f"Please enter the table ({BOOKS_TABLE} or {AUTHORS_TABLE}):\n\n")
+        if table_name in (BOOKS_TABLE, AUTHORS_TABLE):
+            break
+    if option == OPTION_ONE:
+        for index in database.list_indexes(table_name):
+            print(index)
+    if option == OPTION_TWO:
+        field = input("Please enter the field to index:\n\n")
+        print(database.build_index(table_name, field))
+    if option == OPTION_THREE:
+        index_name = input("Please enter the name of index to drop:\n\n")
+        print(database.drop_index(table_name, index_name))
+
+
 def simulate_api():
     """
     Simulate web api in local.
@@ -199,11 +266,16 @@ def get_api():
                        "1 = api/book?id={attr_value}\n"
                        "2 = api/author?id={attr_value}\n"
                        "3 = api/search?q={query_string}\n"
-                       "4 = go back to previous menu\n\n")
+                       "4 = api/book/similar?id={attr_value}\n"
+                       "5 = api/author/related?id={attr_value}\n"
+                       "6 = api/author/books?id={attr_value}\n"
+                       "7 = api/search/text?object={book|author}&q={words}&rank={true|false}\n"
+                       "8 = api/search/explain?q={query_string}\n"
+                       "9 = go back to previous menu\n\n")
         if not option.isnumeric():
             continue
         option = int(option)
-        if OPTION_ONE <= option <= OPTION_FOUR:
+        if OPTION_ONE <= option <= OPTION_NINE:
             break
     if option == OPTION_ONE:
         value = input("api/book?id=")
@@ -215,6 +287,23 @@ def get_api():
         value = input("api/search?q=")
         print(get_by_query(value))
     if option == OPTION_FOUR:
+        value = input("api/book/similar?id=")
+        print(get_similar_books(value))
+    if option == OPTION_FIVE:
+        value = input("api/author/related?id=")
+        print(get_related_authors(value))
+    if option == OPTION_SIX:
+        value = input("api/author/books?id=")
+        print(get_author_books(value))
+    if option == OPTION_SEVEN:
+        obj = input("api/search/text?object=")
+        words = input(f"api/search/text?object={obj}&q=")
+        rank = input(f"api/search/text?object={obj}&q={words}&rank=")
+        print(get_by_text(obj, words, rank))
+    if option == OPTION_EIGHT:
+        value = input("api/search/explain?q=")
+        print(get_query_explain(value))
+    if option == OPTION_NINE:
         simulate_api()
 
 
@@ -307,6 +396,8 @@ def delete_api():
 if __name__ == '__main__':
     # Initialize database
     database = Database()
+    database.ensure_indexes()
+    write_buffer = WriteBehindBuffer(database)
     books_tb = database.books_tb
     authors_tb = database.authors_tb
     # Initialize required containers
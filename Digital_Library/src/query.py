@@ -6,8 +6,26 @@ Program supports the following query string:
 "" operators to specify the exact search term. For example, book.image_url:"123"
 AND, OR, and NOT logical operators. For example, book.rating_count: NOT 123
 One-side unbounded comparison operators >, <. For example, book.rating_count: > 123
+Keyword searches over titles, names and similar/related lists can be resolved through
+the full-text index with text_query instead of scanning with regular expressions.
+Search words are matched literally as a substring, not as a regular expression.
+() to group conditions with arbitrary nesting. For example,
+(book.title:code OR book.title:clean) AND NOT book.rating:<3
+NOT binds tighter than AND, which binds tighter than OR.
+. operator to specify a field of the author of a book, which is joined by author_id.
+For example, book.rating:>4 AND book.author.rating:>4.2
+The query string is split into tokens, parsed into a syntax tree and compiled into one filter,
+or into one aggregation pipeline looking up the joined authors if the query has join fields.
 """
-from src.database import BOOK_ATTRIBUTES, AUTHOR_ATTRIBUTES
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from pymongo import ASCENDING
+
+from src.database import OUTPUT_PROJECTION, BOOKS_TABLE, AUTHORS_TABLE
+from src.schema import BOOK_ATTRIBUTES, AUTHOR_ATTRIBUTES, NUMERIC_FIELDS
 
 BOOK_STR = 'book'
 AUTHOR_STR = 'author'
@@ -23,200 +41,792 @@ OBJECT_NOT_EXIST = -2
 FIELD_NOT_EXIST = -3
 VALUE_TYPE_ERROR = -4
 OPERATOR_NOT_APPLICABLE = -5
+# token kinds
+TERM = 'TERM'
+AND = 'AND'
+OR = 'OR'
+NOT = 'NOT'
+LEFT_PAREN = '('
+RIGHT_PAREN = ')'
+# 'object.field:' or 'object.joined_object.field:' which starts a term
+TERM_START = r'([^\s.:()"]+)\s*\.\s*([^\s.:()"]+(?:\s*\.\s*[^\s.:()"]+)?)\s*:'
+TERM_RE = re.compile(TERM_START)
+# AND/OR followed by another term (possibly after NOT and parentheses) ends the content of a term,
+# so that words like 'AND' in a title are kept in the content
+CONTENT_END_RE = re.compile(r'(AND|OR)\s*(?=(?:(?:NOT\b|\()\s*)*' + TERM_START + ')')
+KEYWORD_RE = re.compile(r'(AND|OR|NOT)(?=[\s(]|$)')
+NOT_CONTENT_RE = re.compile(r'NOT(?![A-Za-z_])')
+COMPARISON_OPERATORS = {'<': '$lt', '>': '$gt'}
+OBJECT_QUERY_TYPES = {BOOK_STR: (BOOK_QUERY, BOOK_ATTRIBUTES),
+                      AUTHOR_STR: (AUTHOR_QUERY, AUTHOR_ATTRIBUTES)}
+OBJECT_TABLES = {BOOK_STR: BOOKS_TABLE, AUTHOR_STR: AUTHORS_TABLE}
+# objects which can be joined to an object: (local field, foreign field) of the lookup,
+# the foreign field has a unique index
+JOINS = {BOOK_STR: {AUTHOR_STR: ('author_id', 'author_id')}}
+# joined documents are put into the field named by the prefix and the joined object
+JOIN_PREFIX = '_'
+# id used as key of pagination for each type of query
+QUERY_ID_KEYS = {BOOK_QUERY: 'book_id', AUTHOR_QUERY: 'author_id'}
+# number of compiled query strings kept by the plan cache
+PLAN_CACHE_SIZE = 256
+
+
+class PlanCache:
+    """
+    Bounded LRU cache of compiled query strings, so repeated searches skip parsing.
+    Errors are cached as well. Compiled filters are shared between callers and
+    must not be modified.
+    """
+
+    def __init__(self, max_size=PLAN_CACHE_SIZE):
+        """
+        Initialize an empty cache
+
+        Parameters:
+        max_size (int): number of query strings kept, the least recently used is evicted
+        """
+        self.max_size = max_size
+        self.plans = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        """
+        Number of cached query strings
+        """
+        with self.lock:
+            return len(self.plans)
+
+    def get(self, query_string):
+        """
+        Return the result of compile_query for the query string, compiling it on a miss
+
+        Parameters:
+        query_string (str): query string for search
+        """
+        return self.lookup(query_string)[0]
+
+    def lookup(self, query_string):
+        """
+        Return the result of compile_query for the query string and whether it was cached
+
+        Parameters:
+        query_string (str): query string for search
+        """
+        key = normalize_query_string(query_string)
+        if is_error_occur(key):
+            return key, False
+        with self.lock:
+            plan = self.plans.get(key)
+            if plan is not None:
+                self.plans.move_to_end(key)
+                self.hits += 1
+                return plan, True
+            self.misses += 1
+        plan = compile_query(key)
+        with self.lock:
+            self.plans[key] = plan
+            self.plans.move_to_end(key)
+            while len(self.plans) > self.max_size:
+                self.plans.popitem(last=False)
+        return plan, False
+
+    def stats(self):
+        """
+        Return the size, hits and misses of the cache as a dict
+        """
+        with self.lock:
+            return {'size': len(self.plans), 'max_size': self.max_size,
+                    'hits': self.hits, 'misses': self.misses}
+
+    def clear(self):
+        """
+        Remove all cached query strings and reset the counters
+        """
+        with self.lock:
+            self.plans.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+def normalize_query_string(query_string):
+    """
+    Normalize the query string used as key of the plan cache.
+    Whitespace around the query string does not change the query and is removed.
+    Error MALFORMED_QUERY_STRING is returned if query string is not a string.
+
+    Parameters:
+    query_string (str): query string for search
+    """
+    if not isinstance(query_string, str):
+        return MALFORMED_QUERY_STRING
+    return query_string.strip()
 
 
 def query(query_string, mongo_db):
     """
     Query the database and return cursor according to the query.
     If error happens during the process, then related error is returned.
+    Compiled query strings are taken from the plan cache.
 
     Parameters:
     query_string (str): query string for search
     mongo_db (object): database object
     """
-    has_logical_operator = False
-    for operator in LOGICAL_OPERATORS:
-        if query_string.find(operator) != NOT_EXIST:
-            has_logical_operator = True
-    if has_logical_operator:
-        # need to first divide at AND/OR, then parse
-        res = divide_query_string_and_parse(query_string)
-    else:
-        # parse directly
-        res = parse_single_query(query_string)
+    res = query_page(query_string, mongo_db)
+    if is_error_occur(res):
+        return res
+    return res[1]
+
+
+def query_tables(query_string):
+    """
+    Return the tables read by the query string, including the tables of joined objects,
+    or the error if any.
+
+    Parameters:
+    query_string (str): query string for search
+    """
+    plan = PLAN_CACHE.get(query_string)
+    if is_error_occur(plan):
+        return plan
+    query_type, my_query = plan
+    tables = [BOOKS_TABLE if query_type == BOOK_QUERY else AUTHORS_TABLE]
+    if isinstance(my_query, list):
+        tables.extend(stage['$lookup']['from'] for stage in my_query if '$lookup' in stage)
+    return tables
+
+
+def split_fields(fields):
+    """
+    Split the comma separated fields given to the api into a list of field names
+
+    Parameters:
+    fields (str): comma separated fields, e.g. 'book_id,rating'
+    """
+    return [field.strip() for field in fields.split(',') if field.strip()]
+
+
+def fields_projection(fields, attributes):
+    """
+    Convert the comma separated fields into the projection used in mongo_db.collection.find(),
+    so only the fields are read and sent.
+    Return OUTPUT_PROJECTION if fields is None, all fields are then returned.
+    Error FIELD_NOT_EXIST is returned if a field is not an attribute or no field is given.
+
+    Parameters:
+    fields (str): comma separated fields, e.g. 'book_id,rating'
+    attributes (set): valid attributes of the object
+    """
+    if fields is None:
+        return OUTPUT_PROJECTION
+    names = split_fields(fields)
+    if not names or any(name not in attributes for name in names):
+        return FIELD_NOT_EXIST
+    projection = {'_id': 0}
+    projection.update(dict.fromkeys(names, 1))
+    return projection
+
+
+def query_page(query_string, mongo_db, limit=0, after=None, fields=None):
+    """
+    Query one page of the results ordered by book_id/author_id.
+    Pages are keyset based: the next page starts after the id of the last result of the
+    page, so it is found through the unique index however deep the page is.
+    Return (book_id/author_id, cursor), or the error if any.
+    Results are not sorted if neither limit nor after is given.
+    If fields are given, results only have these fields, plus the id if limit is given.
+    Queries with join fields run as one aggregation, and the cursor is a command cursor.
+
+    Parameters:
+    query_string (str): query string for search
+    mongo_db (object): database object
+    limit (int): maximum number of results, 0 for no limit
+    after (str): id of the last result of the previous page, None for the first page
+    fields (str): comma separated fields of results, None for all fields
+    """
+    res = PLAN_CACHE.get(query_string)
     # check error
     if is_error_occur(res):
         return res
-    # process the query and return cursor
-    query_type, my_query = res
-    if query_type == BOOK_QUERY:
-        return mongo_db.books_tb.find(my_query, {'_id': 0})
-    return mongo_db.authors_tb.find(my_query, {'_id': 0})
+    return plan_cursor(res, mongo_db, limit, after, fields)
+
+
+def plan_cursor(plan, mongo_db, limit=0, after=None, fields=None):
+    """
+    Return (book_id/author_id, cursor) of the compiled query string like query_page,
+    or the error if fields are not valid.
+
+    Parameters:
+    plan (tuple): (BOOK_QUERY/AUTHOR_QUERY, filter or pipeline) returned by compile_query
+    mongo_db (object): database object
+    limit (int): maximum number of results, 0 for no limit
+    after (str): id of the last result of the previous page, None for the first page
+    fields (str): comma separated fields of results, None for all fields
+    """
+    query_type, my_query = plan
+    id_key = QUERY_ID_KEYS[query_type]
+    table = mongo_db.books_tb if query_type == BOOK_QUERY else mongo_db.authors_tb
+    attributes = BOOK_ATTRIBUTES if query_type == BOOK_QUERY else AUTHOR_ATTRIBUTES
+    projection = fields_projection(fields, attributes)
+    if is_error_occur(projection):
+        return projection
+    if isinstance(my_query, list):
+        if limit and fields is not None:
+            projection[id_key] = 1
+        return id_key, table.aggregate(page_pipeline(my_query, id_key, limit, after,
+                                                     projection))
+    if after is not None:
+        # the cached filter is shared, so it is wrapped instead of modified
+        my_query = {'$and': [my_query, {id_key: {'$gt': after}}]}
+    if limit and fields is not None:
+        projection[id_key] = 1
+    cursor = table.find(my_query, projection)
+    if limit or after is not None:
+        cursor = cursor.sort(id_key, ASCENDING).limit(limit)
+    return id_key, cursor
 
 
-def divide_query_string_and_parse(query_string):
+def page_pipeline(pipeline, id_key, limit, after, projection):
     """
-    Divide query string into two query at AND/OR.
-    Then parse the query separately.
-    Check error after calling each helper functions.
+    Return the compiled pipeline of a join query with the stages of one page added.
+    Documents are filtered by after and sorted before the lookup, so the id index is used,
+    and the limit is applied after the conditions on joined fields.
+
+    Parameters:
+    pipeline (list): pipeline returned by compile_query, which is not modified
+    id_key (str): book_id/author_id
+    limit (int): maximum number of results, 0 for no limit
+    after (str): id of the last result of the previous page, None for the first page
+    projection (dict): projection of the results
+    """
+    stages = list(pipeline)
+    if after is not None:
+        condition = {id_key: {'$gt': after}}
+        if '$match' in stages[0]:
+            condition = {'$and': [stages.pop(0)['$match'], condition]}
+        stages.insert(0, {'$match': condition})
+    if limit or after is not None:
+        stages.insert(1 if '$match' in stages[0] else 0, {'$sort': {id_key: ASCENDING}})
+        if limit:
+            stages.append({'$limit': limit})
+    if not any(projection.values()):
+        # only exclusions, so joined documents are excluded as well
+        projection = dict(projection)
+        projection.update({stage['$lookup']['as']: 0 for stage in pipeline if '$lookup' in stage})
+    stages.append({'$project': projection})
+    return stages
+
+
+def explain_query(query_string, mongo_db, limit=0, after=None):
+    """
+    Explain how the query string is compiled and executed, to tune indexes.
+    Return a dict with the compiled filter, whether the plan cache was hit, the parse time,
+    the index used (None for a collection scan), documents examined vs returned,
+    the execution time and the explain output of the database, or the error if any.
+    For join queries the filter is the pipeline, and the stage reading books before the
+    lookup is explained, since it is the stage using the indexes of books.
 
     Parameters:
     query_string (str): query string for search
+    mongo_db (object): database object
+    limit (int): maximum number of results, 0 for no limit
+    after (str): id of the last result of the previous page, None for the first page
+    """
+    start_time = time.perf_counter()
+    plan, is_hit = PLAN_CACHE.lookup(query_string)
+    parse_time = (time.perf_counter() - start_time) * 1000
+    if is_error_occur(plan):
+        return plan
+    query_type, my_query = plan
+    if isinstance(my_query, list):
+        local_query = my_query[0]['$match'] if '$match' in my_query[0] else {}
+        _, cursor = plan_cursor((query_type, local_query), mongo_db, 0, after)
+    else:
+        _, cursor = plan_cursor(plan, mongo_db, limit, after)
+    explain = cursor.explain()
+    winning_plan = explain['queryPlanner']['winningPlan']
+    stats = explain.get('executionStats', {})
+    return {'query_string': normalize_query_string(query_string),
+            'object': BOOK_STR if query_type == BOOK_QUERY else AUTHOR_STR,
+            'filter': my_query, 'plan_cache_hit': is_hit, 'parse_time_ms': parse_time,
+            'index': find_index_name(winning_plan),
+            'docs_examined': stats.get('totalDocsExamined'),
+            'keys_examined': stats.get('totalKeysExamined'),
+            'returned': stats.get('nReturned'),
+            'execution_time_ms': stats.get('executionTimeMillis'),
+            'explain': explain}
+
+
+def find_index_name(stage):
+    """
+    Return the name of the first index scanned in the stage of a query plan or its input
+    stages, None if the plan scans the collection
+
+    Parameters:
+    stage (dict): stage of the winning plan in explain output
+    """
+    if 'indexName' in stage:
+        return stage['indexName']
+    input_stages = stage.get('inputStages', [])
+    if 'inputStage' in stage:
+        input_stages = [stage['inputStage']] + input_stages
+    for input_stage in input_stages:
+        index_name = find_index_name(input_stage)
+        if index_name is not None:
+            return index_name
+    return None
+
+
+def text_query(obj, search, mongo_db, ranked=False):
+    """
+    Query books/authors whose title/name or similar/related lists contain any of the words
+    through the full-text index, and return cursor.
+    Words prefixed with '-' exclude results, text in quotes is an exact phrase.
+    Error MALFORMED_QUERY_STRING is returned if there is no word to search,
+    OBJECT_NOT_EXIST if object is not book or author.
+
+    Parameters:
+    obj (str): 'book' or 'author'
+    search (str): words to search
+    mongo_db (object): database object
+    ranked (bool): sort by relevance and output the text score as 'score'
+    """
+    if not isinstance(search, str) or not search.strip():
+        return MALFORMED_QUERY_STRING
+    if obj not in OBJECT_TABLES:
+        return OBJECT_NOT_EXIST
+    return mongo_db.text_search(OBJECT_TABLES[obj], search, ranked)
+
+
+def fuzzy_query(obj, search, trigram_index, limit):
+    """
+    Query books/authors whose title/name is similar to the search, tolerating typos,
+    through the trigram index, and return the list of them, the most similar first.
+    Error MALFORMED_QUERY_STRING is returned if there is no word to search,
+    OBJECT_NOT_EXIST if object is not book or author.
+
+    Parameters:
+    obj (str): 'book' or 'author'
+    search (str): title/name to search, possibly misspelled
+    trigram_index (TrigramIndex): trigram index of the database
+    limit (int): maximum number of results
+    """
+    if not isinstance(search, str) or not search.strip():
+        return MALFORMED_QUERY_STRING
+    if obj not in OBJECT_TABLES:
+        return OBJECT_NOT_EXIST
+    return trigram_index.find(OBJECT_TABLES[obj], search, limit)
+
+
+def autocomplete_query(obj, prefix, prefix_index, limit):
     """
-    for i, logical_operator in enumerate(LOGICAL_OPERATORS):
-        if query_string.find(logical_operator) != NOT_EXIST:
-            first_query, second_query = query_string.split(logical_operator)
-            first_query = first_query.strip()
-            second_query = second_query.strip()
-            # parse first query
-            first_parts = parser(first_query)
-            if is_error_occur(first_parts):
-                return first_parts
-            first_obj, first_field, first_content = first_parts
-            # parse second query
-            second_parts = parser(second_query)
-            if is_error_occur(second_parts):
-                return second_parts
-            second_obj, second_field, second_content = second_parts
-            # check object and field not exist error
-            query_type = check_obj_and_field(first_obj, first_field, second_obj, second_field)
-            if is_error_occur(query_type):
-                return query_type
-            # process the content
-            first_condition = content_to_query(first_field, first_content)
-            if is_error_occur(first_condition):
-                return first_condition
-            second_condition = content_to_query(second_field, second_content)
-            if is_error_occur(second_condition):
-                return second_condition
-            # Get the query and return
-            my_query = {SIGNS[i]: [first_condition, second_condition]}
-            return query_type, my_query
-
-
-def parse_single_query(query_string):
-    """
-    Parse the query directly.
-    Check error after calling each helper functions.
+    Query books/authors whose title/name, or a word of it, starts with the prefix through
+    the prefix index, and return the list of them ranked by rating count.
+    Error MALFORMED_QUERY_STRING is returned if the prefix is empty,
+    OBJECT_NOT_EXIST if object is not book or author.
+
+    Parameters:
+    obj (str): 'book' or 'author'
+    prefix (str): start of the title/name typed so far
+    prefix_index (PrefixIndex): prefix index of the database
+    limit (int): maximum number of results
+    """
+    if not isinstance(prefix, str) or not prefix.strip():
+        return MALFORMED_QUERY_STRING
+    if obj not in OBJECT_TABLES:
+        return OBJECT_NOT_EXIST
+    return prefix_index.search(OBJECT_TABLES[obj], prefix, limit)
+
+
+def compile_query(query_string):
+    """
+    Compile the query string into the type of query and one filter used in
+    mongo_db.collection.find(), or one pipeline used in mongo_db.collection.aggregate()
+    if the query string has join fields.
+    Return (BOOK_QUERY/AUTHOR_QUERY, filter or pipeline), or the error if any.
 
     Parameters:
     query_string (str): query string for search
     """
-    parts = parser(query_string)
-    if is_error_occur(parts):
-        return parts
-    obj, field, content = parts
-    # Check object, field not exist error
-    if obj == BOOK_STR:
-        if field not in BOOK_ATTRIBUTES:
-            return FIELD_NOT_EXIST
-        my_query = content_to_query(field, content)
-        if is_error_occur(my_query):
-            return my_query
-        return BOOK_QUERY, my_query
-    if obj == AUTHOR_STR:
-        if field not in AUTHOR_ATTRIBUTES:
-            return FIELD_NOT_EXIST
-        my_query = content_to_query(field, content)
-        if is_error_occur(my_query):
-            return my_query
-        return AUTHOR_QUERY, my_query
-    # object is not valid
-    return OBJECT_NOT_EXIST
+    tokens = tokenize(query_string)
+    if is_error_occur(tokens):
+        return tokens
+    tree = parse(tokens)
+    if is_error_occur(tree):
+        return tree
+    query_type = check_terms(tree)
+    if is_error_occur(query_type):
+        return query_type
+    if any(is_join_field(term[2]) for term in iter_terms(tree)):
+        my_query = compile_join(tree)
+    else:
+        my_query = compile_tree(tree)
+    if is_error_occur(my_query):
+        return my_query
+    return query_type, my_query
+
+
+def tokenize(query_string):
+    """
+    Split the query string into tokens.
+    A term token is (TERM, object, field, content), other tokens are (kind,).
+    The content of a term runs until AND/OR followed by another term, or until the ')'
+    closing a parenthesis opened before the term. Text in quotes is always part of the content.
+    Error MALFORMED_QUERY_STRING is returned if the query string cannot be split.
+
+    Parameters:
+    query_string (str): query string for search
+    """
+    tokens = []
+    depth = 0
+    pos = 0
+    length = len(query_string)
+    while True:
+        while pos < length and query_string[pos].isspace():
+            pos += 1
+        if pos == length:
+            return tokens
+        char = query_string[pos]
+        if char == LEFT_PAREN:
+            depth += 1
+            tokens.append((LEFT_PAREN,))
+            pos += 1
+            continue
+        if char == RIGHT_PAREN:
+            depth -= 1
+            tokens.append((RIGHT_PAREN,))
+            pos += 1
+            continue
+        match = CONTENT_END_RE.match(query_string, pos) or KEYWORD_RE.match(query_string, pos)
+        if match:
+            tokens.append((match.group(1),))
+            pos = match.end(1)
+            continue
+        match = TERM_RE.match(query_string, pos)
+        if match is None:
+            return MALFORMED_QUERY_STRING
+        content_end = find_content_end(query_string, match.end(), depth)
+        content = query_string[match.end():content_end].strip()
+        field = re.sub(r'\s', '', match.group(2))
+        tokens.append((TERM, match.group(1), field, content))
+        pos = content_end
+
+
+def find_content_end(query_string, pos, depth):
+    """
+    Find the position where the content of a term starting at pos ends.
+
+    Parameters:
+    query_string (str): query string for search
+    pos (int): position of the first character of the content
+    depth (int): number of open parentheses before the term
+    """
+    in_quote = False
+    # parentheses opened in the content, e.g. in the title 'Dune (Dune #1)'
+    content_depth = 0
+    for i in range(pos, len(query_string)):
+        char = query_string[i]
+        if char == '"':
+            in_quote = not in_quote
+        elif in_quote:
+            continue
+        elif char == LEFT_PAREN:
+            content_depth += 1
+        elif char == RIGHT_PAREN and content_depth > 0:
+            content_depth -= 1
+        elif char == RIGHT_PAREN and depth > 0:
+            return i
+        elif char in 'AO' and CONTENT_END_RE.match(query_string, i):
+            return i
+    return len(query_string)
+
+
+def parse(tokens):
+    """
+    Parse the tokens into a syntax tree by recursive descent with the grammar:
+    expression := and_expression (OR and_expression)*
+    and_expression := not_expression (AND not_expression)*
+    not_expression := NOT not_expression | '(' expression ')' | term
+    A node of the tree is a term token, (AND, [nodes]), (OR, [nodes]) or (NOT, node).
+    Error MALFORMED_QUERY_STRING is returned if tokens do not follow the grammar.
+
+    Parameters:
+    tokens (list): tokens returned by tokenize
+    """
+    if not tokens:
+        return MALFORMED_QUERY_STRING
+    tree, pos = parse_expression(tokens, 0)
+    if is_error_occur(tree):
+        return tree
+    if pos != len(tokens):
+        return MALFORMED_QUERY_STRING
+    return tree
+
+
+def parse_binary(tokens, pos, operator, parse_operand):
+    """
+    Parse operands joined by the operator (AND/OR).
+    Return the node and the position of the next token.
+
+    Parameters:
+    tokens (list): tokens returned by tokenize
+    pos (int): position of the first token
+    operator (str): AND or OR
+    parse_operand (function): function parsing one operand
+    """
+    node, pos = parse_operand(tokens, pos)
+    if is_error_occur(node):
+        return node, pos
+    nodes = [node]
+    while pos < len(tokens) and tokens[pos][0] == operator:
+        node, pos = parse_operand(tokens, pos + 1)
+        if is_error_occur(node):
+            return node, pos
+        nodes.append(node)
+    if len(nodes) == 1:
+        return nodes[0], pos
+    return (operator, nodes), pos
+
+
+def parse_expression(tokens, pos):
+    """
+    Parse conditions joined by OR
+    """
+    return parse_binary(tokens, pos, OR, parse_and_expression)
+
+
+def parse_and_expression(tokens, pos):
+    """
+    Parse conditions joined by AND
+    """
+    return parse_binary(tokens, pos, AND, parse_not_expression)
 
 
-def check_obj_and_field(first_obj, first_field, second_obj, second_field):
+def parse_not_expression(tokens, pos):
     """
-    Check validity of object and field for query with AND/OR.
+    Parse a negated condition, a condition in parentheses or a term
+    """
+    if pos == len(tokens):
+        return MALFORMED_QUERY_STRING, pos
+    kind = tokens[pos][0]
+    if kind == NOT:
+        node, pos = parse_not_expression(tokens, pos + 1)
+        if is_error_occur(node):
+            return node, pos
+        return (NOT, node), pos
+    if kind == LEFT_PAREN:
+        node, pos = parse_expression(tokens, pos + 1)
+        if is_error_occur(node):
+            return node, pos
+        if pos == len(tokens) or tokens[pos][0] != RIGHT_PAREN:
+            return MALFORMED_QUERY_STRING, pos
+        return node, pos + 1
+    if kind == TERM:
+        return tokens[pos], pos + 1
+    return MALFORMED_QUERY_STRING, pos
+
+
+def iter_terms(tree):
+    """
+    Yield the terms of the syntax tree from left to right
+    """
+    kind = tree[0]
+    if kind == TERM:
+        yield tree
+    elif kind == NOT:
+        yield from iter_terms(tree[1])
+    else:
+        for node in tree[1]:
+            yield from iter_terms(node)
+
+
+def check_terms(tree):
+    """
+    Check validity of objects and fields of all terms, which should query the same object.
+    Fields of joined objects are 'joined_object.field'.
     Return error if any.
     Otherwise, return the type of query: BOOK_QUERY/AUTHOR_QUERY
 
     Parameters:
-    first_obj (str): first object in query string
-    first_field (str): first field in query string
-    second_obj (str): second object in query string
-    second_field (str): second field in query string
+    tree (tuple): syntax tree returned by parse
     """
-    if first_obj == BOOK_STR:
-        if second_obj != BOOK_STR:
-            return OBJECT_NOT_EXIST
-        if first_field not in BOOK_ATTRIBUTES:
-            return FIELD_NOT_EXIST
-        if second_field not in BOOK_ATTRIBUTES:
-            return FIELD_NOT_EXIST
-        return BOOK_QUERY
-    if first_obj == AUTHOR_STR:
-        if second_obj != AUTHOR_STR:
+    query_obj = None
+    for _, obj, field, _ in iter_terms(tree):
+        if obj not in OBJECT_QUERY_TYPES or query_obj not in (None, obj):
             return OBJECT_NOT_EXIST
-        if first_field not in AUTHOR_ATTRIBUTES:
+        query_obj = obj
+        if is_join_field(field):
+            joined_obj, field = field.split('.')
+            if joined_obj not in JOINS.get(obj, {}):
+                return FIELD_NOT_EXIST
+            obj = joined_obj
+        if field not in OBJECT_QUERY_TYPES[obj][1]:
             return FIELD_NOT_EXIST
-        if second_field not in AUTHOR_ATTRIBUTES:
-            return FIELD_NOT_EXIST
-        return AUTHOR_QUERY
-    # object is not valid
-    return OBJECT_NOT_EXIST
+    return OBJECT_QUERY_TYPES[query_obj][0]
 
 
-def parser(query_string):
+def compile_tree(tree):
     """
-    Parse the query string and separate it by the format 'object.field:content' into three section.
-    Error MALFORMED_QUERY_STRING is returned if '.' or ':' is not found.
+    Compile the syntax tree into the filter used in mongo_db.collection.find().
+    Nested AND/OR of the same operator are flattened, NOT is compiled into $nor.
 
     Parameters:
-    query_string (str): query string for search
+    tree (tuple): syntax tree checked by check_terms
     """
-    # Split once from .
-    try:
-        obj, rest_string = query_string.split('.', 1)
-    except ValueError:
-        return MALFORMED_QUERY_STRING
-    # Split once from :
-    try:
-        field, content = rest_string.split(':', 1)
-    except ValueError:
-        return MALFORMED_QUERY_STRING
-    return obj.strip(), field.strip(), content.strip()
+    kind = tree[0]
+    if kind == TERM:
+        if is_join_field(tree[2]):
+            # the field of the joined document
+            return content_to_query(tree[2].split('.')[1], tree[3], JOIN_PREFIX + tree[2])
+        return content_to_query(tree[2], tree[3])
+    if kind == NOT:
+        condition = compile_tree(tree[1])
+        if is_error_occur(condition):
+            return condition
+        return {'$nor': [condition]}
+    sign = SIGNS[LOGICAL_OPERATORS.index(kind)]
+    conditions = []
+    for node in tree[1]:
+        condition = compile_tree(node)
+        if is_error_occur(condition):
+            return condition
+        if list(condition) == [sign]:
+            conditions.extend(condition[sign])
+        else:
+            conditions.append(condition)
+    return {sign: conditions}
+
+
+def is_join_field(field):
+    """
+    Check whether the field of a term is a field of a joined object
+    """
+    return '.' in field
+
+
+def compile_join(tree):
+    """
+    Compile the syntax tree with join fields into an aggregation pipeline:
+    conditions without join fields are matched first so that indexes are used,
+    then joined documents are looked up through the unique index of the joined object,
+    and the remaining conditions are matched.
+
+    Parameters:
+    tree (tuple): syntax tree checked by check_terms
+    """
+    obj = next(iter_terms(tree))[1]
+    nodes = tree[1] if tree[0] == AND else [tree]
+    joined_objs = []
+    local_nodes = []
+    joined_nodes = []
+    for node in nodes:
+        fields = [term[2] for term in iter_terms(node) if is_join_field(term[2])]
+        for field in fields:
+            if field.split('.')[0] not in joined_objs:
+                joined_objs.append(field.split('.')[0])
+        (joined_nodes if fields else local_nodes).append(node)
+    pipeline = []
+    if local_nodes:
+        condition = compile_tree((AND, local_nodes) if len(local_nodes) > 1 else local_nodes[0])
+        if is_error_occur(condition):
+            return condition
+        pipeline.append({'$match': condition})
+    for joined_obj in joined_objs:
+        local_field, foreign_field = JOINS[obj][joined_obj]
+        pipeline.append({'$lookup': {'from': OBJECT_TABLES[joined_obj], 'localField': local_field,
+                                     'foreignField': foreign_field,
+                                     'as': JOIN_PREFIX + joined_obj}})
+        # a book has one author, books without author are kept for NOT conditions
+        pipeline.append({'$unwind': {'path': '$' + JOIN_PREFIX + joined_obj,
+                                     'preserveNullAndEmptyArrays': True}})
+    condition = compile_tree((AND, joined_nodes) if len(joined_nodes) > 1 else joined_nodes[0])
+    if is_error_occur(condition):
+        return condition
+    pipeline.append({'$match': condition})
+    return pipeline
 
 
-def content_to_query(field, content):
+def content_to_query(field, content, path=None):
     """
     Convert content section into query which is used in mongo_db.collection.find().
+    Operators are only recognized at the start of the content.
     NOT logical operators. For example, book.rating_count: NOT 123.
     One-side unbounded comparison operators <, >. For example, book.rating_count: > 123.
     Single content without operators. For example, book.book_id: 123.
+    Numeric fields (rating, rating_count, review_count) are matched as numbers:
+    book.rating: 4 is rating equal to 4, not ratings containing 4.
 
     Parameters:
     field (str): field string in query string
     content (str): content string in query string
+    path (str): path of the field in the documents queried, the field if not given
     """
-    if content.find('NOT') != NOT_EXIST:
-        not_content = content.split('NOT')[1].strip()
+    path = path or field
+    if NOT_CONTENT_RE.match(content):
+        not_content = content[len(NOT):].strip()
         type_check = check_content_type(field, not_content)
         if is_error_occur(type_check):
             return type_check
-        return {field: {'$ne': not_content}}
-    if content.find('<') != NOT_EXIST:
-        lt_content = content.split('<')[1]
-        type_check = check_content_type(field, lt_content)
-        if is_error_occur(type_check):
-            return type_check
-        if type_check == CANNOT_BE_COMPARED:
-            return OPERATOR_NOT_APPLICABLE
-        return {'$expr': {'$lt': [{'$toDouble': f'${field}'}, float(lt_content)]}}
-    if content.find('>') != NOT_EXIST:
-        gt_content = content.split('>')[1]
-        type_check = check_content_type(field, gt_content)
-        if is_error_occur(type_check):
-            return type_check
-        if type_check == CANNOT_BE_COMPARED:
-            return OPERATOR_NOT_APPLICABLE
-        return {'$expr': {'$gt': [{'$toDouble': f'${field}'}, float(gt_content)]}}
+        if field in NUMERIC_FIELDS:
+            if not not_content:
+                # negation of the empty content matching every book/author having the field
+                return {path: {'$exists': False}}
+            return {path: {'$ne': content_to_number(field, not_content)}}
+        return {path: {'$ne': strip_quotes(not_content)}}
+    for sign, operator in COMPARISON_OPERATORS.items():
+        if content.startswith(sign):
+            compared_content = content[len(sign):]
+            type_check = check_content_type(field, compared_content)
+            if is_error_occur(type_check):
+                return type_check
+            if type_check == CANNOT_BE_COMPARED:
+                return OPERATOR_NOT_APPLICABLE
+            return comparison_query(field, operator, compared_content, path)
     # single content
     type_check = check_content_type(field, content)
     if is_error_occur(type_check):
         return type_check
+    if field in NUMERIC_FIELDS:
+        if not content.strip():
+            # empty content matches every book/author having the field,
+            # like the substring regex did when numbers were stored as strings
+            return {path: {'$exists': True}}
+        return {path: content_to_number(field, content)}
     condition = condition_single_content(content)
-    return {field: condition}
+    return {path: condition}
+
+
+def content_to_number(field, content):
+    """
+    Convert content of numeric field into the number stored in database.
+    Quotes around content are ignored.
+
+    Parameters:
+    field (str): numeric field string in query string
+    content (str): content string which is checked by check_content_type
+    """
+    content = content.strip().strip('"')
+    return NUMERIC_FIELDS[field](float(content))
+
+
+def comparison_query(field, operator, content, path=None):
+    """
+    Query of one-side unbounded comparison.
+    Numeric fields are stored as numbers and compared directly so that index can be used,
+    ids are stored as strings and converted to double before comparing.
+
+    Parameters:
+    field (str): field string in query string
+    operator (str): '$lt' or '$gt'
+    content (str): content string which can be compared
+    path (str): path of the field in the documents queried, the field if not given
+    """
+    path = path or field
+    if field in NUMERIC_FIELDS:
+        return {path: {operator: float(content)}}
+    return {'$expr': {operator: [{'$toDouble': f'${path}'}, float(content)]}}
 
 
 def condition_single_content(content):
@@ -232,8 +842,20 @@ def condition_single_content(content):
     if content and content[0] == '"' and content[-1] == '"':
         content = content[1:-1]
         return content
-    # query field that contains search words
-    return {'$regex': '.*' + content + '.*'}
+    # query field that contains search words, which are not a regular expression
+    return {'$regex': re.escape(content)}
+
+
+def strip_quotes(content):
+    """
+    Remove the quotes around the exact search term, if any
+
+    Parameters:
+    content (str): content string in query string without operators
+    """
+    if len(content) > 1 and content[0] == '"' and content[-1] == '"':
+        return content[1:-1]
+    return content
 
 
 def check_content_type(field, content):
@@ -255,8 +877,9 @@ def check_content_type(field, content):
         content = content[1:-1]
         has_quote = True
     if field in {'book_id', 'author_id' , 'rating_count', 'review_count'}:
-        # Content value for these field should be integer
-        if not content.isnumeric():
+        # Content value for these field should be integer,
+        # of decimal digits since int() rejects other numeric characters such as '½' or '²'
+        if not content.isdecimal():
             return VALUE_TYPE_ERROR
         if not has_quote:
             return CAN_BE_COMPARED
@@ -284,3 +907,6 @@ def is_error_occur(return_value):
             and OPERATOR_NOT_APPLICABLE <= return_value <= MALFORMED_QUERY_STRING:
         return True
     return False
+
+
+PLAN_CACHE = PlanCache()
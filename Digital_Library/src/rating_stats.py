@@ -0,0 +1,209 @@
+"""
+This module computes statistics of ratings, rating counts and review counts of
+books/authors: count, mean, min, max, percentiles and a histogram.
+The numbers are kept in memory as one column per field, mirrored from the tables and
+refreshed incrementally with the books/authors written since the previous refresh.
+Statistics are cached until the columns change, and are vectorized with NumPy if it is
+installed, otherwise computed in pure Python with the same results up to rounding.
+"""
+import math
+from array import array
+from collections import Counter
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from src.database import UNIQUE_INDEXES
+from src.schema import NUMERIC_FIELDS
+from src.table_mirror import TableMirror
+
+STAT_FIELDS = tuple(NUMERIC_FIELDS)
+DEFAULT_BUCKET_WIDTHS = {'rating': 0.5, 'rating_count': 1000, 'review_count': 100}
+PERCENTILES = (25, 50, 75, 90, 99)
+MISSING = math.nan
+# digits kept when dividing by the bucket width, so 4.1 / 0.1 falls in bucket 41, not 40
+BUCKET_DIGITS = 9
+# narrower buckets are rejected by the api
+MIN_BUCKET_WIDTH = 1e-6
+# bucket numbers are int64 in NumPy, so values divided by the bucket width stay below it
+MAX_BUCKET_NUMBER = 2 ** 63
+
+
+class RatingColumns:
+    """
+    Columns of the numeric fields of one table, with one slot per book/author.
+    Slots of deleted books/authors are reused, missing values are NaN.
+    """
+
+    def __init__(self):
+        """
+        Initialize empty columns
+        """
+        self.slots = {}
+        self.free_slots = []
+        self.columns = {field: array('d') for field in STAT_FIELDS}
+
+    def __len__(self):
+        """
+        Number of books/authors in the columns
+        """
+        return len(self.slots)
+
+    def set(self, doc_id, doc):
+        """
+        Set the values of the book/author, NaN for fields which are not numbers
+        """
+        slot = self.slots.get(doc_id)
+        if slot is None:
+            if self.free_slots:
+                slot = self.free_slots.pop()
+            else:
+                slot = len(self.columns[STAT_FIELDS[0]])
+                for column in self.columns.values():
+                    column.append(MISSING)
+            self.slots[doc_id] = slot
+        for field, column in self.columns.items():
+            value = doc.get(field)
+            is_number = isinstance(value, (int, float)) and not isinstance(value, bool)
+            column[slot] = value if is_number else MISSING
+
+    def remove(self, doc_id):
+        """
+        Remove the book/author if it is in the columns
+        """
+        slot = self.slots.pop(doc_id, None)
+        if slot is None:
+            return
+        for column in self.columns.values():
+            column[slot] = MISSING
+        self.free_slots.append(slot)
+
+    def values(self, field):
+        """
+        Return the values of the field which are not missing,
+        as a NumPy array if NumPy is installed, otherwise as a sorted list
+        """
+        column = self.columns[field]
+        if numpy is not None:
+            # view of the column without copying it
+            values = numpy.frombuffer(column, dtype=numpy.float64)
+            return values[~numpy.isnan(values)]
+        return sorted(value for value in column if not math.isnan(value))
+
+
+class RatingStats(TableMirror):
+    """
+    Statistics of the numeric fields of books/authors, refreshed incrementally on writes
+    """
+
+    def __init__(self, database):
+        """
+        Initialize the statistics of the database, the columns are loaded on first use
+
+        Parameters:
+        database (Database): database of books/authors
+        """
+        super().__init__(database, dict.fromkeys(UNIQUE_INDEXES, STAT_FIELDS))
+        self.columns = {table_name: RatingColumns() for table_name in UNIQUE_INDEXES}
+        self.results = {}
+
+    def set_document(self, table_name, doc_id, doc):
+        """
+        Store the numeric fields of the book/author in the columns
+        """
+        self.columns[table_name].set(doc_id, doc)
+
+    def remove_document(self, table_name, doc_id):
+        """
+        Remove the book/author from the columns
+        """
+        self.columns[table_name].remove(doc_id)
+
+    def stats(self, table_name, field='rating', bucket_width=None):
+        """
+        Return count, mean, min, max, percentiles and histogram of the field as a dict.
+        The histogram lists the non-empty buckets [start, start + bucket_width).
+
+        Parameters:
+        table_name (str): BOOKS_TABLE or AUTHORS_TABLE
+        field (str): one of STAT_FIELDS
+        bucket_width (float): width of histogram buckets, DEFAULT_BUCKET_WIDTHS if not given
+        """
+        if bucket_width is None:
+            bucket_width = DEFAULT_BUCKET_WIDTHS[field]
+        key = (table_name, field, bucket_width)
+        with self.lock:
+            if self.refresh(table_name):
+                self.results = {cached_key: result for cached_key, result in self.results.items()
+                                if cached_key[0] != table_name}
+            if key not in self.results:
+                values = self.columns[table_name].values(field)
+                self.results[key] = compute_stats(values, bucket_width)
+            return self.results[key]
+
+    def clear(self):
+        """
+        Drop the columns and cached statistics, they are loaded again on next use
+        """
+        with self.lock:
+            super().clear()
+            self.columns = {table_name: RatingColumns() for table_name in UNIQUE_INDEXES}
+            self.results = {}
+
+
+def compute_stats(values, bucket_width):
+    """
+    Compute the statistics of the values, vectorized if values is a NumPy array.
+    Percentiles are interpolated linearly between the closest values.
+    Raise ValueError if the bucket width is too narrow to number the buckets of the values.
+
+    Parameters:
+    values (object): NumPy array, or sorted list of numbers
+    bucket_width (float): width of histogram buckets
+    """
+    count = len(values)
+    result = {'count': count, 'mean': None, 'min': None, 'max': None,
+              'percentiles': {f'p{percent}': None for percent in PERCENTILES},
+              'histogram': []}
+    if not count:
+        return result
+    is_vectorized = numpy is not None and isinstance(values, numpy.ndarray)
+    if is_vectorized:
+        low, high = float(values.min()), float(values.max())
+    else:
+        low, high = float(values[0]), float(values[-1])
+    if not max(-low, high) / bucket_width < MAX_BUCKET_NUMBER:
+        raise ValueError(f'Bucket width {bucket_width} is too narrow for values up to '
+                         f'{max(-low, high)}')
+    result.update(min=low, max=high)
+    if is_vectorized:
+        result['mean'] = float(values.mean())
+        percentiles = numpy.percentile(values, PERCENTILES).tolist()
+        buckets = numpy.floor(numpy.round(values / bucket_width, BUCKET_DIGITS)) \
+            .astype(numpy.int64)
+        bucket_numbers, bucket_counts = numpy.unique(buckets, return_counts=True)
+        histogram = zip(bucket_numbers.tolist(), bucket_counts.tolist())
+    else:
+        result['mean'] = math.fsum(values) / count
+        percentiles = [percentile(values, percent) for percent in PERCENTILES]
+        histogram = sorted(Counter(math.floor(round(value / bucket_width, BUCKET_DIGITS))
+                                   for value in values).items())
+    result['percentiles'] = {f'p{percent}': value
+                             for percent, value in zip(PERCENTILES, percentiles)}
+    result['histogram'] = [{'start': round(number * bucket_width, 10),
+                            'end': round((number + 1) * bucket_width, 10), 'count': bucket_count}
+                           for number, bucket_count in histogram]
+    return result
+
+
+def percentile(sorted_values, percent):
+    """
+    Percentile of the sorted values, interpolated linearly like numpy.percentile
+    """
+    position = (len(sorted_values) - 1) * percent / 100
+    lower = math.floor(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    fraction = position - lower
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * fraction
@@ -0,0 +1,136 @@
+"""
+This module caches the responses of searches in memory.
+The cache is bounded by number of entries, total bytes and time to live of an entry.
+Every entry belongs to the tables it was read from and is dropped as soon as one of them is
+written, so a response is never served from the cache after a write of its tables.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_MAX_ENTRIES = 512
+DEFAULT_MAX_BYTES = 32 << 20
+DEFAULT_TTL = 300.0
+
+
+class ResultCache:
+    """
+    LRU cache of search responses invalidated per table by writes
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES,
+                 ttl=DEFAULT_TTL):
+        """
+        Initialize an empty cache
+
+        Parameters:
+        max_entries (int): number of responses kept, the least recently used is evicted
+        max_bytes (int): total size of responses kept
+        ttl (float): seconds a response is kept, which bounds staleness after writes
+                     made by other processes
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        # key: (table names, expiry time, size, value)
+        self.entries = OrderedDict()
+        self.generations = {}
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        """
+        Number of cached responses
+        """
+        with self.lock:
+            return len(self.entries)
+
+    def generation(self, table_names):
+        """
+        Return the number of writes of each table seen by the cache as a dict.
+        It is read before a search runs and given back to put, so a response read
+        while one of its tables was written is not cached.
+        """
+        with self.lock:
+            return {table_name: self.generations.get(table_name, 0)
+                    for table_name in table_names}
+
+    def get(self, key):
+        """
+        Return the cached response of the key, None if it is not cached or expired
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[1] <= time.monotonic():
+                self.remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[3]
+
+    def put(self, key, generation, value, size):
+        """
+        Cache the response of the key read from the tables and return whether it is cached.
+        The response is not cached if it is larger than the cache, or if one of the tables
+        was written since the generation was read.
+
+        Parameters:
+        key (hashable): key of the search
+        generation (dict): generation of the tables the response is read from,
+                           read before the search
+        value (object): response to cache
+        size (int): size of the response in bytes
+        """
+        if size > self.max_bytes:
+            return False
+        with self.lock:
+            if any(count != self.generations.get(table_name, 0)
+                   for table_name, count in generation.items()):
+                return False
+            if key in self.entries:
+                self.remove(key)
+            self.entries[key] = (tuple(generation), time.monotonic() + self.ttl, size, value)
+            self.size += size
+            while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+                self.remove(next(iter(self.entries)))
+        return True
+
+    def invalidate(self, table_name):
+        """
+        Drop the responses read from the table, used as write listener of the database
+        """
+        with self.lock:
+            self.generations[table_name] = self.generations.get(table_name, 0) + 1
+            for key in [key for key, entry in self.entries.items() if table_name in entry[0]]:
+                self.remove(key)
+
+    def remove(self, key):
+        """
+        Remove the entry of the key, callers hold the lock
+        """
+        entry = self.entries.pop(key)
+        self.size -= entry[2]
+
+    def stats(self):
+        """
+        Return the size, bytes, hits and misses of the cache as a dict
+        """
+        with self.lock:
+            return {'size': len(self.entries), 'max_size': self.max_entries,
+                    'bytes': self.size, 'max_bytes': self.max_bytes,
+                    'hits': self.hits, 'misses': self.misses}
+
+    def clear(self):
+        """
+        Remove all cached responses and reset the counters
+        """
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+            self.hits = 0
+            self.misses = 0
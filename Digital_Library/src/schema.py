@@ -0,0 +1,181 @@
+"""
+This module defines the schemas of books and authors.
+A schema is compiled once into one normalizer per attribute, then validates and
+normalizes documents in a single pass over their keys, reporting errors per document.
+"""
+BOOK_ATTRIBUTES = {'book_url', 'title', 'book_id', 'ISBN', 'author_url', 'author', 'author_id',
+                   'rating', 'rating_count', 'review_count', 'image_url', 'similar_books',
+                   'similar_book_ids'}
+AUTHOR_ATTRIBUTES = {'name', 'author_url', 'author_id', 'rating', 'rating_count',
+                     'review_count', 'image_url', 'related_authors', 'related_author_ids',
+                     'author_books'}
+NUMERIC_FIELDS = {'rating': float, 'rating_count': int, 'review_count': int}
+ID_FIELDS = {'book_id', 'author_id'}
+ID_LIST_FIELDS = {'similar_book_ids', 'related_author_ids'}
+LIST_FIELDS = {'similar_books', 'related_authors', 'author_books'}
+# values treated as missing attributes
+EMPTY_VALUES = ('', None)
+
+
+def to_number(value, number_type):
+    """
+    Convert value to number_type (int or float), None if it is not a number
+    """
+    if isinstance(value, bool):
+        return None
+    try:
+        return number_type(value)
+    except (TypeError, ValueError):
+        pass
+    try:
+        return number_type(float(value))
+    except (TypeError, ValueError, OverflowError):
+        return None
+
+
+def normalize_string(value):
+    """
+    Check value is a string
+    """
+    if not isinstance(value, str):
+        raise ValueError(f'{value!r} is not a string')
+    return value
+
+
+def normalize_id(value):
+    """
+    Check value is a string of digits
+    """
+    if not isinstance(value, str) or not value.isnumeric():
+        raise ValueError(f'{value!r} is not a valid id')
+    return value
+
+
+def normalize_list(value):
+    """
+    Check value is a list
+    """
+    if not isinstance(value, list):
+        raise ValueError(f'{value!r} is not a list')
+    return value
+
+
+def normalize_id_list(value):
+    """
+    Check value is a list of ids
+    """
+    return [normalize_id(element) for element in normalize_list(value)]
+
+
+def compile_number(number_type):
+    """
+    Return the normalizer converting numbers and numeric strings into number_type
+    """
+    def normalize_number(value):
+        number = to_number(value, number_type)
+        if number is None:
+            raise ValueError(f'{value!r} is not a number')
+        return number
+    return normalize_number
+
+
+def compile_attribute(attribute):
+    """
+    Return the normalizer of the attribute
+    """
+    if attribute in NUMERIC_FIELDS:
+        return compile_number(NUMERIC_FIELDS[attribute])
+    if attribute in ID_FIELDS:
+        return normalize_id
+    if attribute in ID_LIST_FIELDS:
+        return normalize_id_list
+    if attribute in LIST_FIELDS:
+        return normalize_list
+    return normalize_string
+
+
+class Schema:
+    """
+    Compiled schema of books or authors
+    """
+
+    def __init__(self, object_name, id_key, attributes):
+        """
+        Compile the normalizers of the attributes
+
+        Parameters:
+        object_name (str): 'Book' or 'Author', used in error messages
+        id_key (str): attribute holding the id
+        attributes (set): valid attributes
+        """
+        self.object_name = object_name
+        self.id_key = id_key
+        self.attributes = frozenset(attributes)
+        self.normalizers = {attribute: compile_attribute(attribute) for attribute in attributes}
+
+    def validate(self, dic):
+        """
+        Validate and normalize the dict of book/author.
+        Empty values are removed, numbers are converted to their type, invalid attributes
+        are ignored and attributes with invalid values are removed.
+        Return the report as a dict with keys:
+        'id': id of the book/author, None if missing
+        'document': normalized dict, None if dict is not a dict or has no valid id
+        'errors': messages of invalid values
+        'ignored': names of invalid attributes
+        """
+        report = {'id': None, 'document': None, 'errors': [], 'ignored': []}
+        if not isinstance(dic, dict):
+            report['errors'].append(f'{self.object_name} is not a dict')
+            return report
+        doc_id = dic.get(self.id_key)
+        if doc_id not in EMPTY_VALUES:
+            report['id'] = doc_id
+        document = {}
+        normalizers = self.normalizers
+        for attribute, value in dic.items():
+            normalizer = normalizers.get(attribute)
+            if normalizer is None:
+                report['ignored'].append(attribute)
+                continue
+            if value in EMPTY_VALUES:
+                continue
+            try:
+                document[attribute] = normalizer(value)
+            except ValueError as error:
+                report['errors'].append(f'{self.object_name} with id {doc_id} '
+                                        f'has invalid {attribute}: {error}')
+        if self.id_key not in document:
+            if report['id'] is None:
+                report['errors'].append(f'{self.object_name} has no id')
+            return report
+        report['document'] = document
+        return report
+
+    def validate_batch(self, documents):
+        """
+        Validate and normalize dicts of books/authors in one pass.
+        Return the list of reports in the order of documents.
+        """
+        return [self.validate(dic) for dic in documents]
+
+    def error_messages(self, report):
+        """
+        Return all messages of the report, including invalid attributes
+        """
+        messages = list(report['errors'])
+        for attribute in report['ignored']:
+            messages.append(f'{self.object_name} with id {report["id"]} '
+                            f'has invalid attribute {attribute}')
+        return messages
+
+    def print_report(self, report):
+        """
+        Print the messages of the report as malformed data structure
+        """
+        for message in self.error_messages(report):
+            print(f'Malformed data structure: {message}')
+
+
+BOOK_SCHEMA = Schema('Book', 'book_id', BOOK_ATTRIBUTES)
+AUTHOR_SCHEMA = Schema('Author', 'author_id', AUTHOR_ATTRIBUTES)
@@ -1,10 +1,10 @@
 /**
- * Fetch the authors data from api,
+ * Fetch the top rating authors ranked by the api,
  * then visualize the data.
- * @param {Array} k intended number of top rating authors
+ * @param {Integer} k intended number of top rating authors
  */
- function getAuthors(k) {
-    fetch('http://127.0.0.1:5000/api/search?q=author.author_id:', {
+function getAuthors(k) {
+    fetch('http://127.0.0.1:5000/api/top-authors?k=' + k, {
         method: 'GET'
     })
     .then(response => {
@@ -13,8 +13,7 @@
     .then(data => {
         console.log(data)
         if (data instanceof Array) {
-            dataset = parseData(data, k)
-            visualize(dataset)
+            visualize(data)
         }
     })
     .catch(error => {
@@ -22,51 +21,6 @@
     })
 }
 
-/**
- * Parse the data to retrive only author name and rating,
- * then sort the data in descending order of rating.
- * @param {Array} data array of book dictionary
- * @param {Integer} k intended number of top rating books
- * @returns sorted array of book dictionary
- */
-function parseData(data, k) {
-    var dataset = []
-    var targetK = k
-    if (data.length < k) {
-        targetK = data.length
-    }
-    for (var i = 0; i < data.length; i++) {
-        doc = data[i]
-        if ('rating' in doc) {
-            dataset.push({'name': doc['name'], 'rating': doc['rating']})
-        }
-    }
-    sortedDataset = quicksort(dataset).reverse()
-    if (sortedDataset.length < targetK) {
-        return sortedDataset
-    }
-    return sortedDataset.slice(0, targetK)
-}
-
-/**
- * Quicksort for array of author dictionary
- * @param {Array} array array of author dictionary to sort
- * @returns sorted array
- */
-function quicksort(array) {
-    if (array.length <= 1) {
-        return array
-    }
-    var left = []
-    var right = []
-    var pivot = array[0]
-    var pivotVal = Number(pivot['rating'])
-    for (var i = 1; i < array.length; i++) {
-        Number(array[i]['rating']) < pivotVal ? left.push(array[i]) : right.push(array[i])
-    }
-    return quicksort(left).concat(pivot, quicksort(right))
-}
-
 /**
  * Use bar chart in svg to visualize the top rating authors
  * @param {Array} dataset array of author dictionary
@@ -0,0 +1,105 @@
+"""
+This module keeps some fields of books/authors mirrored in memory for structures which
+are faster to build in the application than in the database, e.g. statistics columns.
+A mirror is loaded with one scan of the table and refreshed incrementally: only
+books/authors stamped with a modification marker greater than the settled marker of the
+previous refresh, and tombstones of deleted ones, are read again.
+"""
+import abc
+import threading
+import time
+
+from src.database import UNIQUE_INDEXES, MODIFIED_FIELD
+
+# seconds a mirror is not refreshed if it is not written by this process,
+# bounding how long writes of other processes are not seen
+REFRESH_INTERVAL = 1.0
+
+
+class TableMirror(abc.ABC):
+    """
+    Base class of in-memory mirrors of books/authors tables.
+    Subclasses store the mirrored documents in set_document and remove_document.
+    """
+
+    def __init__(self, database, fields):
+        """
+        Initialize the mirror of the database, tables are loaded on first refresh
+
+        Parameters:
+        database (Database): database of books/authors
+        fields (dict): table name to list of mirrored fields
+        """
+        self.database = database
+        self.fields = fields
+        # table name: (settled marker of the previous refresh, time of the previous refresh)
+        self.markers = {}
+        self.dirty = set()
+        self.lock = threading.RLock()
+        database.add_write_listener(self.mark_dirty)
+
+    def mark_dirty(self, table_name):
+        """
+        Mark the table as written, used as write listener of the database
+        """
+        with self.lock:
+            self.dirty.add(table_name)
+
+    def refresh(self, table_name):
+        """
+        Update the mirror of the table with the books/authors written since the settled
+        marker of the previous refresh, and return whether anything was read.
+        Reading from the settled marker catches documents stamped with a marker before the
+        previous refresh but written after it.
+        Nothing is read if the table was not written by this process since the previous
+        refresh, less than REFRESH_INTERVAL ago.
+        """
+        with self.lock:
+            now = time.monotonic()
+            markers = self.markers.get(table_name)
+            if (markers is not None and table_name not in self.dirty
+                    and now - markers[1] < REFRESH_INTERVAL):
+                return False
+            self.dirty.discard(table_name)
+            settled = self.database.settled_modified()
+            id_key = UNIQUE_INDEXES[table_name]
+            table = self.database.get_table(table_name)
+            projection = {'_id': 0, id_key: 1}
+            projection.update(dict.fromkeys(self.fields[table_name], 1))
+            if markers is None:
+                for doc in table.find({}, projection):
+                    self.set_document(table_name, doc[id_key], doc)
+                self.markers[table_name] = (settled, now)
+                return True
+            my_filter = {MODIFIED_FIELD: {'$gt': markers[0]}}
+            written_ids = set()
+            for doc in table.find(my_filter, projection):
+                self.set_document(table_name, doc[id_key], doc)
+                written_ids.add(doc[id_key])
+            tombstones = self.database.tombstones_tb.find(dict(my_filter, table=table_name),
+                                                          {'_id': 0, 'id': 1})
+            for tombstone in tombstones:
+                if tombstone['id'] not in written_ids:
+                    self.remove_document(table_name, tombstone['id'])
+                    written_ids.add(tombstone['id'])
+            self.markers[table_name] = (settled, now)
+            return bool(written_ids)
+
+    @abc.abstractmethod
+    def set_document(self, table_name, doc_id, doc):
+        """
+        Store the mirrored fields of the book/author
+        """
+
+    @abc.abstractmethod
+    def remove_document(self, table_name, doc_id):
+        """
+        Remove the book/author if it is mirrored
+        """
+
+    def clear(self):
+        """
+        Forget the mirrored tables, they are loaded again on next refresh
+        """
+        with self.lock:
+            self.markers = {}
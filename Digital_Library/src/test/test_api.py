@@ -95,6 +95,10 @@ class TestApi(unittest.TestCase):
         response = requests.get(BASE + 'api/search?q=book.book_id:NOT 4096ANDbook.book_id:NOT 5096')
         self.assertEqual(404, response.status_code)
 
+        response = requests.get(BASE + 'api/search?q=(book.title:none OR book.ISBN:3) '
+                                       'AND NOT (book.book_id:5096 OR book.ISBN:"4")')
+        self.assertEqual(200, response.status_code)
+
     def test_get_by_query_comparison_operator(self):
         """
         Test GET api/search?q={query_string} with
@@ -115,6 +119,202 @@ class TestApi(unittest.TestCase):
         response = requests.get(BASE + 'api/search?q=author.name: > eee')
         self.assertEqual(400, response.status_code)
 
+    def test_get_by_query_pagination(self):
+        """
+        Test GET api/search?q={query_string}&limit={int}&after={id}&format={json|ndjson}
+        """
+        json_content = [{'book_id': str(book_id), 'title': 'test page book'}
+                        for book_id in range(6010, 6015)]
+        requests.post(BASE + 'api/books', json=json_content)
+        response = requests.get(BASE + 'api/search?q=book.title:test page&limit=3')
+        self.assertEqual(['6010', '6011', '6012'], [book['book_id'] for book in response.json()])
+        after = response.headers['X-Next-After']
+        response = requests.get(BASE + f'api/search?q=book.title:test page&limit=3&after={after}')
+        self.assertEqual(['6013', '6014'], [book['book_id'] for book in response.json()])
+        self.assertNotIn('X-Next-After', response.headers)
+
+        response = requests.get(BASE + 'api/search?q=book.title:test page&format=ndjson')
+        self.assertEqual(5, len(response.text.splitlines()))
+        response = requests.get(BASE + 'api/search?q=book.title:test page&limit=0')
+        self.assertEqual(400, response.status_code)
+
+        response = requests.get(BASE + 'api/search?q=book.title:test page&limit=1&fields=title')
+        self.assertEqual([{'title': 'test page book'}], response.json())
+        response = requests.get(BASE + 'api/book?id=6010&fields=book_id,rating')
+        self.assertEqual({'book_id': '6010'}, response.json())
+        response = requests.get(BASE + 'api/book?id=6010&fields=name')
+        self.assertEqual(400, response.status_code)
+
+    def test_get_by_query_cached(self):
+        """
+        Test GET api/search?q={query_string} returns written documents after a cached search
+        """
+        requests.post(BASE + 'api/book', json={'book_id': '6020', 'title': 'test cache book'})
+        requests.get(BASE + 'api/search?q=book.title:test cache')
+        response = requests.get(BASE + 'api/search?q=book.title:test cache')
+        self.assertEqual(['6020'], [book['book_id'] for book in response.json()])
+        requests.post(BASE + 'api/book', json={'book_id': '6021', 'title': 'test cache book'})
+        response = requests.get(BASE + 'api/search?q=book.title:test cache')
+        self.assertEqual(['6020', '6021'], [book['book_id'] for book in response.json()])
+        requests.delete(BASE + 'api/book?id=6020')
+        response = requests.get(BASE + 'api/search?q=book.title:test cache')
+        self.assertEqual(['6021'], [book['book_id'] for book in response.json()])
+
+    def test_get_by_query_join(self):
+        """
+        Test GET api/search?q={query_string} with fields of the author of books
+        """
+        json_content = [{'book_id': '6030', 'title': 'test join book', 'author_id': '6031'},
+                        {'book_id': '6032', 'title': 'test join book'}]
+        requests.post(BASE + 'api/books', json=json_content)
+        requests.post(BASE + 'api/author', json={'author_id': '6031', 'rating': '4.5'})
+        query_string = 'book.title:test join AND book.author.rating:>4.2'
+        response = requests.get(BASE + 'api/search?q=' + query_string)
+        self.assertEqual(['6030'], [book['book_id'] for book in response.json()])
+        self.assertNotIn('_author', response.json()[0])
+        response = requests.get(BASE + 'api/search?q=book.title:test join AND NOT '
+                                       'book.author.rating:>4.2')
+        self.assertEqual(['6032'], [book['book_id'] for book in response.json()])
+        requests.put(BASE + 'api/author?id=6031', json={'rating': '3.0'})
+        response = requests.get(BASE + 'api/search?q=' + query_string)
+        self.assertEqual(404, response.status_code)
+        response = requests.get(BASE + 'api/search?q=book.author.title:test')
+        self.assertEqual(400, response.status_code)
+
+    def test_get_query_explain(self):
+        """
+        Test GET api/search/explain?q={query_string}
+        """
+        response = requests.get(BASE + 'api/search/explain?q=dog.book_id:256')
+        self.assertEqual(400, response.status_code)
+
+        requests.get(BASE + 'api/search/explain?q=book.book_id:"6010"')
+        response = requests.get(BASE + 'api/search/explain?q=book.book_id:"6010"')
+        self.assertEqual(200, response.status_code)
+        explain = response.json()
+        self.assertEqual({'book_id': '6010'}, explain['filter'])
+        self.assertTrue(explain['plan_cache_hit'])
+        self.assertEqual('book_id_1', explain['index'])
+
+    def test_get_similar_books(self):
+        """
+        Test GET api/book/similar?id={attr_value} and api/author/books?id={attr_value}
+        """
+        response = requests.get(BASE + 'api/book/similar?id=123')
+        self.assertEqual(404, response.status_code)
+
+        json_content = [{'book_id': '2048', 'title': 'Linked Book', 'author_id': '2050',
+                         'similar_book_ids': ['2049', '404']},
+                        {'book_id': '2049', 'title': 'Similar Book'}]
+        requests.post(BASE + 'api/books', json=json_content)
+        requests.post(BASE + 'api/author', json={'author_id': '2050', 'name': 'Linked Author'})
+        response = requests.get(BASE + 'api/book/similar?id=2048')
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(['2049'], [book['book_id'] for book in response.json()])
+        response = requests.get(BASE + 'api/author/books?id=2050')
+        self.assertEqual(['2048'], [book['book_id'] for book in response.json()])
+
+    def test_get_top_books_authors(self):
+        """
+        Test GET api/top-books?k={int} and api/top-authors?k={int}
+        """
+        json_content = [{'book_id': '6040', 'title': 'test top book', 'rating': '4.99'},
+                        {'book_id': '6041', 'title': 'test top book', 'rating': '5.0'}]
+        requests.post(BASE + 'api/books', json=json_content)
+        response = requests.get(BASE + 'api/top-books?k=2')
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(5.0, response.json()[0]['rating'])
+        self.assertEqual({'book_id', 'title', 'rating'}, set(response.json()[0]))
+        ratings = [book['rating'] for book in response.json()]
+        self.assertEqual(sorted(ratings, reverse=True), ratings)
+        response = requests.get(BASE + 'api/top-authors?k=3')
+        self.assertLessEqual(len(response.json()), 3)
+        response = requests.get(BASE + 'api/top-books?k=0')
+        self.assertEqual(400, response.status_code)
+
+    def test_get_stats(self):
+        """
+        Test GET api/stats?object={book|author}&field={field}&bucket={width}
+        """
+        response = requests.get(BASE + 'api/stats?object=book&field=rating')
+        count = response.json()['count']
+        requests.post(BASE + 'api/book',
+                      json={'book_id': '6050', 'title': 'stats', 'rating': '4.1'})
+        response = requests.get(BASE + 'api/stats?object=book&field=rating&bucket=0.1')
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(count + 1, response.json()['count'])
+        self.assertIn(4.1, [bucket['start'] for bucket in response.json()['histogram']])
+        response = requests.get(BASE + 'api/stats?object=book&field=title')
+        self.assertEqual(400, response.status_code)
+        response = requests.get(BASE + 'api/stats?object=author&bucket=-1')
+        self.assertEqual(400, response.status_code)
+
+    def test_get_by_text(self):
+        """
+        Test GET api/search/text?object={book|author}&q={words}&rank={true|false}
+        """
+        response = requests.get(BASE + 'api/search/text?object=dog&q=logical')
+        self.assertEqual(400, response.status_code)
+
+        requests.post(BASE + 'api/book', json={'book_id': '7070', 'title': 'A logical book'})
+        response = requests.get(BASE + 'api/search/text?object=book&q=LOGICAL&rank=true')
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(['7070'], [book['book_id'] for book in response.json()])
+        response = requests.get(BASE + 'api/search/text?object=book&q=logical -book')
+        self.assertEqual(404, response.status_code)
+
+    def test_get_by_fuzzy(self):
+        """
+        Test GET api/search/fuzzy?object={book|author}&q={title/name}&limit={int}
+        """
+        response = requests.get(BASE + 'api/search/fuzzy?object=dog&q=Refactorng')
+        self.assertEqual(400, response.status_code)
+        response = requests.get(BASE + 'api/search/fuzzy?object=book&q=Refactorng&limit=0')
+        self.assertEqual(400, response.status_code)
+
+        requests.post(BASE + 'api/book', json={'book_id': '7171', 'title': 'Fuzzytesting Book'})
+        response = requests.get(BASE + 'api/search/fuzzy?object=book&q=fuzytesting&limit=1')
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(['7171'], [book['book_id'] for book in response.json()])
+        response = requests.get(BASE + 'api/search/fuzzy?object=book&q=zzzzzzzz')
+        self.assertEqual(404, response.status_code)
+
+    def test_post_search_batch(self):
+        """
+        Test POST api/search/batch?limit={int}&fields={fields}
+        """
+        response = requests.post(BASE + 'api/search/batch', json={'q': 'book.book_id:1'})
+        self.assertEqual(400, response.status_code)
+        response = requests.post(BASE + 'api/search/batch', json=[])
+        self.assertEqual(400, response.status_code)
+
+        requests.post(BASE + 'api/book', json={'book_id': '7272', 'title': 'Batch Book'})
+        json_content = ['book.book_id:7272', 'book.book_id', 'book.book_id:7373']
+        response = requests.post(BASE + 'api/search/batch?limit=5&fields=title',
+                                 json=json_content)
+        self.assertEqual(200, response.status_code)
+        res = response.json()
+        self.assertEqual(json_content, [entry['query'] for entry in res])
+        self.assertEqual([{'title': 'Batch Book'}], res[0]['results'])
+        self.assertEqual(-1, res[1]['code'])
+        self.assertEqual([], res[2]['results'])
+
+    def test_get_autocomplete(self):
+        """
+        Test GET api/autocomplete?object={book|author}&q={prefix}&limit={int}
+        """
+        response = requests.get(BASE + 'api/autocomplete?object=dog&q=aut')
+        self.assertEqual(400, response.status_code)
+        response = requests.get(BASE + 'api/autocomplete?object=book&q=%20')
+        self.assertEqual(400, response.status_code)
+
+        requests.post(BASE + 'api/book', json={'book_id': '7474', 'title': 'Autocompletion Book'})
+        response = requests.get(BASE + 'api/autocomplete?object=book&q=autocompletion&limit=1')
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(['7474'], [book['book_id'] for book in response.json()])
+        response = requests.get(BASE + 'api/autocomplete?object=book&q=zzzzzzzz')
+        self.assertEqual(404, response.status_code)
+
     def test_put_book_by_id(self):
         """
         Test PUT api/book?id={attr_value}
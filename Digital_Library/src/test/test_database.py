@@ -1,9 +1,15 @@
 """
 This module is test for database
 """
+import json
+import os
+import tempfile
 import unittest
 
-from src.database import Database
+from pymongo import ASCENDING
+
+from src.database import Database, WriteBehindBuffer, OUTPUT_PROJECTION, BOOKS_TABLE
+from src.memory_backend import MemoryDatabase
 
 
 class TestDatabase(unittest.TestCase):
@@ -11,6 +17,24 @@ class TestDatabase(unittest.TestCase):
     Test class for methods in database
     """
 
+    def setUp(self):
+        """
+        Create a temporary directory for the files written by tests
+        """
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        """
+        Remove the temporary directory and its files
+        """
+        self.directory.cleanup()
+
+    def temp_path(self, file_name):
+        """
+        Return the path of the file in the temporary directory
+        """
+        return os.path.join(self.directory.name, file_name)
+
     def test_is_book_exist(self):
         """
         Test method is_book_exist
@@ -69,16 +93,238 @@ class TestDatabase(unittest.TestCase):
         self.assertNotEqual(None, new_book)
         self.assertEqual('Clean Code', new_book['title'])
         self.assertEqual('12345', new_book['ISBN'])
-        self.assertEqual('5.0', new_book['rating'])
+        self.assertEqual(5.0, new_book['rating'])
         author_id = '45372'
         new_author = database.authors_tb.find_one({'author_id': author_id})
         self.assertNotEqual(None, new_author)
-        self.assertEqual('1000', new_author['review_count'])
+        self.assertEqual(1000, new_author['review_count'])
         self.assertEqual(["CC", "TCC"], new_author['author_books'])
 
+    def test_bulk_upsert_books(self):
+        """
+        Test method bulk_upsert_books with chunked bulk writes
+        """
+        array_books = [{'book_id': '901', 'title': 'Bulk One'},
+                       {'book_id': '902', 'title': 'Bulk Two', 'invalid': 'value'},
+                       {'title': 'Bulk No Id'}]
+        reports = database.bulk_upsert_books(array_books, chunk_size=2)
+        self.assertEqual(2, len(reports))
+        self.assertEqual(2, reports[0]['inserted'])
+        self.assertEqual(1, reports[1]['skipped'])
+        self.assertNotIn('invalid', database.books_tb.find_one({'book_id': '902'}))
+        reports = database.bulk_upsert_books([{'book_id': '901', 'title': 'Bulk New'}])
+        self.assertEqual(1, reports[0]['updated'])
+        self.assertEqual('Bulk New', database.books_tb.find_one({'book_id': '901'})['title'])
+
+    def test_indexes(self):
+        """
+        Test methods ensure_indexes, list_indexes, build_index and drop_index
+        """
+        index_names = [index['name'] for index in database.list_indexes('books_table')]
+        self.assertIn('book_id_1', index_names)
+        unique_names = [index['name'] for index in database.list_indexes('authors_table')
+                        if index['unique']]
+        self.assertEqual(['author_id_1'], unique_names)
+        self.assertEqual('ISBN_1', database.build_index('books_table', 'ISBN'))
+        self.assertTrue(database.drop_index('books_table', 'ISBN_1'))
+        self.assertFalse(database.drop_index('books_table', 'ISBN_1'))
+
+    def test_export_to_json_file(self):
+        """
+        Test method export_to_json_file in JSON and newline-delimited JSON
+        """
+        database.update_insert_books_tb({'book_id': '903', 'title': 'Export Book'})
+        json_file = self.temp_path('library.json')
+        ndjson_file = self.temp_path('library.ndjson')
+        count = database.export_to_json_file(json_file, batch_size=1)
+        with open(json_file, 'r') as file:
+            content = json.load(file)
+        self.assertEqual(count, len(content['books']) + len(content['authors']))
+        self.assertIn({'book_id': '903', 'title': 'Export Book'}, content['books'])
+        database.export_to_json_file(ndjson_file)
+        with open(ndjson_file, 'r') as file:
+            lines = [json.loads(line) for line in file]
+        self.assertEqual(count, len([line for line in lines if line['type'] != 'watermark']))
+        self.assertIn({'book_id': '903', 'title': 'Export Book', 'type': 'book'}, lines)
+
+    def test_incremental_export(self):
+        """
+        Test method export_to_json_file exporting changes since a watermark
+        and importing them with method update_insert_from_json_file
+        """
+        database.update_insert_books_tb({'book_id': '907', 'title': 'Kept Book'})
+        database.update_insert_books_tb({'book_id': '908', 'title': 'Deleted Book'})
+        json_file = self.temp_path('library.json')
+        database.export_to_json_file(json_file)
+        with open(json_file, 'r') as file:
+            watermark = json.load(file)['watermark']
+        since = database.current_modified()
+        database.update_insert_books_tb({'book_id': '909', 'title': 'New Book'})
+        self.assertTrue(database.delete_book('908'))
+        count = database.export_to_json_file(json_file, since=since)
+        with open(json_file, 'r') as file:
+            content = json.load(file)
+        self.assertEqual(2, count)
+        self.assertEqual([{'book_id': '909', 'title': 'New Book'}], content['books'])
+        self.assertEqual([{'book_id': '908'}], content['deleted_books'])
+        self.assertLess(watermark, content['watermark'])
+        # books written shortly before the watermark may still be in flight at the export
+        database.export_to_json_file(json_file, since=watermark)
+        with open(json_file, 'r') as file:
+            self.assertIn({'book_id': '907', 'title': 'Kept Book'}, json.load(file)['books'])
+        database.export_to_json_file(json_file, since=since)
+        database.update_insert_books_tb({'book_id': '908', 'title': 'Deleted Book'})
+        database.update_insert_from_json_file(json_file)
+        self.assertFalse(database.is_book_exist({'book_id': '908'}))
+        self.assertTrue(database.is_book_exist({'book_id': '909'}))
+
+    def test_compressed_export(self):
+        """
+        Test method export_to_json_file and update_insert_from_json_file
+        with gzip/xz compressed newline-delimited JSON and BSON
+        """
+        database.update_insert_books_tb({'book_id': '910', 'title': 'Binary Book', 'rating': 4.5})
+        for file_name in ['library.ndjson.gz', 'library.ndjson.xz', 'library.bson',
+                          'library.bson.gz']:
+            output_file = self.temp_path(file_name)
+            count = database.export_to_json_file(output_file)
+            database.books_tb.delete_one({'book_id': '910'})
+            reports = database.update_insert_from_json_file(output_file)
+            self.assertEqual(count, sum(report['inserted'] + report['updated']
+                                        for report in reports))
+            new_book = database.books_tb.find_one({'book_id': '910'}, OUTPUT_PROJECTION)
+            self.assertEqual({'book_id': '910', 'title': 'Binary Book', 'rating': 4.5}, new_book)
+
+    def test_resume_from_json_file(self):
+        """
+        Test method update_insert_from_json_file in resume mode
+        """
+        ndjson_file = self.temp_path('resume.ndjson')
+        lines = [json.dumps({'book_id': str(book_id), 'title': 'Resumed Book'})
+                 for book_id in range(920, 925)]
+        with open(ndjson_file, 'w') as file:
+            file.write('\n'.join(lines + ['{"book_id": "925", ']))
+        database.update_insert_from_json_file(ndjson_file, 2, resume=True)
+        with open(ndjson_file + '.checkpoint', 'r') as file:
+            checkpoint = json.load(file)
+        self.assertEqual(4, checkpoint['records'])
+        self.assertEqual(4, checkpoint['counts']['inserted'])
+        # books before the checkpoint are not written again
+        database.books_tb.delete_one({'book_id': '920'})
+        database.update_insert_from_json_file(ndjson_file, 2, resume=True)
+        self.assertFalse(database.is_book_exist({'book_id': '920'}))
+        # checkpoint of a changed file is ignored
+        with open(ndjson_file, 'w') as file:
+            file.write('\n'.join(lines))
+        database.update_insert_from_json_file(ndjson_file, 2, resume=True)
+        self.assertTrue(database.is_book_exist({'book_id': '920'}))
+        self.assertTrue(database.is_book_exist({'book_id': '924'}))
+        self.assertFalse(os.path.exists(ndjson_file + '.checkpoint'))
+
+    def test_links(self):
+        """
+        Test links maintained on writes and method find_neighbors
+        """
+        database.bulk_upsert_authors([{'author_id': '911', 'name': 'First Author',
+                                       'related_author_ids': ['912', '913']},
+                                      {'author_id': '912', 'name': 'Second Author'},
+                                      {'author_id': '913', 'name': 'Third Author'}])
+        related_authors = database.find_neighbors('related_author', '911')
+        self.assertEqual(['912', '913'], [author['author_id'] for author in related_authors])
+        database.update_authors_tb_from_json({'author_id': '911', 'related_author_ids': ['913']})
+        self.assertEqual(['913'], database.find_linked_ids('related_author', '911'))
+        self.assertEqual(['911'], database.find_linked_ids('related_author', '913', reverse=True))
+        database.delete_author('911')
+        self.assertEqual([], database.find_linked_ids('related_author', '913', reverse=True))
+
+    def test_rebuild_links(self):
+        """
+        Test method rebuild_links filling author_id of books from author_url
+        as a write seen by incremental exports and write listeners
+        """
+        library = Database(backend=MemoryDatabase())
+        written_tables = []
+        library.add_write_listener(written_tables.append)
+        library.books_tb.insert_many([
+            {'book_id': '931', 'author_url': 'https://www.goodreads.com/author/show/45372.Robert'},
+            {'book_id': '932', 'author_url': 'https://www.goodreads.com/author/show/45373.Robert'}])
+        since = library.current_modified()
+        self.assertEqual(2, library.rebuild_links(chunk_size=1))
+        self.assertEqual(['books_table'], written_tables)
+        self.assertEqual(['45372'], library.find_linked_ids('book_author', '931'))
+        for book in library.books_tb.find({'book_id': {'$in': ['931', '932']}}):
+            self.assertLess(since, book['_modified'])
+
+    def test_failed_write_links(self):
+        """
+        Test links not written for the books/authors whose write failed in a bulk write
+        """
+        library = Database(backend=MemoryDatabase())
+        library.authors_tb.create_index([('name', ASCENDING)], unique=True)
+        reports = library.bulk_upsert_authors([{'author_id': '921', 'name': 'Same Name'},
+                                               {'author_id': '922', 'name': 'Same Name',
+                                                'related_author_ids': ['921']}])
+        self.assertEqual(1, reports[0]['skipped'])
+        self.assertIsNone(library.authors_tb.find_one({'author_id': '922'}))
+        self.assertEqual([], library.find_linked_ids('related_author', '922'))
+
+    def test_text_search(self):
+        """
+        Test method text_search through the full-text index maintained on writes
+        """
+        database.bulk_upsert_books([{'book_id': '921', 'title': 'Zyzzyva Garden'},
+                                    {'book_id': '922', 'title': 'Other Title',
+                                     'similar_books': ['Zyzzyva Garden']}])
+        books = list(database.text_search(BOOKS_TABLE, 'zyzzyva', ranked=True))
+        self.assertEqual(['921', '922'], [book['book_id'] for book in books])
+        self.assertGreater(books[0]['score'], books[1]['score'])
+        database.update_books_tb_attributes({'book_id': '921', 'title': 'Renamed'})
+        database.delete_book('922')
+        self.assertEqual([], list(database.text_search(BOOKS_TABLE, 'zyzzyva')))
+
+    def test_top_rated(self):
+        """
+        Test method top_rated ordering ratings as numbers
+        """
+        database.bulk_upsert_books([{'book_id': '931', 'title': 'Top', 'rating': '10.5'},
+                                    {'book_id': '932', 'title': 'Second', 'rating': '9.5'}])
+        books = database.top_rated(BOOKS_TABLE, 2)
+        self.assertEqual([{'book_id': '931', 'title': 'Top', 'rating': 10.5},
+                          {'book_id': '932', 'title': 'Second', 'rating': 9.5}], books)
+        self.assertEqual(1, len(database.top_rated(BOOKS_TABLE, 1)))
+
+    def test_write_behind_buffer(self):
+        """
+        Test class WriteBehindBuffer coalescing ids and flushing on close
+        """
+        write_buffer = WriteBehindBuffer(database, max_size=10, max_delay=60)
+        write_buffer.add_book({'book_id': '904', 'title': 'First Title'})
+        write_buffer.add_book({'book_id': '904', 'title': 'Second Title', 'ISBN': ''})
+        self.assertEqual(1, len(write_buffer))
+        write_buffer.close()
+        self.assertEqual(0, len(write_buffer))
+        new_book = database.books_tb.find_one({'book_id': '904'}, OUTPUT_PROJECTION)
+        self.assertEqual({'book_id': '904', 'title': 'Second Title'}, new_book)
+
+    def test_migrate_numeric_fields(self):
+        """
+        Test method migrate_numeric_fields and coercion on write
+        """
+        database.update_insert_books_tb({'book_id': '905', 'rating': '4.25',
+                                         'rating_count': '12'})
+        new_book = database.books_tb.find_one({'book_id': '905'})
+        self.assertEqual(4.25, new_book['rating'])
+        self.assertEqual(12, new_book['rating_count'])
+        database.books_tb.insert_one({'book_id': '906', 'rating': '3.5', 'review_count': 'x'})
+        self.assertLessEqual(1, database.migrate_numeric_fields())
+        new_book = database.books_tb.find_one({'book_id': '906'})
+        self.assertEqual(3.5, new_book['rating'])
+        self.assertNotIn('review_count', new_book)
+
 
 if __name__ == '__main__':
     database = Database()
+    database.ensure_indexes()
     database.authors_tb.delete_many({})
     database.books_tb.delete_many({})
     BOOK_DIC = {'book_url': 'https://www.goodreads.com/book/show/3735293-clean-code',
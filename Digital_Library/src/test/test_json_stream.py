@@ -0,0 +1,96 @@
+"""
+This module is test for json_stream
+"""
+import gzip
+import io
+import json
+import os
+import tempfile
+import unittest
+
+import bson
+
+from src.json_stream import StreamParser
+from src.json_stream import iter_library_records
+from src.json_stream import iter_ndjson_records
+from src.json_stream import iter_bson_records
+from src.json_stream import open_library_file
+
+
+class TestJsonStream(unittest.TestCase):
+    """
+    Test class for json_stream
+    """
+
+    def test_decode_value(self):
+        """
+        Test method decode_value with values split across blocks
+        """
+        parser = StreamParser(io.StringIO('[123456, "a]b", {"c": 1.5e3}]'), read_size=2)
+        parser.expect('[')
+        self.assertEqual(123456, parser.decode_value())
+        parser.expect(',')
+        self.assertEqual('a]b', parser.decode_value())
+        parser.expect(',')
+        self.assertEqual({'c': 1.5e3}, parser.decode_value())
+        parser.expect(']')
+        content = '[{"a": x}, ' + '{"b": 1}, ' * 1000 + '{}]'
+        parser = StreamParser(io.StringIO(content), read_size=4, max_record_size=64)
+        parser.expect('[')
+        with self.assertRaisesRegex(ValueError, 'offset 1 '):
+            parser.decode_value()
+        # the malformed value is not searched for its end through the rest of the file
+        self.assertLess(len(parser.buffer), 2 * 64)
+
+    def test_iter_library_records(self):
+        """
+        Test method iter_library_records
+        """
+        content = {'version': [1, 2], 'books': [{'book_id': '1'}, {'book_id': '2'}],
+                   'authors': [{'author_id': '3'}]}
+        records = list(iter_library_records(io.StringIO(json.dumps(content, indent=4))))
+        self.assertEqual([('books', {'book_id': '1'}), ('books', {'book_id': '2'}),
+                          ('authors', {'author_id': '3'})], records)
+        with self.assertRaises(ValueError):
+            list(iter_library_records(io.StringIO('[{"book_id": "1"}]')))
+        with self.assertRaises(ValueError):
+            list(iter_library_records(io.StringIO('{"books": [{"book_id": "1"} {}]}')))
+
+    def test_iter_ndjson_records(self):
+        """
+        Test method iter_ndjson_records
+        """
+        lines = '{"type": "author", "name": "A"}\n\n{"book_id": "1"}\n{"title": "T"}\n'
+        records = list(iter_ndjson_records(io.StringIO(lines)))
+        self.assertEqual([('authors', {'name': 'A'}), ('books', {'book_id': '1'}),
+                          (None, {'title': 'T'})], records)
+
+
+    def test_iter_bson_records(self):
+        """
+        Test method iter_bson_records
+        """
+        content = bson.encode({'type': 'book', 'book_id': '1'}) + bson.encode({'author_id': '2'})
+        records = list(iter_bson_records(io.BytesIO(content)))
+        self.assertEqual([('books', {'book_id': '1'}), ('authors', {'author_id': '2'})], records)
+        with self.assertRaises(ValueError):
+            list(iter_bson_records(io.BytesIO(content[:-3])))
+
+    def test_open_library_file(self):
+        """
+        Test method open_library_file compressing by extension and detecting magic bytes
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'library.ndjson.gz')
+            with open_library_file(path, 'wt') as file:
+                file.write('{"book_id": "1"}\n')
+            with gzip.open(path, 'rt') as file:
+                self.assertEqual('{"book_id": "1"}\n', file.read())
+            renamed_path = os.path.join(directory, 'library.ndjson')
+            os.rename(path, renamed_path)
+            with open_library_file(renamed_path, 'rt') as file:
+                self.assertEqual([('books', {'book_id': '1'})], list(iter_ndjson_records(file)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,157 @@
+"""
+This module is test for memory_backend
+"""
+import os
+import tempfile
+import unittest
+
+from pymongo import DESCENDING, TEXT
+from pymongo.errors import DuplicateKeyError, BulkWriteError, OperationFailure
+
+from src.memory_backend import MemoryDatabase, UpdateOne
+
+
+class TestMemoryBackend(unittest.TestCase):
+    """
+    Test class for memory_backend
+    """
+
+    def setUp(self):
+        """
+        Create books table with unique index on book_id
+        """
+        self.database = MemoryDatabase()
+        self.books_tb = self.database['books_table']
+        self.books_tb.create_index('book_id', unique=True)
+        self.books_tb.insert_many([
+            {'book_id': '1', 'title': 'Clean Code', 'rating': '4.4', 'similar_books': ['A']},
+            {'book_id': '2', 'title': 'The Clean Coder', 'rating': '4.2'},
+            {'book_id': '3', 'title': 'Refactoring', 'rating': '4.5', 'ISBN': '33'}])
+
+    def test_find_query_shapes(self):
+        """
+        Test method find with filters generated by query.query
+        """
+        def book_ids(my_filter):
+            return [doc['book_id'] for doc in self.books_tb.find(my_filter, {'_id': 0})]
+
+        self.assertEqual(['1', '2'], book_ids({'title': {'$regex': '.*Clean.*'}}))
+        self.assertEqual(['3'], book_ids({'book_id': '3'}))
+        self.assertEqual(['2', '3'], book_ids({'book_id': {'$ne': '1'}}))
+        self.assertEqual(['1'], book_ids({'similar_books': {'$regex': '.*A.*'}}))
+        self.assertEqual(['3'], book_ids({'$and': [{'title': {'$regex': '.*Re.*'}},
+                                                   {'ISBN': {'$regex': '.*3.*'}}]}))
+        self.assertEqual(['1', '3'], book_ids({'$or': [{'book_id': '1'}, {'ISBN': '33'}]}))
+        self.assertEqual(['3'], book_ids({'$expr': {'$gt': [{'$toDouble': '$rating'}, 4.4]}}))
+
+    def test_cursor(self):
+        """
+        Test projection, sort, skip, limit and count of cursor
+        """
+        cursor = self.books_tb.find({}, {'_id': 0, 'book_id': 1}).sort('rating', DESCENDING)
+        self.assertEqual([{'book_id': '3'}, {'book_id': '1'}], list(cursor.limit(2)))
+        self.assertEqual(3, self.books_tb.find({}).skip(1).limit(1).count())
+        plan = self.books_tb.find({'book_id': '2'}).explain()
+        winning_plan = plan['queryPlanner']['winningPlan']
+        self.assertEqual('book_id_1', winning_plan['inputStage']['indexName'])
+        self.assertEqual(1, plan['executionStats']['totalDocsExamined'])
+
+    def test_write(self):
+        """
+        Test insert, update, upsert and delete with unique index
+        """
+        with self.assertRaises(DuplicateKeyError):
+            self.books_tb.insert_one({'book_id': '1'})
+        self.books_tb.update_one({'book_id': '1'},
+                                 {'$set': {'title': 'New'}, '$unset': {'rating': ''}})
+        self.assertEqual({'book_id': '1', 'title': 'New', 'similar_books': ['A']},
+                         self.books_tb.find_one({'book_id': '1'}, {'_id': 0}))
+        result = self.books_tb.replace_one({'book_id': '4'}, {'book_id': '4'}, upsert=True)
+        self.assertIsNotNone(result.upserted_id)
+        result = self.books_tb.delete_many({'book_id': {'$in': ['2', '4']}})
+        self.assertEqual(2, result.deleted_count)
+        self.assertEqual(2, self.books_tb.count_documents({}))
+
+    def test_bulk_write(self):
+        """
+        Test method bulk_write with upserts and duplicate keys
+        """
+        result = self.books_tb.bulk_write([UpdateOne({'book_id': '1'}, {'$set': {'ISBN': '1'}}),
+                                           UpdateOne({'book_id': '5'}, {'$set': {'ISBN': '5'}},
+                                                     upsert=True)], ordered=False)
+        self.assertEqual(1, result.bulk_api_result['nMatched'])
+        self.assertEqual(1, result.bulk_api_result['nUpserted'])
+        with self.assertRaises(BulkWriteError) as context:
+            self.books_tb.bulk_write([UpdateOne({'book_id': '5'}, {'$set': {'book_id': '1'}})])
+        self.assertEqual(1, len(context.exception.details['writeErrors']))
+
+    def test_text_index(self):
+        """
+        Test $text queries resolved through the text index, which is kept up to date on writes
+        """
+        def book_ids(search):
+            return [doc['book_id'] for doc in self.books_tb.find({'$text': {'$search': search}})]
+
+        with self.assertRaises(OperationFailure):
+            book_ids('clean')
+        self.books_tb.create_index([('title', TEXT), ('similar_books', TEXT)],
+                                   weights={'title': 10})
+        self.assertEqual(['1', '2'], book_ids('CLEAN'))
+        self.assertEqual(['2'], book_ids('clean -code'))
+        self.assertEqual(['2'], book_ids('"clean coder"'))
+        self.books_tb.update_one({'book_id': '3'}, {'$set': {'title': 'Clean Architecture'}})
+        self.books_tb.delete_one({'book_id': '2'})
+        score = {'$meta': 'textScore'}
+        cursor = self.books_tb.find({'$text': {'$search': 'clean a'}}, {'_id': 0, 'score': score})
+        self.assertEqual([('1', 11.0), ('3', 10.0)],
+                         [(doc['book_id'], doc['score']) for doc in cursor.sort([('score', score)])])
+
+    def test_aggregate(self):
+        """
+        Test method aggregate looking up documents of another collection
+        """
+        authors_tb = self.database['authors_table']
+        authors_tb.create_index('author_id', unique=True)
+        authors_tb.insert_one({'author_id': '9', 'name': 'Uncle Bob'})
+        self.books_tb.update_many({'book_id': {'$in': ['1', '2']}}, {'$set': {'author_id': '9'}})
+        pipeline = [{'$match': {'title': {'$regex': 'Clean|Refactoring'}}},
+                    {'$sort': {'book_id': DESCENDING}},
+                    {'$lookup': {'from': 'authors_table', 'localField': 'author_id',
+                                 'foreignField': 'author_id', 'as': '_author'}},
+                    {'$unwind': {'path': '$_author', 'preserveNullAndEmptyArrays': True}},
+                    {'$match': {'$nor': [{'_author.name': 'Nobody'}]}},
+                    {'$limit': 2},
+                    {'$project': {'_id': 0, 'book_id': 1, '_author': 1}}]
+        self.assertEqual([('3', None), ('2', 'Uncle Bob')],
+                         [(doc['book_id'], doc.get('_author', {}).get('name'))
+                          for doc in self.books_tb.aggregate(pipeline)])
+        self.assertEqual({'author_id': '9', 'name': 'Uncle Bob'},
+                         authors_tb.find_one({}, {'_id': 0}))
+        with self.assertRaises(OperationFailure):
+            self.books_tb.aggregate([{'$group': {'_id': '$title'}}])
+
+    def test_sqlite_persistence(self):
+        """
+        Test documents and indexes are loaded again from SQLite file
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'library.db')
+            books_tb = MemoryDatabase(path)['books_table']
+            books_tb.create_index('book_id', unique=True)
+            books_tb.create_index([('title', TEXT)], weights={'title': 10})
+            books_tb.insert_one({'book_id': '1', 'title': 'Clean Code'})
+            books_tb.insert_one({'book_id': '2', 'title': 'Refactoring'})
+            books_tb.update_one({'book_id': '1'}, {'$set': {'rating': 4.4}})
+            books_tb.delete_one({'book_id': '2'})
+            books_tb = MemoryDatabase(path)['books_table']
+            self.assertEqual([{'book_id': '1', 'title': 'Clean Code', 'rating': 4.4}],
+                             list(books_tb.find({}, {'_id': 0})))
+            with self.assertRaises(DuplicateKeyError):
+                books_tb.insert_one({'book_id': '1'})
+            cursor = books_tb.find({'$text': {'$search': 'clean'}},
+                                   {'_id': 0, 'score': {'$meta': 'textScore'}})
+            self.assertEqual([10.0], [doc['score'] for doc in cursor])
+
+
+if __name__ == '__main__':
+    unittest.main()
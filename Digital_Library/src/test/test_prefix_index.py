@@ -0,0 +1,53 @@
+"""
+This module is test for prefix_index
+"""
+import unittest
+
+from src.database import Database, BOOKS_TABLE, AUTHORS_TABLE
+from src.memory_backend import MemoryDatabase
+from src.prefix_index import PrefixIndex, prefix_keys
+
+
+class TestPrefixIndex(unittest.TestCase):
+    """
+    Test class for prefix_index
+    """
+
+    def test_prefix_keys(self):
+        """
+        Test method prefix_keys
+        """
+        self.assertEqual({'clean code', 'code'}, prefix_keys(' Clean  Code'))
+        self.assertEqual(frozenset(), prefix_keys('-'))
+
+    def test_search(self):
+        """
+        Test class PrefixIndex completing prefixes and refreshing on writes
+        """
+        database = Database(backend=MemoryDatabase())
+        prefix_index = PrefixIndex(database)
+        database.bulk_upsert_books([{'book_id': '1', 'title': 'Clean Code', 'rating_count': '10'},
+                                    {'book_id': '2', 'title': 'The Clean Coder',
+                                     'rating_count': '30'},
+                                    {'book_id': '3', 'title': 'Code Complete'}])
+        database.bulk_upsert_authors([{'author_id': '1', 'name': 'Robert C. Martin'}])
+
+        def book_ids(prefix, limit=10):
+            return [book['book_id'] for book in prefix_index.search(BOOKS_TABLE, prefix, limit)]
+
+        self.assertEqual(['2', '1'], book_ids('CLEAN  c'))
+        self.assertEqual(['2', '1', '3'], book_ids('co'))
+        self.assertEqual(['2'], book_ids('co', 1))
+        self.assertEqual(['2'], book_ids('clean coder'))
+        self.assertEqual([], book_ids('code clean'))
+        self.assertEqual({'author_id': '1', 'name': 'Robert C. Martin', 'rating_count': 0},
+                         prefix_index.search(AUTHORS_TABLE, 'mar')[0])
+        database.bulk_upsert_books([{'book_id': '1', 'title': 'Clean Code', 'rating_count': '50'},
+                                    {'book_id': '3', 'title': 'Refactoring'}])
+        database.delete_book('2')
+        self.assertEqual(['1'], book_ids('co'))
+        self.assertEqual(['3'], book_ids('ref'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+"""
+This module is test for query
+"""
+import unittest
+
+from src.database import AUTHORS_TABLE
+from src.query import compile_query, find_index_name, PlanCache, BOOK_QUERY, AUTHOR_QUERY, MALFORMED_QUERY_STRING, \
+    OBJECT_NOT_EXIST, FIELD_NOT_EXIST, VALUE_TYPE_ERROR
+
+
+class TestQuery(unittest.TestCase):
+    """
+    Test class for query
+    """
+
+    def test_compile_single_query(self):
+        """
+        Test method compile_query with a single term
+        """
+        self.assertEqual((BOOK_QUERY, {'title': {'$regex': r'PRIDE\ AND\ PREJUDICE'}}),
+                         compile_query('book.title:PRIDE AND PREJUDICE'))
+        self.assertEqual((BOOK_QUERY, {'title': {'$regex': r'C\+\+'}}),
+                         compile_query('book.title:C++'))
+        self.assertEqual((BOOK_QUERY, {'ISBN': {'$regex': r'12\.3'}}),
+                         compile_query('book.ISBN:12.3'))
+        self.assertEqual((AUTHOR_QUERY, {'rating': {'$gt': 4.4}}),
+                         compile_query('author.rating: > 4.4'))
+        self.assertEqual((BOOK_QUERY, {'rating': 4.0}), compile_query('book.rating:4'))
+        self.assertEqual((BOOK_QUERY, {'rating_count': {'$exists': True}}),
+                         compile_query('book.rating_count:'))
+        self.assertEqual((BOOK_QUERY, {'rating': {'$exists': False}}),
+                         compile_query('book.rating: NOT'))
+        self.assertEqual(VALUE_TYPE_ERROR, compile_query('book.rating_count:\u00bd'))
+        self.assertEqual(VALUE_TYPE_ERROR, compile_query('book.book_id:NOT \u00b2'))
+        self.assertEqual(MALFORMED_QUERY_STRING, compile_query('book_id in book:1024'))
+        self.assertEqual(OBJECT_NOT_EXIST, compile_query('dog.book_id:256'))
+
+    def test_compile_nested_query(self):
+        """
+        Test method compile_query with nested logical operators and parentheses
+        """
+        self.assertEqual((BOOK_QUERY, {'$and': [{'book_id': {'$ne': '4096'}},
+                                                {'book_id': {'$ne': '5096'}}]}),
+                         compile_query('book.book_id:NOT 4096ANDbook.book_id:NOT 5096'))
+        query_string = '(book.title:Dune (Dune #1) OR book.title:"a) b") AND NOT book.rating:<3'
+        condition = {'$or': [{'title': {'$regex': r'Dune\ \(Dune\ \#1\)'}}, {'title': 'a) b'}]}
+        self.assertEqual((BOOK_QUERY, {'$and': [condition, {'$nor': [{'rating': {'$lt': 3.0}}]}]}),
+                         compile_query(query_string))
+        self.assertEqual((BOOK_QUERY, {'$or': [{'ISBN': '1'},
+                                               {'$and': [{'ISBN': '2'}, {'ISBN': '3'}]}]}),
+                         compile_query('book.ISBN:"1" OR book.ISBN:"2" AND book.ISBN:"3"'))
+        self.assertEqual(MALFORMED_QUERY_STRING, compile_query('(book.title:a'))
+        self.assertEqual(MALFORMED_QUERY_STRING, compile_query('NOT ()'))
+        self.assertEqual(OBJECT_NOT_EXIST, compile_query('book.title:a OR author.name:b'))
+        self.assertEqual(FIELD_NOT_EXIST, compile_query('book.title:a AND (book.nope:b)'))
+
+    def test_compile_join_query(self):
+        """
+        Test method compile_query with fields of the joined author of books
+        """
+        lookup = [{'$lookup': {'from': AUTHORS_TABLE, 'localField': 'author_id',
+                               'foreignField': 'author_id', 'as': '_author'}},
+                  {'$unwind': {'path': '$_author', 'preserveNullAndEmptyArrays': True}}]
+        self.assertEqual((BOOK_QUERY, [{'$match': {'rating': {'$gt': 4.0}}}] + lookup
+                          + [{'$match': {'_author.rating': {'$gt': 4.2}}}]),
+                         compile_query('book.rating:>4 AND book.author . rating:>4.2'))
+        self.assertEqual((BOOK_QUERY, lookup + [{'$match': {'$or': [
+            {'title': {'$regex': 'code'}}, {'_author.name': {'$ne': 'Bob'}}]}}]),
+                         compile_query('book.title:code OR book.author.name:NOT "Bob"'))
+        self.assertEqual((BOOK_QUERY, {'author': {'$regex': 'Tolkien'}}),
+                         compile_query('book.author:Tolkien'))
+        self.assertEqual(FIELD_NOT_EXIST, compile_query('book.author.title:code'))
+        self.assertEqual(FIELD_NOT_EXIST, compile_query('author.book.rating:>4'))
+        self.assertEqual(VALUE_TYPE_ERROR, compile_query('book.author.rating:>high'))
+
+    def test_plan_cache(self):
+        """
+        Test class PlanCache counting hits and evicting the least recently used query string
+        """
+        cache = PlanCache(max_size=2)
+        plan = cache.get('book.title:code')
+        self.assertEqual(compile_query('book.title:code'), plan)
+        self.assertIs(plan, cache.get('  book.title:code '))
+        self.assertEqual(OBJECT_NOT_EXIST, cache.get('dog.book_id:256'))
+        self.assertEqual(OBJECT_NOT_EXIST, cache.get('dog.book_id:256'))
+        cache.get('book.title:code')
+        cache.get('book.ISBN:1')
+        self.assertEqual({'size': 2, 'max_size': 2, 'hits': 3, 'misses': 3}, cache.stats())
+        cache.get('dog.book_id:256')
+        self.assertEqual(4, cache.stats()['misses'])
+        self.assertEqual(MALFORMED_QUERY_STRING, cache.get(None))
+
+    def test_find_index_name(self):
+        """
+        Test method find_index_name with winning plans of explain output
+        """
+        self.assertEqual(None, find_index_name({'stage': 'COLLSCAN'}))
+        self.assertEqual('rating_1', find_index_name(
+            {'stage': 'FETCH', 'inputStage': {'stage': 'IXSCAN', 'indexName': 'rating_1'}}))
+        self.assertEqual('title_1', find_index_name(
+            {'stage': 'SUBPLAN', 'inputStage': {'stage': 'OR', 'inputStages': [
+                {'stage': 'COLLSCAN'}, {'stage': 'IXSCAN', 'indexName': 'title_1'}]}}))
+
+
+if __name__ == '__main__':
+    unittest.main()
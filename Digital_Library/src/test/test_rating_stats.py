@@ -0,0 +1,53 @@
+"""
+This module is test for rating_stats
+"""
+import unittest
+
+from src.database import Database, BOOKS_TABLE, AUTHORS_TABLE
+from src.memory_backend import MemoryDatabase
+from src.rating_stats import RatingStats, compute_stats, percentile
+
+
+class TestRatingStats(unittest.TestCase):
+    """
+    Test class for rating_stats
+    """
+
+    def test_compute_stats(self):
+        """
+        Test method compute_stats with a sorted list of values
+        """
+        stats = compute_stats([1.0, 2.0, 2.5, 4.5], 1)
+        self.assertEqual(4, stats['count'])
+        self.assertEqual(2.5, stats['mean'])
+        self.assertEqual((1.0, 4.5), (stats['min'], stats['max']))
+        self.assertEqual(2.25, stats['percentiles']['p50'])
+        self.assertEqual([{'start': 1, 'end': 2, 'count': 1}, {'start': 2, 'end': 3, 'count': 2},
+                          {'start': 4, 'end': 5, 'count': 1}], stats['histogram'])
+        self.assertEqual(None, compute_stats([], 1)['mean'])
+        with self.assertRaises(ValueError):
+            compute_stats([1.0, 2.0], 1e-310)
+        self.assertEqual(4.0, percentile([1.0, 2.0, 4.0], 100))
+
+    def test_refresh(self):
+        """
+        Test class RatingStats refreshing its columns with written and deleted books
+        """
+        database = Database(backend=MemoryDatabase())
+        rating_stats = RatingStats(database)
+        database.bulk_upsert_books([{'book_id': '1', 'rating': '4.0', 'rating_count': '10'},
+                                    {'book_id': '2', 'rating': '3.0'}])
+        self.assertEqual(3.5, rating_stats.stats(BOOKS_TABLE)['mean'])
+        database.bulk_upsert_books([{'book_id': '2', 'rating': '5.0'},
+                                    {'book_id': '3', 'rating': '3.0'}])
+        database.delete_book('1')
+        stats = rating_stats.stats(BOOKS_TABLE)
+        self.assertEqual((2, 4.0), (stats['count'], stats['mean']))
+        self.assertEqual(0, rating_stats.stats(BOOKS_TABLE, 'rating_count')['count'])
+        self.assertEqual(0, rating_stats.stats(AUTHORS_TABLE)['count'])
+        database.insert_books_tb({'book_id': '1', 'rating': 1.0})
+        self.assertEqual(3, rating_stats.stats(BOOKS_TABLE)['count'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+"""
+This module is test for result_cache
+"""
+import time
+import unittest
+
+from src.result_cache import ResultCache
+
+
+class TestResultCache(unittest.TestCase):
+    """
+    Test class for result_cache
+    """
+
+    def test_get_put(self):
+        """
+        Test methods get and put evicting the least recently used response
+        """
+        cache = ResultCache(max_entries=2, max_bytes=10)
+        self.assertEqual(None, cache.get('a'))
+        self.assertTrue(cache.put('a', {'books': 0}, 'aaa', 3))
+        self.assertTrue(cache.put('b', {'books': 0}, 'bbb', 3))
+        self.assertEqual('aaa', cache.get('a'))
+        self.assertTrue(cache.put('c', {'authors': 0}, 'ccc', 3))
+        self.assertEqual(None, cache.get('b'))
+        self.assertFalse(cache.put('d', {'books': 0}, 'd' * 11, 11))
+        self.assertTrue(cache.put('e', {'books': 0}, 'eeeee', 5))
+        self.assertEqual(None, cache.get('a'))
+        self.assertEqual({'size': 2, 'max_size': 2, 'bytes': 8, 'max_bytes': 10,
+                          'hits': 1, 'misses': 3}, cache.stats())
+
+    def test_invalidate(self):
+        """
+        Test method invalidate dropping the responses of the written table
+        """
+        cache = ResultCache()
+        generation = cache.generation(['books'])
+        cache.put('a', generation, 'aaa', 3)
+        cache.put('b', cache.generation(['authors']), 'bbb', 3)
+        cache.put('c', cache.generation(['books', 'authors']), 'ccc', 3)
+        cache.invalidate('books')
+        self.assertEqual(None, cache.get('a'))
+        self.assertEqual('bbb', cache.get('b'))
+        self.assertEqual(None, cache.get('c'))
+        # a response read before the write is not cached
+        self.assertFalse(cache.put('a', generation, 'aaa', 3))
+        self.assertTrue(cache.put('a', cache.generation(['books']), 'aaa', 3))
+
+    def test_ttl(self):
+        """
+        Test that expired responses are not returned
+        """
+        cache = ResultCache(ttl=0.01)
+        cache.put('a', {'books': 0}, 'aaa', 3)
+        time.sleep(0.02)
+        self.assertEqual(None, cache.get('a'))
+        self.assertEqual(0, len(cache))
+
+
+if __name__ == '__main__':
+    unittest.main()
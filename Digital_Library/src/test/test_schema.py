@@ -0,0 +1,50 @@
+"""
+This module is test for schema
+"""
+import unittest
+
+from src.schema import BOOK_SCHEMA, AUTHOR_SCHEMA, to_number
+
+
+class TestSchema(unittest.TestCase):
+    """
+    Test class for schema
+    """
+
+    def test_to_number(self):
+        """
+        Test method to_number
+        """
+        self.assertEqual(4.4, to_number('4.4', float))
+        self.assertEqual(12, to_number('12.0', int))
+        self.assertEqual(None, to_number('x', int))
+        self.assertEqual(None, to_number(True, int))
+
+    def test_validate(self):
+        """
+        Test method validate normalizing a book
+        """
+        report = BOOK_SCHEMA.validate({'book_id': '1', 'title': 'Clean Code', 'ISBN': '',
+                                       'rating': '4.4', 'rating_count': 12, 'pages': '464',
+                                       'similar_book_ids': ['2']})
+        self.assertEqual({'book_id': '1', 'title': 'Clean Code', 'rating': 4.4,
+                          'rating_count': 12, 'similar_book_ids': ['2']}, report['document'])
+        self.assertEqual([], report['errors'])
+        self.assertEqual(['pages'], report['ignored'])
+        report = AUTHOR_SCHEMA.validate({'author_id': '3', 'rating': 'letter', 'name': 5})
+        self.assertEqual({'author_id': '3'}, report['document'])
+        self.assertEqual(2, len(report['errors']))
+
+    def test_validate_batch(self):
+        """
+        Test method validate_batch with documents which cannot be written
+        """
+        reports = BOOK_SCHEMA.validate_batch([{'book_id': '1'}, {'title': 'No id'},
+                                              {'book_id': 'abc'}, ['not a dict']])
+        self.assertEqual([{'book_id': '1'}, None, None, None],
+                         [report['document'] for report in reports])
+        self.assertEqual(['Book has no id'], reports[1]['errors'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+"""
+This module is test for trigram_index
+"""
+import unittest
+
+from src.database import Database, BOOKS_TABLE, AUTHORS_TABLE
+from src.memory_backend import MemoryDatabase
+from src.trigram_index import TrigramIndex, trigrams
+
+
+class TestTrigramIndex(unittest.TestCase):
+    """
+    Test class for trigram_index
+    """
+
+    def test_trigrams(self):
+        """
+        Test method trigrams
+        """
+        self.assertEqual({'  c', ' co', 'cod', 'ode', 'de '}, trigrams('Code'))
+        self.assertEqual({'  a', ' a '}, trigrams('a!'))
+        self.assertEqual(set(), trigrams(' - '))
+
+    def test_search(self):
+        """
+        Test class TrigramIndex finding misspelled titles/names and refreshing on writes
+        """
+        database = Database(backend=MemoryDatabase())
+        trigram_index = TrigramIndex(database)
+        database.bulk_upsert_books([{'book_id': '1', 'title': 'Refactoring'},
+                                    {'book_id': '2', 'title': 'Refactoring Databases'},
+                                    {'book_id': '3', 'title': 'Clean Code'}])
+        database.bulk_upsert_authors([{'author_id': '1', 'name': 'Robert C. Martin'}])
+        self.assertEqual(['1', '2'], [doc_id for doc_id, _ in
+                                      trigram_index.search(BOOKS_TABLE, 'Refactorng')])
+        self.assertEqual(['1'], [doc_id for doc_id, _ in
+                                 trigram_index.search(BOOKS_TABLE, 'refactorng', 1)])
+        self.assertEqual([], trigram_index.search(BOOKS_TABLE, 'Design Patterns'))
+        authors = trigram_index.find(AUTHORS_TABLE, 'Robert Martn')
+        self.assertEqual('Robert C. Martin', authors[0]['name'])
+        self.assertTrue(0.5 <= authors[0]['score'] < 1)
+        database.delete_book('1')
+        database.bulk_upsert_books([{'book_id': '3', 'title': 'Refactoring to Patterns'}])
+        self.assertEqual(['2', '3'], sorted(doc_id for doc_id, _ in
+                                            trigram_index.search(BOOKS_TABLE, 'Refactorng')))
+        self.assertEqual([], trigram_index.search(BOOKS_TABLE, 'Clean Code'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+"""
+This module finds books/authors whose title/name is close to a search with typos,
+e.g. 'Refactorng' or 'Robert Martn', through an in-memory trigram index.
+Titles and names are split into trigrams (three letter pieces of each word), and the
+index maps every trigram to the books/authors having it, so only the books/authors sharing
+trigrams with the search are compared instead of scanning the table.
+The index mirrors the tables and is refreshed incrementally on writes.
+"""
+import heapq
+import re
+from collections import Counter
+
+from src.database import BOOKS_TABLE, AUTHORS_TABLE, UNIQUE_INDEXES, OUTPUT_PROJECTION
+from src.table_mirror import TableMirror
+
+FUZZY_FIELDS = {BOOKS_TABLE: 'title', AUTHORS_TABLE: 'name'}
+DEFAULT_FUZZY_LIMIT = 10
+# fraction of the trigrams of the search a title/name needs to be a match
+MIN_SIMILARITY = 0.5
+WORD_RE = re.compile(r'\w+')
+
+
+def trigrams(text):
+    """
+    Return the set of trigrams of the words of text, ignoring case.
+    Words are padded with two spaces in front and one behind, so the start of
+    words weighs more and words shorter than three letters have trigrams.
+    """
+    result = set()
+    for word in WORD_RE.findall(text.lower()):
+        padded = f'  {word} '
+        result.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return result
+
+
+class TrigramIndex(TableMirror):
+    """
+    Trigram index over titles of books and names of authors
+    """
+
+    def __init__(self, database):
+        """
+        Initialize the index of the database, tables are indexed on first search
+
+        Parameters:
+        database (Database): database of books/authors
+        """
+        super().__init__(database, {table_name: [field]
+                                    for table_name, field in FUZZY_FIELDS.items()})
+        # id: trigrams of the title/name
+        self.documents = {table_name: {} for table_name in FUZZY_FIELDS}
+        # trigram: ids of books/authors having it
+        self.postings = {table_name: {} for table_name in FUZZY_FIELDS}
+
+    def set_document(self, table_name, doc_id, doc):
+        """
+        Index the title/name of the book/author
+        """
+        self.remove_document(table_name, doc_id)
+        text = doc.get(FUZZY_FIELDS[table_name])
+        doc_trigrams = trigrams(text) if isinstance(text, str) else None
+        if not doc_trigrams:
+            return
+        self.documents[table_name][doc_id] = doc_trigrams
+        postings = self.postings[table_name]
+        for trigram in doc_trigrams:
+            postings.setdefault(trigram, set()).add(doc_id)
+
+    def remove_document(self, table_name, doc_id):
+        """
+        Remove the book/author from the index
+        """
+        doc_trigrams = self.documents[table_name].pop(doc_id, None)
+        if doc_trigrams is None:
+            return
+        postings = self.postings[table_name]
+        for trigram in doc_trigrams:
+            postings[trigram].discard(doc_id)
+            if not postings[trigram]:
+                del postings[trigram]
+
+    def search(self, table_name, search, limit=DEFAULT_FUZZY_LIMIT,
+               min_similarity=MIN_SIMILARITY):
+        """
+        Return (id, similarity) of at most limit books/authors whose title/name is the
+        closest to search, the most similar first.
+        Similarity is the fraction of trigrams of the search found in the title/name.
+        Ties are ranked by the trigrams shared over all trigrams of both,
+        so shorter titles/names matching as well come first.
+
+        Parameters:
+        table_name (str): BOOKS_TABLE or AUTHORS_TABLE
+        search (str): title/name to search, possibly misspelled
+        limit (int): maximum number of results
+        min_similarity (float): similarity from 0 to 1 a result needs
+        """
+        search_trigrams = trigrams(search)
+        if not search_trigrams:
+            return []
+        with self.lock:
+            self.refresh(table_name)
+            postings = self.postings[table_name]
+            shared_counts = Counter()
+            for trigram in search_trigrams:
+                shared_counts.update(postings.get(trigram, ()))
+            documents = self.documents[table_name]
+            ranked = []
+            for doc_id, shared_count in shared_counts.items():
+                similarity = shared_count / len(search_trigrams)
+                if similarity >= min_similarity:
+                    overlap = shared_count / (len(search_trigrams) + len(documents[doc_id])
+                                              - shared_count)
+                    ranked.append((similarity, overlap, doc_id))
+        return [(doc_id, similarity)
+                for similarity, _, doc_id in heapq.nlargest(limit, ranked)]
+
+    def find(self, table_name, search, limit=DEFAULT_FUZZY_LIMIT):
+        """
+        Return the books/authors found by search, read from the table by id,
+        with their similarity as 'score'
+        """
+        matches = self.search(table_name, search, limit)
+        id_key = UNIQUE_INDEXES[table_name]
+        docs = {doc[id_key]: doc for doc in self.database.get_table(table_name).find(
+            {id_key: {'$in': [doc_id for doc_id, _ in matches]}}, OUTPUT_PROJECTION)}
+        return [dict(docs[doc_id], score=round(similarity, 4))
+                for doc_id, similarity in matches if doc_id in docs]
+
+    def clear(self):
+        """
+        Drop the index, it is built again on next search
+        """
+        with self.lock:
+            super().clear()
+            self.documents = {table_name: {} for table_name in FUZZY_FIELDS}
+            self.postings = {table_name: {} for table_name in FUZZY_FIELDS}